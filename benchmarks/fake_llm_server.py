@@ -0,0 +1,170 @@
+"""
+A local stand-in for the OpenAI chat completions API, for benchmarking the fleet without real LLM calls.
+Point OpenAIClient at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4
+CONTEXT_MARKER = "\n\nContext:\n" # How OpenAIClient appends the repository context to the prompt
+
+
+def rewrite_files(current_files: dict) -> dict:
+    """The canned 'fix': a Java 8 to 11 upgrade, close enough to the real prompt for the build and diff to be realistic."""
+    return {
+        "updated_files": [
+            {"file_path": path, "updated_content": content.replace("1.8", "11").replace("java-1.8.0-openjdk", "java-11-openjdk")}
+            for path, content in current_files.items()
+        ]
+    }
+
+
+def build_response(messages: list) -> dict:
+    """Answers from the Context JSON that OpenAIClient puts in the user message, continuation or not."""
+    user_prompt = next((m["content"] for m in messages if m["role"] == "user"), "")
+    _, _, context_json = user_prompt.partition(CONTEXT_MARKER)
+    try:
+        current_files = json.loads(context_json).get("current_files", {})
+    except json.JSONDecodeError:
+        current_files = {}
+    return rewrite_files(current_files)
+
+
+class FakeLLMServer:
+    """
+    Serves POST /v1/chat/completions, streaming or not, with configurable latency before the first
+    token, output speed in tokens/sec, and a rate of 429/500 errors (429s carry Retry-After: 0).
+    """
+
+    def __init__(self, latency_seconds: float = 0.5, tokens_per_second: float = 500.0, error_rate: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0, seed: int | None = None):
+        self.latency_seconds = latency_seconds
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.completion_tokens = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-llm-server", daemon=True)
+        self._thread.start()
+        logging.info(f"Fake LLM server listening on {self.base_url}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+    def _count(self, completion_tokens: int):
+        with self._lock:
+            self.completion_tokens += completion_tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors, "completion_tokens": self.completion_tokens}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                logging.debug(f"fake LLM server: {format % args}")
+
+            def _send_json(self, status: int, body: dict, headers: dict | None = None):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+                if server._should_fail():
+                    if server._random.random() < 0.5:
+                        self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"Retry-After": "0"})
+                    else:
+                        self._send_json(500, {"error": {"message": "The server had an error", "type": "server_error"}})
+                    return
+
+                messages = body.get("messages", [])
+                content = json.dumps(build_response(messages))
+                prompt_tokens = sum(len(m.get("content") or "") for m in messages) // CHARS_PER_TOKEN + 1
+                completion_tokens = len(content) // CHARS_PER_TOKEN + 1
+                server._count(completion_tokens)
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                         "total_tokens": prompt_tokens + completion_tokens}
+                time.sleep(server.latency_seconds)
+                if body.get("stream"):
+                    self._stream(body.get("model", ""), content, usage)
+                    return
+                time.sleep(completion_tokens / server.tokens_per_second)
+                self._send_json(200, {
+                    "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": body.get("model", ""),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+
+            def _stream(self, model: str, content: str, usage: dict):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def send_event(data: str):
+                    event = f"data: {data}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+                    self.wfile.flush()
+
+                def chunk(delta: dict, finish_reason: str | None = None, chunk_usage: dict | None = None) -> str:
+                    return json.dumps({
+                        "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                        "choices": [] if chunk_usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                        "usage": chunk_usage,
+                    })
+
+                piece_chars = 16 * CHARS_PER_TOKEN # Sixteen tokens per chunk
+                for start in range(0, len(content), piece_chars):
+                    send_event(chunk({"content": content[start:start + piece_chars]}))
+                    time.sleep(16 / server.tokens_per_second)
+                send_event(chunk({}, "stop"))
+                send_event(chunk({}, chunk_usage=usage))
+                send_event("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
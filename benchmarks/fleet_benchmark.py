@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+End-to-end fleet benchmark: runs main.py against N synthetic repositories served from local bare
+git remotes, with a local fake LLM server and a no-op (or sleeping) build, then reports
+throughput, per-stage latencies and peak memory.
+
+    python benchmarks/fleet_benchmark.py --repos 50 --jobs 8 --llm-latency 1.0 -- --pipeline
+
+Arguments after '--' are passed to main.py unchanged.
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Repository root
+
+from benchmarks.fake_llm_server import FakeLLMServer, rewrite_files
+from log_context import LOG_FORMAT
+from sparse_checkout import run_git
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "fixtures")
+FIXTURE_PREFIX = "component"
+TARGET_FILES = ["run", "project.json", "pom.xml"]
+GIT_ENV = {"GIT_AUTHOR_NAME": "benchmark", "GIT_AUTHOR_EMAIL": "benchmark@localhost",
+           "GIT_COMMITTER_NAME": "benchmark", "GIT_COMMITTER_EMAIL": "benchmark@localhost"}
+
+
+def fixture_dirs(fixtures_dir: str = FIXTURES_DIR) -> list[str]:
+    return sorted(
+        os.path.join(fixtures_dir, name) for name in os.listdir(fixtures_dir)
+        if name.startswith(FIXTURE_PREFIX) and os.path.isdir(os.path.join(fixtures_dir, name))
+    )
+
+
+def make_remotes(count: int, remotes_dir: str, fixtures_dir: str = FIXTURES_DIR, migrated: int = 0) -> list[str]:
+    """
+    Creates 'count' bare repositories under remotes_dir, cycling through the component fixtures,
+    each with one commit on 'main'. The first 'migrated' already contain the fake LLM's rewrite,
+    as on a partly migrated fleet. Returns their names.
+    """
+    sources = fixture_dirs(fixtures_dir)
+    if not sources:
+        raise ValueError(f"No {FIXTURE_PREFIX}* fixtures found in {fixtures_dir}")
+    os.makedirs(remotes_dir, exist_ok=True)
+    names = []
+    with tempfile.TemporaryDirectory(prefix="bench-seed-") as seed_root:
+        for index in range(count):
+            source = sources[index % len(sources)]
+            name = f"{os.path.basename(source)}-{index:04d}"
+            seed = os.path.join(seed_root, name)
+            shutil.copytree(source, seed)
+            if index < migrated:
+                _migrate(seed)
+            run_git(["init", "--quiet", "--initial-branch=main"], cwd=seed)
+            run_git(["add", "-A"], cwd=seed)
+            run_git(["commit", "--quiet", "-m", f"Initial import of {name}"], cwd=seed, env=GIT_ENV)
+            run_git(["clone", "--bare", "--quiet", seed, os.path.join(remotes_dir, name)])
+            names.append(name)
+    return names
+
+
+def _migrate(repo_dir: str):
+    current_files = {}
+    for path in TARGET_FILES:
+        if os.path.exists(os.path.join(repo_dir, path)):
+            with open(os.path.join(repo_dir, path)) as f:
+                current_files[path] = f.read()
+    for file_info in rewrite_files(current_files)["updated_files"]:
+        with open(os.path.join(repo_dir, file_info["file_path"]), 'w') as f:
+            f.write(file_info["updated_content"])
+
+
+class LocalGitClient:
+    """The GitHubClient operations RepoProcessor uses, done with plain git against local remotes."""
+
+    def __init__(self):
+        self.pull_requests = []
+
+    def clone_repo(self, repo_url: str, dest: str):
+        run_git(["clone", "--quiet", repo_url, dest])
+
+    def create_or_reset_branch(self, repo_path: str, branch_name: str):
+        run_git(["checkout", "--quiet", "-B", branch_name], cwd=repo_path)
+
+    def commit_changes(self, repo_path: str, message: str):
+        run_git(["add", "-A"], cwd=repo_path)
+        run_git(["commit", "--quiet", "-m", message], cwd=repo_path, env=GIT_ENV)
+
+    def push_branch(self, repo_path: str, branch_name: str):
+        run_git(["push", "--quiet", "--force", "origin", f"HEAD:refs/heads/{branch_name}"], cwd=repo_path)
+
+    def create_pull_request(self, repo_path: str, title: str, body: str, reviewers: list) -> str:
+        self.pull_requests.append(title)
+        return f"file://{repo_path}/pull/{len(self.pull_requests)}"
+
+
+def write_context(path: str, repo_names: list[str], remotes_dir: str, build_command: str, extra_settings: dict):
+    context = {
+        "repositories": repo_names,
+        "global_settings": {
+            "repo_base_url": f"file://{remotes_dir}",
+            "build_command": build_command,
+            "target_files": TARGET_FILES,
+            "reviewers": [],
+            "openai_model_name": "fake-model",
+            **extra_settings,
+        },
+        "repository_settings": {},
+    }
+    with open(path, 'w') as f:
+        json.dump(context, f, indent=2)
+
+
+def peak_rss_mb(who: int) -> float:
+    return resource.getrusage(who).ru_maxrss / 1024 # ru_maxrss is in KB on Linux
+
+
+def run_benchmark(args, main_args: list[str]) -> dict:
+    import main as fleet_main # Imported late so the helpers above stay usable without the LLM SDKs
+    work_dir = tempfile.mkdtemp(prefix="fleet-bench-", dir=args.work_dir)
+    try:
+        remotes_dir = os.path.join(work_dir, "remotes")
+        started = time.monotonic()
+        repo_names = make_remotes(args.repos, remotes_dir, migrated=int(args.repos * args.migrated_fraction))
+        logging.info(f"Created {len(repo_names)} local remotes in {time.monotonic() - started:.1f}s")
+
+        context_path = os.path.join(work_dir, "context.json")
+        extra_settings = {"llm_streaming": args.stream,
+                          "llm_rate_limits": {"openai": {"requests_per_minute": 100000, "tokens_per_minute": 100000000,
+                                                         "max_concurrency": max(args.jobs, 8), "base_delay_seconds": 0.05}}}
+        write_context(context_path, repo_names, remotes_dir, args.build_command, extra_settings)
+        prompt_path = os.path.join(work_dir, "prompt.txt")
+        with open(prompt_path, 'w') as f:
+            f.write("Upgrade {component_name} from Java 8 to Java 11.")
+
+        metrics_path = os.path.join(work_dir, "metrics.json")
+        usage_path = os.path.join(work_dir, "usage.json")
+        argv = ["main.py", "--prompt-file", prompt_path, "--context-file", context_path, "--llm-provider", "openai",
+                "--jobs", str(args.jobs), "--no-llm-cache", "--no-test-cache",
+                "--build-log-dir", os.path.join(work_dir, "build_logs"),
+                "--mirror-dir", os.path.join(work_dir, "mirrors"), "--fleet-state-dir", os.path.join(work_dir, "fleet_state"),
+                "--maven-repo", os.path.join(work_dir, "maven"),
+                "--metrics-json", metrics_path, "--usage-json", usage_path, *main_args]
+
+        with FakeLLMServer(args.llm_latency, args.llm_tokens_per_second, args.llm_error_rate, seed=args.seed) as server:
+            env = {"OPENAI_API_KEY": "fake-key", "OPENAI_BASE_URL": server.base_url}
+            git_client = LocalGitClient()
+            with patch.dict(os.environ, env), patch.object(sys, "argv", argv), patch.object(fleet_main, "GitHubClient", lambda: git_client):
+                started = time.monotonic()
+                fleet_main.main()
+                elapsed = time.monotonic() - started
+            server_stats = server.stats()
+
+        with open(metrics_path) as f:
+            metrics = json.load(f)
+        with open(usage_path) as f:
+            usage = json.load(f)
+        statuses = {}
+        for repo in metrics["repositories"].values():
+            statuses[repo["status"]] = statuses.get(repo["status"], 0) + 1
+        return {
+            "repositories": len(repo_names),
+            "jobs": args.jobs,
+            "main_args": main_args,
+            "elapsed_seconds": elapsed,
+            "repos_per_minute": len(repo_names) / elapsed * 60 if elapsed else 0.0,
+            "statuses": statuses,
+            "stages": metrics["stages"],
+            "llm": {**server_stats, "latency_seconds": usage["campaign"]["latency_seconds"]},
+            "peak_rss_mb": {"orchestrator": peak_rss_mb(resource.RUSAGE_SELF), "children": peak_rss_mb(resource.RUSAGE_CHILDREN)},
+        }
+    finally:
+        if args.keep_work_dir:
+            logging.info(f"Keeping benchmark work directory {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def print_report(report: dict):
+    print(f"\n{report['repositories']} repositories in {report['elapsed_seconds']:.1f}s "
+          f"({report['repos_per_minute']:.1f} repos/minute) with {report['jobs']} job(s) {' '.join(report['main_args'])}")
+    print("Statuses: " + ", ".join(f"{status} {count}" for status, count in sorted(report["statuses"].items())))
+    print(f"{'stage':<14} {'count':>6} {'p50 s':>9} {'p95 s':>9} {'max s':>9}")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<14} {stats['count']:>6} {stats['p50']:>9.3f} {stats['p95']:>9.3f} {stats['max']:>9.3f}")
+    print(f"LLM server: {report['llm']['requests']} requests, {report['llm']['errors']} injected errors")
+    print(f"Peak RSS: orchestrator {report['peak_rss_mb']['orchestrator']:.0f} MB, "
+          f"largest child {report['peak_rss_mb']['children']:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark main.py end to end against local fake remotes and a fake LLM server.",
+                                     epilog="Arguments after '--' are passed to main.py, e.g. -- --pipeline --dedup")
+    parser.add_argument("--repos", type=int, default=20, help="Number of synthetic repositories (default: 20).")
+    parser.add_argument("--jobs", type=int, default=4, help="Passed to main.py --jobs (default: 4).")
+    parser.add_argument("--build-command", default="true", help="Build command for every repository, e.g. 'sleep 2' (default: true).")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Fake LLM seconds before the first token (default: 0.5).")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=500.0, help="Fake LLM output speed (default: 500).")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of fake LLM requests answered with 429/500 (default: 0).")
+    parser.add_argument("--migrated-fraction", type=float, default=0.0,
+                        help="Fraction of repositories that already have the change, so the LLM returns them unchanged (default: 0).")
+    parser.add_argument("--no-stream", dest="stream", action="store_false", help="Set llm_streaming to false (plain responses).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the injected errors.")
+    parser.add_argument("--work-dir", help="Parent directory for the benchmark's remotes and workspaces (default: system temp).")
+    parser.add_argument("--keep-work-dir", action="store_true", help="Keep remotes, logs and reports after the run.")
+    parser.add_argument("--json", help="Also write the report to this JSON file, e.g. to compare runs.")
+    parser.add_argument("--verbose", action="store_true", help="Show main.py's INFO logs, including its run summary.")
+    argv = sys.argv[1:]
+    main_args = []
+    if "--" in argv:
+        main_args = argv[argv.index("--") + 1:]
+        argv = argv[:argv.index("--")]
+    args = parser.parse_args(argv)
+    # Configured before anything logs; main.py's own basicConfig is then a no-op
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format=LOG_FORMAT)
+
+    report = run_benchmark(args, main_args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
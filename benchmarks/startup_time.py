@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Cold-start import benchmark. Imports a module (main.py by default) in a fresh interpreter with
+-X importtime and fails if the imports take longer than the budget or load an LLM SDK or httpx.
+
+    python benchmarks/startup_time.py --budget-ms 400
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET_MS = 400
+# Loaded only once a provider is selected (see llm_providers.py), never at import time
+LAZY_MODULES = ("openai", "google.generativeai", "httpx")
+
+
+def parse_importtime(stderr: str) -> dict:
+    """{module: (self_us, cumulative_us)} from -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def top_level_total_us(stderr: str) -> int:
+    """Sums the cumulative time of top-level imports (those without indentation)."""
+    total = 0
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "imported package" not in line:
+            _, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            if not name[1:].startswith(" "): # One separator space, then the nesting indent
+                total += int(cumulative_us)
+    return total
+
+
+def measure(module: str) -> str:
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPO_ROOT,
+                             capture_output=True, text=True, check=False)
+    if process.returncode != 0:
+        raise RuntimeError(f"'import {module}' failed:\n{process.stderr[-2000:]}")
+    return process.stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the cold-start import time of the CLI against a budget.")
+    parser.add_argument("--module", default="main", help="Module to import (default: main).")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help=f"Maximum total import time (default: {DEFAULT_BUDGET_MS}).")
+    parser.add_argument("--runs", type=int, default=3, help="Measure this many fresh interpreters and keep the fastest (default: 3).")
+    parser.add_argument("--top", type=int, default=10, help="Show the slowest N imports (default: 10).")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    stderr = min(runs, key=top_level_total_us) # The fastest run is the least disturbed by the machine
+    total_ms = top_level_total_us(stderr) / 1000
+    modules = parse_importtime(stderr)
+
+    print(f"import {args.module}: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, (self_us, cumulative_us) in sorted(modules.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms cumulative {self_us / 1000:8.1f} ms self  {name}")
+
+    failures = []
+    eager = [name for name in LAZY_MODULES if name in modules]
+    if eager:
+        failures.append(f"Provider dependencies imported at startup: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"startup took {total_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from status_enums import RepoStatus
+
+DEFAULT_JOURNAL_DIR = ".campaign_journals"
+
+# Final statuses that need no further work when a campaign is resumed
+COMPLETED_STATUSES = {RepoStatus.SUCCESS_PR_CREATED, RepoStatus.SUCCESS_NO_CHANGES}
+
+
+class CampaignJournal:
+    """
+    Append-only JSONL record of a campaign. Each line is one event:
+      {"event": "campaign_start", "resumed": false, ...}
+      {"event": "step", "repo": ..., "step": "apply", "artifacts": {...}}
+      {"event": "status", "repo": ..., "status": "SUCCESS_PR_CREATED"}
+    Lines are flushed and fsynced as they are written, so a crashed run loses at most the step in progress.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _append(self, event: dict):
+        event = {"ts": time.time(), **event}
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def start(self, resumed: bool):
+        self._append({"event": "campaign_start", "resumed": resumed})
+
+    def record_step(self, repo_name: str, step: str, artifacts: dict | None = None):
+        self._append({"event": "step", "repo": repo_name, "step": step, "artifacts": artifacts or {}})
+
+    def record_status(self, repo_name: str, status: RepoStatus):
+        self._append({"event": "status", "repo": repo_name, "status": status.name})
+
+    def load(self) -> dict:
+        """
+        Returns {repo_name: {"steps": {step: artifacts}, "status": RepoStatus | None}} for the current
+        campaign, i.e. everything since the last non-resumed campaign_start. A truncated last line
+        (from a crash mid-write) is ignored.
+        """
+        events = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line_number, line in enumerate(f, start=1):
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        logging.warning(f"Ignoring unreadable line {line_number} of campaign journal {self.path}")
+                        continue
+                    if event.get("event") == "campaign_start" and not event.get("resumed"):
+                        events = []
+                    events.append(event)
+        except FileNotFoundError:
+            return {}
+
+        state = {}
+        for event in events:
+            repo_name = event.get("repo")
+            if not repo_name:
+                continue
+            entry = state.setdefault(repo_name, {"steps": {}, "status": None})
+            if event["event"] == "step":
+                entry["steps"][event["step"]] = event.get("artifacts", {})
+                entry["status"] = None # Work resumed after an earlier final status
+            elif event["event"] == "status":
+                try:
+                    entry["status"] = RepoStatus[event["status"]]
+                except KeyError:
+                    logging.warning(f"Unknown status '{event['status']}' for {repo_name} in campaign journal")
+        return state
@@ -16,4 +16,12 @@ class GitHubClientError(BaseAppException):
 
 class TestRunnerError(BaseAppException):
     """Custom exception for TestRunner errors."""
-    pass
\ No newline at end of file
+    pass
+
+class PatchApplyError(BaseAppException):
+    """Raised when a search/replace edit returned by the LLM does not apply cleanly."""
+    pass
+
+class BudgetExceededError(LLMClientError):
+    """Raised instead of sending an LLM call that would take the campaign over its token budget."""
+    pass
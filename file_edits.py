@@ -0,0 +1,78 @@
+from exceptions import PatchApplyError
+
+# Response modes for generate_code, selected with the 'response_mode' setting
+RESPONSE_MODE_FULL = "full" # Model returns the complete content of every file
+RESPONSE_MODE_EDITS = "edits" # Model returns search/replace edits per file
+RESPONSE_MODES = (RESPONSE_MODE_FULL, RESPONSE_MODE_EDITS)
+EDITS_OUTPUT_RATIO = 0.3 # Edits are about this fraction of the input files' length; full content is about 1.0
+
+# Schema for the edits response mode. Shares the top-level 'updated_files' key with the
+# full-content schema so callers handle both the same way.
+FILE_EDITS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "updated_files": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "file_path": {
+                        "type": "string",
+                        "description": "The file path relative to the repository root.",
+                    },
+                    "edits": {
+                        "type": "array",
+                        "description": "Search/replace edits applied in order. Empty if the file needs no changes.",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "search": {
+                                    "type": "string",
+                                    "description": "Exact text copied from the current file. Must occur exactly once.",
+                                },
+                                "replace": {
+                                    "type": "string",
+                                    "description": "Text that replaces 'search'.",
+                                },
+                            },
+                            "required": ["search", "replace"],
+                            "additionalProperties": False,
+                        },
+                    },
+                },
+                "required": ["file_path", "edits"],
+                "additionalProperties": False,
+            },
+        }
+    },
+    "required": ["updated_files"],
+    "additionalProperties": False,
+}
+
+EDITS_MODE_INSTRUCTION = (
+    "Do not return full file contents. For each target file return a list of search/replace edits: "
+    "'search' must be copied exactly from the current file (including whitespace) and be long enough "
+    "to occur exactly once; 'replace' is the new text. Return an empty 'edits' list for files that "
+    "need no changes. This overrides any earlier instruction to return 'updated_content'."
+)
+
+
+def apply_search_replace(original: str, edits: list[dict]) -> str:
+    """
+    Applies search/replace edits in order and returns the new content.
+    Raises PatchApplyError if any 'search' text is missing or ambiguous in the content it is applied to.
+    """
+    content = original
+    for index, edit in enumerate(edits, start=1):
+        search = edit.get("search")
+        replace = edit.get("replace")
+        if not isinstance(search, str) or not isinstance(replace, str):
+            raise PatchApplyError(f"Edit #{index} is missing 'search' or 'replace'")
+        if not search:
+            raise PatchApplyError(f"Edit #{index} has an empty 'search'")
+        occurrences = content.count(search)
+        if occurrences != 1:
+            found = "not found" if occurrences == 0 else f"found {occurrences} times"
+            raise PatchApplyError(f"Edit #{index} does not apply cleanly: search text {found}")
+        content = content.replace(search, replace, 1)
+    return content
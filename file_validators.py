@@ -0,0 +1,179 @@
+import fnmatch
+import json
+import logging
+import os
+import shutil
+import subprocess
+import xml.etree.ElementTree as ET
+
+VALIDATION_TIMEOUT_SECONDS = 30 # Per external check (bash -n, shellcheck)
+
+# Added to the prompt when a retry carries 'validation_feedback' in its context
+VALIDATION_FEEDBACK_INSTRUCTION = (
+    "Your previous answer for these files failed local validation; 'validation_feedback' lists the problems "
+    "per file. Start again from 'current_files' and return corrected content that fixes every listed problem."
+)
+
+# Shape of the packaging descriptor in project.json; checked with check_json_schema
+PROJECT_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "packaging": {
+            "type": "object",
+            "properties": {
+                "type": {"type": "string"},
+                "requires": {"type": "array", "items": {"type": "string"}},
+            },
+            "required": ["type"],
+        },
+    },
+    "required": ["name", "packaging"],
+}
+
+_JSON_TYPES = {"object": dict, "array": list, "string": str, "number": (int, float), "integer": int, "boolean": bool}
+
+
+def check_json_schema(value, schema: dict, path: str = "$") -> list[str]:
+    """The subset of JSON Schema used here: type, properties, required and items."""
+    expected = schema.get("type")
+    if expected and (not isinstance(value, _JSON_TYPES[expected]) or (expected != "boolean" and isinstance(value, bool))):
+        return [f"{path} should be {expected}, got {type(value).__name__}"]
+    problems = []
+    if isinstance(value, dict):
+        problems += [f"{path}.{key} is missing" for key in schema.get("required", []) if key not in value]
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                problems += check_json_schema(value[key], subschema, f"{path}.{key}")
+    if isinstance(value, list) and "items" in schema:
+        for index, item in enumerate(value):
+            problems += check_json_schema(item, schema["items"], f"{path}[{index}]")
+    return problems
+
+
+def check_common(content: str, original: str | None = None) -> list[str]:
+    """Artifacts of LLM output that no target file should contain."""
+    problems = []
+    if not content.strip() and (original or "").strip():
+        problems.append("file is empty")
+    if content.lstrip().startswith("```"):
+        problems.append("content is wrapped in a Markdown code fence")
+    if any(line.startswith(("<<<<<<< ", ">>>>>>> ")) for line in content.splitlines()):
+        problems.append("content contains merge conflict markers")
+    return problems
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1] # Drops the {namespace} prefix
+
+
+def validate_xml(content: str, original: str | None = None) -> list[str]:
+    try:
+        ET.fromstring(content)
+    except ET.ParseError as e:
+        return [f"not well-formed XML: {e}"]
+    return []
+
+
+def _pom_fields(root) -> dict:
+    return {_local_name(child.tag): (child.text or "").strip() for child in root if isinstance(child.tag, str)}
+
+
+def validate_pom(content: str, original: str | None = None) -> list[str]:
+    """Well-formed, and keeps the original's Maven coordinates: the change must not rename or drop the artifact."""
+    problems = validate_xml(content)
+    if problems or not original:
+        return problems
+    try:
+        original_root = ET.fromstring(original)
+    except ET.ParseError:
+        return [] # Nothing to compare against; being well-formed is already an improvement
+    fields, original_fields = _pom_fields(ET.fromstring(content)), _pom_fields(original_root)
+    for name in ("modelVersion", "groupId", "artifactId"):
+        if original_fields.get(name) and not fields.get(name):
+            problems.append(f"<{name}> was removed")
+        elif name != "modelVersion" and original_fields.get(name) and fields[name] != original_fields[name]:
+            problems.append(f"<{name}> changed from '{original_fields[name]}' to '{fields[name]}'")
+    return problems
+
+
+def validate_json(content: str, original: str | None = None) -> list[str]:
+    try:
+        json.loads(content)
+    except json.JSONDecodeError as e:
+        return [f"invalid JSON: {e}"]
+    return []
+
+
+def validate_project_json(content: str, original: str | None = None) -> list[str]:
+    problems = validate_json(content)
+    return problems or check_json_schema(json.loads(content), PROJECT_JSON_SCHEMA)
+
+
+def _run_check(command: list[str], content: str) -> subprocess.CompletedProcess | None:
+    if not shutil.which(command[0]):
+        logging.debug(f"{command[0]} not installed; skipping that check")
+        return None
+    try:
+        return subprocess.run(command, input=content, capture_output=True, text=True, timeout=VALIDATION_TIMEOUT_SECONDS, check=False)
+    except subprocess.TimeoutExpired:
+        logging.warning(f"{command[0]} timed out after {VALIDATION_TIMEOUT_SECONDS}s; skipping that check")
+        return None
+
+
+def validate_shell(content: str, original: str | None = None) -> list[str]:
+    problems = []
+    if original and original.startswith("#!") and not content.startswith("#!"):
+        problems.append("the shebang line was removed")
+    if "\r\n" in content:
+        problems.append("script has Windows (CRLF) line endings")
+    result = _run_check(["bash", "-n"], content) # Parses without executing
+    if result and result.returncode != 0:
+        problems.append(f"bash -n: {result.stderr.strip().replace('bash: line', 'line')}")
+    result = _run_check(["shellcheck", "--severity=error", "--format=gcc", "-"], content)
+    if result and result.returncode != 0:
+        problems += [f"shellcheck: {line.removeprefix('-:')}" for line in result.stdout.splitlines() if line.strip()]
+    return problems
+
+
+# (file name pattern, validator); the first match wins, so specific names come before extensions
+_VALIDATORS = [
+    ("pom.xml", validate_pom),
+    ("*.xml", validate_xml),
+    ("project.json", validate_project_json),
+    ("*.json", validate_json),
+    ("run", validate_shell),
+    ("*.sh", validate_shell),
+]
+
+
+def register_validator(pattern: str, validator):
+    """
+    Registers validator(content, original) -> [problem, ...] for files whose name matches pattern
+    (fnmatch, e.g. "build.gradle" or "*.yaml"). It takes precedence over the built-in validators.
+    """
+    _VALIDATORS.insert(0, (pattern, validator))
+
+
+def validator_for(file_path: str):
+    name = os.path.basename(file_path)
+    return next((validator for pattern, validator in _VALIDATORS if fnmatch.fnmatch(name, pattern)), None)
+
+
+def validate_file(file_path: str, content: str, original: str | None = None) -> list[str]:
+    problems = check_common(content, original)
+    validator = validator_for(file_path)
+    if validator and not problems:
+        problems = validator(content, original)
+    return problems
+
+
+def validate_files(files: dict, originals: dict | None = None) -> dict:
+    """Returns {file_path: [problem, ...]} for each of files ({file_path: content}) that fails validation."""
+    originals = originals or {}
+    failures = {}
+    for file_path, content in files.items():
+        problems = validate_file(file_path, content, originals.get(file_path))
+        if problems:
+            failures[file_path] = problems
+    return failures
@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from exceptions import BaseAppException
+from log_context import repo_log_context
+
+# Placeholder substituted for the repository name when near-identical matching is enabled. Delimited so that only
+# this exact token is replaced when the name is filled back in
+REPO_NAME_TOKEN = "@@REPO_NAME@@"
+
+
+class RepoGroup:
+    """Repositories whose target files (those the recipes don't handle) have the same (normalized) content."""
+
+    def __init__(self, files: dict, normalized: bool):
+        self.files = files # {file_path: content sent to the LLM (normalized if normalized is True)}
+        self.normalized = normalized
+        self.members = [] # RepoProcessors whose target files fall in this group
+
+
+class FleetDeduplicator:
+    """
+    Fleet-level pre-pass run after every repository is cloned and before apply_changes.
+    Repositories are grouped by the content of their target files; the LLM is asked once per group,
+    with all of the group's files in one request as apply_changes would send them, and the result is
+    handed to each member via RepoProcessor.precomputed_updates.
+    """
+
+    def __init__(self, llm_client, prompt: str, normalize_repo_names: bool = False, max_workers: int = 4,
+                 recipe_engine=None):
+        self.llm_client = llm_client
+        self.recipe_engine = recipe_engine # Files the recipes fully handle never need the LLM
+        self.prompt = prompt
+        self.normalize_repo_names = normalize_repo_names
+        self.max_workers = max_workers
+        self.files_seen = 0
+        self.llm_calls = 0
+        self.failed_groups = 0
+        self._lock = threading.Lock()
+
+    def _normalize(self, files: dict, repo_name: str) -> tuple[dict, bool]:
+        """Replaces the repository name where it is not part of a longer word with REPO_NAME_TOKEN."""
+        if not self.normalize_repo_names or any(REPO_NAME_TOKEN in content for content in files.values()):
+            return files, False # The token must mean the repository name and nothing else
+        name = re.compile(rf"(?<!\w){re.escape(repo_name)}(?!\w)") # "core" in core-war or core.jar, not in score
+        normalized_files = {file_path: name.sub(REPO_NAME_TOKEN, content) for file_path, content in files.items()}
+        return normalized_files, normalized_files != files
+
+    def group(self, processors: list) -> list[RepoGroup]:
+        """Groups the processors by the paths and content hashes of their target files."""
+        groups = {}
+        for processor in processors:
+            with repo_log_context(processor.repo_name):
+                current_files = processor.read_target_files()
+            self.files_seen += len(current_files)
+            files = {file_path: content for file_path, content in current_files.items()
+                     if not (self.recipe_engine and self.recipe_engine.apply(file_path, content)[1])} # apply_changes rewrites the rest without the LLM
+            if not files:
+                continue
+            files, normalized = self._normalize(files, processor.repo_name)
+            key = (normalized, tuple(sorted((file_path, hashlib.sha256(content.encode("utf-8")).hexdigest())
+                                            for file_path, content in files.items())))
+            if key not in groups:
+                groups[key] = RepoGroup(files, normalized)
+            groups[key].members.append(processor)
+        return list(groups.values())
+
+    def resolve(self, processors: list):
+        """Calls the LLM once per repository group and fans the updated files out to every member."""
+        groups = self.group(processors)
+        logging.info(f"Fleet dedup: {self.files_seen} target files across {len(processors)} repositories "
+                     f"collapsed into {len(groups)} unique set(s) of files")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dedup-worker") as executor:
+            futures = {executor.submit(self._generate_for_group, group): group for group in groups}
+            for future in as_completed(futures):
+                group = futures[future]
+                updated_files = future.result()
+                if updated_files is None:
+                    continue # Members fall back to their own LLM call
+                for processor in group.members:
+                    for file_path, content in updated_files.items():
+                        if group.normalized:
+                            content = content.replace(REPO_NAME_TOKEN, processor.repo_name)
+                        processor.precomputed_updates[file_path] = content
+
+    def _generate_for_group(self, group: RepoGroup) -> dict | None:
+        representative = group.members[0]
+        repo_name = REPO_NAME_TOKEN if group.normalized else representative.repo_name
+        context = {
+            "repository": repo_name,
+            "repo_path": representative.repo_path,
+            "target_files": list(group.files),
+            "current_files": group.files,
+        }
+        with repo_log_context(representative.repo_name):
+            logging.debug(f"Fleet dedup: requesting {len(group.files)} file(s) on behalf of {len(group.members)} repositories")
+            with self._lock:
+                self.llm_calls += 1
+            try:
+                response = self.llm_client.generate_code(self.prompt, context)
+            except BaseAppException as e:
+                logging.warning(f"Fleet dedup LLM call failed; {len(group.members)} repositories will request their files individually: {e}")
+                with self._lock:
+                    self.failed_groups += 1
+                return None
+
+        updated_files = {file_info["file_path"]: file_info["updated_content"] for file_info in response.get("updated_files") or []
+                         if file_info.get("file_path") in group.files and file_info.get("updated_content") is not None}
+        missing = [file_path for file_path in group.files if file_path not in updated_files]
+        if missing:
+            # Partial answers are still used; members request the missing files themselves
+            logging.warning(f"Fleet dedup: LLM response did not include {', '.join(missing)}; members will request them individually")
+            with self._lock:
+                self.failed_groups += 1
+        return updated_files or None
+
+    def stats(self) -> dict:
+        return {"files_seen": self.files_seen, "llm_calls": self.llm_calls, "failed_groups": self.failed_groups}
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from campaign_journal import COMPLETED_STATUSES
+from exceptions import GitHubClientError
+from metrics import write_atomically
+from sparse_checkout import run_git
+from status_enums import RepoStatus
+
+DEFAULT_FLEET_STATE_DIR = ".fleet_state"
+LOOKUP_WORKERS = 8 # Concurrent remote lookups before a run; each is one ls-remote and at most one small fetch
+
+
+def git_blob_hash(content: str) -> str:
+    """The object id git gives a file with this content, as 'git hash-object' prints it."""
+    data = content.encode('utf-8')
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def parse_ls_tree(output: str) -> dict:
+    """{path: blob id} from 'git ls-tree' output; paths that aren't there are simply missing."""
+    blobs = {}
+    for line in output.splitlines():
+        info, _, path = line.partition("\t")
+        fields = info.split()
+        if len(fields) == 3 and fields[1] == "blob":
+            blobs[path] = fields[2]
+    return blobs
+
+
+def remote_head(repo_url: str) -> str:
+    """The commit the remote's default branch points at, asked for without cloning."""
+    for line in run_git(["ls-remote", repo_url, "HEAD"]).splitlines():
+        sha, _, ref = line.partition("\t")
+        if ref == "HEAD":
+            return sha
+    raise GitHubClientError(f"ls-remote found no HEAD in {repo_url}")
+
+
+def inputs_fingerprint(processor) -> str:
+    """Hashes what decides a repository's outcome apart from its own files: prompt, recipes and per-repo settings."""
+    inputs = {
+        "prompt": processor.prompt,
+        "recipes": processor.context.get("recipes"),
+        "target_files": processor.target_files,
+        "build_command": processor.build_command,
+        "response_mode": processor.response_mode,
+        "branch_name": processor.branch_name,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class FleetStateIndex:
+    """
+    What each repository looked like when a run last handled it: the remote HEAD, the blob ids of its
+    target files and the outcome, kept as {repo_name: entry} in state_dir/index.json.
+    An incremental run asks each remote for its HEAD (git ls-remote) before cloning anything. A
+    repository that last ended with a PR or with nothing to change is skipped if its HEAD hasn't moved,
+    or if its target files at the new HEAD are the ones it was processed with, or the ones its PR
+    proposed. Blob ids at a new HEAD come from a shallow, blob-less fetch into state_dir/trees, so
+    only commits and trees cross the network.
+    """
+
+    def __init__(self, state_dir: str = DEFAULT_FLEET_STATE_DIR, skip_statuses=COMPLETED_STATUSES):
+        self.state_dir = state_dir
+        self.path = os.path.join(state_dir, "index.json")
+        self.trees_dir = os.path.join(state_dir, "trees")
+        self.skip_statuses = {status.name for status in skip_statuses}
+        self._lock = threading.Lock()
+        self.entries = self._load()
+        self.checked = 0
+        self.skipped = 0
+        self.tree_lookups = 0
+        self.lookup_failures = 0
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Ignoring unreadable fleet state index {self.path}: {e}")
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def save(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        with self._lock:
+            text = json.dumps(self.entries, indent=2, sort_keys=True)
+        write_atomically(self.path, text)
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def target_blobs_at_head(self, repo_name: str, repo_url: str, target_files: list[str]) -> tuple[str, dict]:
+        """Fetches the remote's HEAD commit and trees (no blobs) and returns (head, {path: blob id})."""
+        trees_path = os.path.join(self.trees_dir, f"{re.sub(r'[^A-Za-z0-9._-]+', '_', repo_name)}.git")
+        self._count("tree_lookups")
+        if os.path.isdir(trees_path):
+            run_git(["fetch", "--quiet", "--depth=1", "origin", "HEAD"], cwd=trees_path)
+            head = run_git(["rev-parse", "FETCH_HEAD"], cwd=trees_path).strip()
+        else:
+            os.makedirs(self.trees_dir, exist_ok=True)
+            shutil.rmtree(f"{trees_path}.tmp", ignore_errors=True) # Left over from an interrupted lookup
+            run_git(["clone", "--bare", "--quiet", "--depth=1", "--filter=blob:none", repo_url, f"{trees_path}.tmp"])
+            os.replace(f"{trees_path}.tmp", trees_path)
+            head = run_git(["rev-parse", "HEAD"], cwd=trees_path).strip()
+        listing = run_git(["ls-tree", head, "--", *target_files], cwd=trees_path) if target_files else ""
+        return head, parse_ls_tree(listing)
+
+    def unchanged_reason(self, processor) -> str | None:
+        """Why the processor's repository can be skipped, or None if it has to be processed."""
+        with self._lock:
+            entry = dict(self.entries.get(processor.repo_name) or {})
+        if entry.get("status") not in self.skip_statuses or entry.get("inputs") != inputs_fingerprint(processor):
+            return None
+        self._count("checked")
+        try:
+            head = remote_head(processor.repo_url)
+            if head == entry.get("head"):
+                return f"remote HEAD {head[:12]} unchanged since it ended {entry['status']}"
+            head, blobs = self.target_blobs_at_head(processor.repo_name, processor.repo_url, processor.target_files)
+        except (GitHubClientError, OSError) as e:
+            logging.warning(f"Fleet state lookup failed for {processor.repo_name}, processing it: {e}")
+            self._count("lookup_failures")
+            return None
+        if blobs not in (entry.get("target_blobs"), entry.get("result_blobs")):
+            return None
+        with self._lock: # The next lookup only needs ls-remote
+            self.entries[processor.repo_name]["head"] = head
+        return f"target files unchanged at new remote HEAD {head[:12]} since it ended {entry['status']}"
+
+    def select_changed(self, processors: list) -> list:
+        """
+        Returns the processors whose repositories have to be processed; the others are marked halted
+        with SKIPPED_UNCHANGED. Remotes are looked up concurrently.
+        """
+        with ThreadPoolExecutor(max_workers=LOOKUP_WORKERS, thread_name_prefix="fleet-state") as executor:
+            reasons = list(executor.map(self.unchanged_reason, processors))
+        changed = []
+        for processor, reason in zip(processors, reasons):
+            if reason is None:
+                changed.append(processor)
+                continue
+            logging.info(f"Skipping {processor.repo_name}: {reason}")
+            processor.status = RepoStatus.SKIPPED_UNCHANGED
+            processor.halted = True
+            self._count("skipped")
+        return changed
+
+    def record(self, processor):
+        """Records the revision a processor started from and how it ended. Repositories never cloned are left as they were."""
+        base = processor.base_revision
+        if not base:
+            return
+        entry = {
+            "head": base["head"],
+            "target_blobs": base["target_blobs"],
+            "status": processor.status.name,
+            "inputs": inputs_fingerprint(processor),
+            "recorded_at": time.time(),
+        }
+        if processor.status == RepoStatus.SUCCESS_PR_CREATED: # What the target files look like once the PR is merged
+            entry["result_blobs"] = {**base["target_blobs"], **{path: git_blob_hash(content) for path, content
+                                                                in processor.applied_updates.items() if path in processor.target_files}}
+        with self._lock:
+            self.entries[processor.repo_name] = entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"repositories": len(self.entries), "checked": self.checked, "skipped": self.skipped,
+                    "tree_lookups": self.tree_lookups, "lookup_failures": self.lookup_failures}
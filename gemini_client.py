@@ -0,0 +1,328 @@
+import asyncio
+import logging
+import json
+import os
+import threading
+from contextlib import nullcontext
+from collections.abc import Mapping, Sequence
+
+from exceptions import LLMClientError, LLMResponseError # Use renamed exceptions
+from file_edits import FILE_EDITS_SCHEMA, EDITS_MODE_INSTRUCTION, EDITS_OUTPUT_RATIO, RESPONSE_MODE_EDITS
+from file_validators import VALIDATION_FEEDBACK_INSTRUCTION
+from rate_limiter import estimate_tokens, get_rate_limiter
+from usage_tracker import LLMCallUsage, gemini_usage
+
+# Define the schema for the function Gemini should call
+# This mirrors the JSON schema previously used with OpenAI
+FILE_UPDATE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "updated_files": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "file_path": {
+                        "type": "string",
+                        "description": "The file path relative to the repository root.",
+                    },
+                    "updated_content": {
+                        "type": "string",
+                        "description": (
+                            "The full updated content of the file. "
+                            "If no changes are needed for a file, this should be the original content."
+                        ),
+                    },
+                },
+                "required": ["file_path", "updated_content"],
+            },
+        }
+    },
+    "required": ["updated_files"],
+}
+
+def _without_additional_properties(schema):
+    """Gemini's function schemas are an OpenAPI subset without 'additionalProperties'."""
+    if isinstance(schema, dict):
+        return {key: _without_additional_properties(value) for key, value in schema.items() if key != "additionalProperties"}
+    return schema
+
+
+def _to_plain(value):
+    """Converts proto-plus maps/lists from function call args into plain dicts and lists."""
+    if isinstance(value, Mapping):
+        return {key: _to_plain(item) for key, item in value.items()}
+    if isinstance(value, Sequence) and not isinstance(value, (str, bytes)):
+        return [_to_plain(item) for item in value]
+    return value
+
+
+class GeminiClient:
+    provider_name = "gemini"
+
+    def __init__(self):
+        api_key = os.getenv('GOOGLE_API_KEY')
+        if not api_key:
+            # Fallback to OpenAI key if GOOGLE_API_KEY is not set, for smoother transition during dev.
+            # Remove this fallback once fully on Gemini.
+            api_key = os.getenv('OPENAI_API_KEY')
+            if api_key:
+                logging.warning("GOOGLE_API_KEY not set, falling back to OPENAI_API_KEY for Gemini client init. This is for transition and should be updated.")
+            else:
+                raise ValueError("Neither GOOGLE_API_KEY nor OPENAI_API_KEY environment variable is set.")
+
+        # Imported here rather than at module level: google.generativeai takes seconds to load, and
+        # importing this module must stay cheap for tests and tools that only need its helpers
+        import google.generativeai as genai
+        from google.generativeai.types import GenerationConfig, HarmCategory, HarmBlockThreshold, Tool, FunctionDeclaration # Import necessary types
+        # Not on the shared http_pool: the SDK talks gRPC over a channel of its own and cannot take an
+        # httpx client. Its transport="rest" option would not help, it opens its own requests session.
+        genai.configure(api_key=api_key)
+
+        self.model_name = os.getenv('GEMINI_MODEL_NAME', "gemini-1.5-pro-latest")
+        self.model = None # Will be configured by set_model_from_config or on first use
+        self._model_lock = threading.Lock() # generate_code may be called from several worker threads
+        self.stream = False # Enabled with the 'llm_streaming' global setting
+        self.rate_limiter = get_rate_limiter(self.provider_name) # Shared by every worker in the process
+        self.usage_tracker = None # UsageTracker for token, latency and cost accounting
+        self.call_timeout_seconds = None # Default per-call timeout for agenerate_code ('llm_call_timeout_seconds')
+        self.tool = Tool(
+            function_declarations=[
+                FunctionDeclaration(
+                    name="update_code_files",
+                    description="Updates specified code files and returns their new content.",
+                    parameters=FILE_UPDATE_SCHEMA,
+                )
+            ]
+        )
+        # Used instead of self.tool when the caller asks for search/replace edits (response_mode 'edits')
+        self.edits_tool = Tool(
+            function_declarations=[
+                FunctionDeclaration(
+                    name="apply_code_edits",
+                    description="Returns search/replace edits for the specified code files.",
+                    parameters=_without_additional_properties(FILE_EDITS_SCHEMA),
+                )
+            ]
+        )
+        self.generation_config = GenerationConfig(
+            temperature=0.0, # For deterministic output
+            # top_p= Not typically used with temperature 0
+            # top_k= Not typically used with temperature 0
+        )
+        # Safety settings - adjust as needed. For code generation, some categories might be less restrictive.
+        self.safety_settings = {
+            HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+            HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+        }
+        logging.info(f"GeminiClient initialized. Model to be used: {self.model_name}")
+
+
+    def set_model_from_config(self, global_settings: dict):
+        """Allows setting model name from config if not set by env var."""
+        if 'GEMINI_MODEL_NAME' not in os.environ: # Env var takes precedence
+            self.model_name = global_settings.get("gemini_model_name", self.model_name)
+        self.stream = global_settings.get("llm_streaming", self.stream)
+        self.call_timeout_seconds = global_settings.get("llm_call_timeout_seconds", self.call_timeout_seconds)
+        self.rate_limiter = get_rate_limiter(self.provider_name, global_settings.get("llm_rate_limits", {}).get(self.provider_name))
+
+        import google.generativeai as genai # Already loaded by __init__
+        self.model = genai.GenerativeModel(
+            model_name=self.model_name,
+            generation_config=self.generation_config,
+            safety_settings=self.safety_settings,
+            tools=[self.tool] # Pass tool during model initialization
+        )
+        logging.info(f"Using Gemini model: {self.model_name}{' (streaming)' if self.stream else ''}")
+
+    def _track_usage(self, context: dict, estimated_tokens: int):
+        if self.usage_tracker:
+            return self.usage_tracker.track(context.get('repository', ''), self.provider_name, self.model_name, estimated_tokens)
+        return nullcontext(LLMCallUsage())
+
+    def generate_code(self, prompt_template: str, context: dict, on_file=None) -> dict:
+        """
+        Returns {"updated_files": [...]}. When streaming is enabled, on_file (if given) is called
+        with each 'updated_files' entry once the function call carrying it has been received.
+        """
+        messages, tools, function_name, estimated_tokens = self._build_request(prompt_template, context)
+
+        # Refused up front (BudgetExceededError) if the campaign's token budget would be overrun
+        with self._track_usage(context, estimated_tokens) as usage:
+            try:
+                if self.stream:
+                    return self._generate_streaming(messages, tools, function_name, on_file, estimated_tokens, usage)
+
+                # ResourceExhausted (429) and other transient errors are retried with backoff by the rate limiter
+                response = self.rate_limiter.call(
+                    # Tools are part of the model's configuration; edits mode overrides them per call
+                    lambda: self.model.generate_content(messages, tools=tools),
+                    estimated_tokens,
+                )
+                return self._parse_response(response, function_name, usage)
+
+            except LLMClientError: # Includes LLMResponseError, which RepoProcessor escalates on
+                raise
+            except Exception as e:
+                logging.error(f"Gemini API call failed: {e}", exc_info=True)
+                # Catch specific genai errors if they exist and are more informative
+                # For now, wrap generic Exception into LLMClientError
+                raise LLMClientError(f"Gemini API call failed: {e}") from e
+
+    async def agenerate_code(self, prompt_template: str, context: dict, on_file=None, timeout: float | None = None) -> dict:
+        """
+        Async generate_code on the SDK's generate_content_async, with the same response and
+        exceptions. timeout (default: 'llm_call_timeout_seconds') bounds the whole call and raises
+        LLMClientError. Cancelling the task cancels the request.
+        """
+        messages, tools, function_name, estimated_tokens = self._build_request(prompt_template, context)
+        timeout = timeout if timeout is not None else self.call_timeout_seconds
+
+        with self._track_usage(context, estimated_tokens) as usage:
+            try:
+                async with asyncio.timeout(timeout):
+                    if self.stream:
+                        return await self._agenerate_streaming(messages, tools, function_name, on_file, estimated_tokens, usage)
+                    response = await self.rate_limiter.acall(
+                        lambda: self.model.generate_content_async(messages, tools=tools),
+                        estimated_tokens,
+                    )
+                    return self._parse_response(response, function_name, usage)
+            except TimeoutError as e:
+                raise LLMClientError(f"Gemini API call timed out after {timeout:.0f}s") from e
+            except LLMClientError:
+                raise
+            except Exception as e:
+                logging.error(f"Gemini API call failed: {e}", exc_info=True)
+                raise LLMClientError(f"Gemini API call failed: {e}") from e
+
+    def _build_request(self, prompt_template: str, context: dict) -> tuple[list, list | None, str, int]:
+        """Returns (messages, per-call tools, function name, estimated_tokens) for a generate_code call."""
+        if not self.model:
+            with self._model_lock: # Only one worker should lazily build the model
+                if not self.model:
+                    # This would happen if set_model_from_config was not called.
+                    # Or, you can initialize self.model in __init__ if global_settings is passed there.
+                    logging.warning("Gemini model not explicitly configured via set_model_from_config. Initializing with default/env model name.")
+                    self.set_model_from_config({}) # Initialize with default
+
+        logging.debug(f"Generating code with Gemini API (Model: {self.model_name})")
+
+        component_name = context.get('repository', '')
+        # Ensure prompt is formatted correctly for Gemini, especially if using function calling.
+        # It's often good to explicitly instruct the model to use the tool.
+        user_prompt_instruction = (
+            "Please analyze the provided code files based on the initial instructions. "
+            "Use the 'update_code_files' tool to return the updated content for all specified target files. "
+            "If a file does not require changes, return its original content."
+        )
+
+        edits_mode = context.get("response_mode") == RESPONSE_MODE_EDITS
+        function_name = "update_code_files"
+        if edits_mode:
+            function_name = "apply_code_edits"
+            user_prompt_instruction = (
+                "Please analyze the provided code files based on the initial instructions. "
+                "Use the 'apply_code_edits' tool to return edits for all specified target files. "
+                f"{EDITS_MODE_INSTRUCTION}"
+            )
+
+        # The 'prompt_template' is the core instruction (e.g., upgrade Java 8 to 11)
+        # The 'context' contains the file contents.
+        final_user_prompt = f"{prompt_template.format(component_name=component_name)}\n\n{user_prompt_instruction}\n\nContext (current file contents):\n{json.dumps(context.get('current_files', {}), indent=2)}"
+        if context.get("validation_feedback"): # A retry after the previous answer failed local validation
+            final_user_prompt += f"\n\n{VALIDATION_FEEDBACK_INSTRUCTION}\n\nvalidation_feedback:\n{json.dumps(context['validation_feedback'], indent=2)}"
+
+        messages = [
+            # Gemini works well with a direct user prompt containing all info for simpler tasks.
+            # For more complex chat, you might build up a history.
+            {'role': 'user', 'content': final_user_prompt}
+        ]
+
+        logging.debug(f"Sending to Gemini: {messages}")
+        estimated_tokens = estimate_tokens(final_user_prompt, EDITS_OUTPUT_RATIO if edits_mode else 1.0)
+        return messages, [self.edits_tool] if edits_mode else None, function_name, estimated_tokens
+
+    def _parse_response(self, response, function_name: str, usage: LLMCallUsage) -> dict:
+        logging.debug(f"Raw Gemini response object: {response}")
+        usage.add(*gemini_usage(getattr(response, "usage_metadata", None)))
+
+        if not response.candidates or not response.candidates[0].content.parts:
+            raise LLMResponseError("Gemini response is empty or malformed (no candidates/parts).")
+
+        # Expecting the model to use the function call
+        part = response.candidates[0].content.parts[0]
+        if not part.function_call:
+            error_message = f"Gemini did not call the '{function_name}' function as expected."
+            logging.error(error_message + f" Response text: {part.text if hasattr(part, 'text') else 'N/A'}")
+            raise LLMResponseError(error_message + f" Response text: {part.text if hasattr(part, 'text') else 'N/A'}")
+
+        function_call_args = _to_plain(part.function_call.args) # JSON-serialisable, so responses can be cached
+        logging.debug(f"Gemini function call arguments: {function_call_args}")
+
+        # Validate the structure (optional, but good practice)
+        if "updated_files" not in function_call_args or not isinstance(function_call_args["updated_files"], list):
+            raise LLMResponseError("Gemini function call 'args' missing 'updated_files' list or it's not a list.")
+
+        # The function_call_args should directly be the dictionary we want
+        return function_call_args
+
+    def _generate_streaming(self, messages: list, tools: list | None, function_name: str, on_file=None, estimated_tokens: int = 0,
+                            usage: LLMCallUsage | None = None) -> dict:
+        """
+        Streams the response. Gemini delivers a function call as a single part rather than as
+        partial JSON, so entries are handed to on_file as soon as that part arrives. Truncation is
+        detected from the candidate's finish_reason; a truncated function call cannot be resumed.
+        """
+        usage = usage or LLMCallUsage()
+        state = {"function_call_args": None, "finish_reason": None, "usage_metadata": None}
+        stream = self.rate_limiter.call(lambda: self.model.generate_content(messages, tools=tools, stream=True), estimated_tokens,
+                                        stream=True)
+        with stream: # Holds the rate limiter's concurrency slot until the stream ends or a chunk handler raises
+            for chunk in stream:
+                self._handle_chunk(chunk, state, usage, on_file)
+        return self._finish_stream(state, function_name, usage)
+
+    async def _agenerate_streaming(self, messages: list, tools: list | None, function_name: str, on_file=None, estimated_tokens: int = 0,
+                                   usage: LLMCallUsage | None = None) -> dict:
+        usage = usage or LLMCallUsage()
+        state = {"function_call_args": None, "finish_reason": None, "usage_metadata": None}
+        stream = await self.rate_limiter.acall(lambda: self.model.generate_content_async(messages, tools=tools, stream=True), estimated_tokens,
+                                               stream=True)
+        async with stream:
+            async for chunk in stream:
+                self._handle_chunk(chunk, state, usage, on_file)
+        return self._finish_stream(state, function_name, usage)
+
+    @staticmethod
+    def _handle_chunk(chunk, state: dict, usage: LLMCallUsage, on_file=None):
+        if getattr(chunk, "usage_metadata", None):
+            state["usage_metadata"] = chunk.usage_metadata # Cumulative; the last chunk carries the final counts
+        if not chunk.candidates:
+            return
+        candidate = chunk.candidates[0]
+        for part in candidate.content.parts:
+            usage.mark_first_token()
+            if part.function_call:
+                state["function_call_args"] = _to_plain(part.function_call.args)
+                for file_info in state["function_call_args"].get("updated_files") or []:
+                    if on_file:
+                        on_file(file_info)
+        if candidate.finish_reason:
+            state["finish_reason"] = candidate.finish_reason
+
+    @staticmethod
+    def _finish_stream(state: dict, function_name: str, usage: LLMCallUsage) -> dict:
+        usage.add(*gemini_usage(state["usage_metadata"]))
+        function_call_args = state["function_call_args"]
+        finish_reason = state["finish_reason"]
+        finish_name = getattr(finish_reason, "name", str(finish_reason))
+        if finish_name == "MAX_TOKENS":
+            raise LLMResponseError("Gemini output was truncated (finish_reason MAX_TOKENS).")
+        if function_call_args is None:
+            raise LLMResponseError(f"Gemini did not call the '{function_name}' function as expected (finish_reason {finish_name}).")
+        if not isinstance(function_call_args.get("updated_files"), list):
+            raise LLMResponseError("Gemini function call 'args' missing 'updated_files' list or it's not a list.")
+        return function_call_args
@@ -0,0 +1,251 @@
+import asyncio
+import importlib.util
+import logging
+import threading
+import weakref
+
+import httpx
+
+# Override with the 'http_pool' global setting, e.g. "http_pool": {"max_connections_per_host": 16}
+DEFAULT_POOL_SETTINGS = {
+    "max_connections": 64,
+    "max_keepalive_connections": 32,
+    "max_connections_per_host": 16, # In-flight requests per host; more wait for a free slot
+    "slot_timeout_seconds": 600.0, # Longest wait for a host slot before httpx.PoolTimeout is raised
+    "keepalive_expiry_seconds": 90.0,
+    "connect_timeout_seconds": 10.0,
+    "read_timeout_seconds": 600.0, # LLM responses can take minutes
+    "http2": True, # Used only if the optional 'h2' package is installed
+}
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Holds the host slot until the response body has been read and closed."""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            release, self._release = self._release, None
+            if release:
+                release()
+
+
+class _HostLimitedTransport(httpx.BaseTransport):
+    """Caps concurrent requests per host and traces connection setup to measure reuse."""
+
+    def __init__(self, pool: "HTTPPool", transport: httpx.BaseTransport):
+        self._pool = pool
+        self._transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        slot = self._pool._host_slot(request.url.host)
+        if not slot.acquire(timeout=self._pool.settings["slot_timeout_seconds"]):
+            raise httpx.PoolTimeout(f"No free connection slot for {request.url.host} within "
+                                    f"{self._pool.settings['slot_timeout_seconds']}s", request=request)
+        caller_trace = request.extensions.get("trace")
+
+        def trace(event: str, info: dict):
+            self._pool._trace(event)
+            if caller_trace:
+                caller_trace(event, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            slot.release()
+            raise
+        self._pool._count_response(response)
+        response.stream = _ReleasingStream(response.stream, slot.release)
+        return response
+
+    def close(self):
+        self._transport.close()
+
+
+class _ReleasingAsyncStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            release, self._release = self._release, None
+            if release:
+                release()
+
+
+class _AsyncHostLimitedTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of _HostLimitedTransport. Belongs to one event loop, like its connections."""
+
+    def __init__(self, pool: "HTTPPool", transport: httpx.AsyncBaseTransport):
+        self._pool = pool
+        self._transport = transport
+        self._host_slots = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self._pool.settings["max_connections_per_host"])
+        slot = self._host_slots[host]
+        try:
+            await asyncio.wait_for(slot.acquire(), self._pool.settings["slot_timeout_seconds"])
+        except asyncio.TimeoutError:
+            raise httpx.PoolTimeout(f"No free connection slot for {host} within "
+                                    f"{self._pool.settings['slot_timeout_seconds']}s", request=request) from None
+        caller_trace = request.extensions.get("trace")
+
+        async def trace(event: str, info: dict):
+            self._pool._trace(event)
+            if caller_trace:
+                await caller_trace(event, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            slot.release()
+            raise
+        self._pool._count_response(response)
+        response.stream = _ReleasingAsyncStream(response.stream, slot.release)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class HTTPPool:
+    """
+    One keep-alive connection pool shared by the httpx-based clients in the process, so parallel
+    workers reuse connections instead of repeating TCP and TLS handshakes. OpenAIClient is the one
+    user today: GeminiClient talks gRPC, and GitHubClient runs git and gh as subprocesses.
+    """
+
+    def __init__(self, settings: dict | None = None):
+        self.settings = {**DEFAULT_POOL_SETTINGS, **(settings or {})}
+        self.http2 = bool(self.settings["http2"]) and http2_available()
+        if self.settings["http2"] and not self.http2:
+            logging.debug("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1 keep-alive")
+        self._lock = threading.Lock()
+        self._host_slots = {}
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary() # {event loop: httpx.AsyncClient}; async connections are loop-bound
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.http2_responses = 0
+
+    def _host_slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.settings["max_connections_per_host"])
+            return self._host_slots[host]
+
+    def _trace(self, event: str):
+        if event == "connection.connect_tcp.started":
+            with self._lock:
+                self.connections_opened += 1
+        elif event == "connection.start_tls.started":
+            with self._lock:
+                self.tls_handshakes += 1
+
+    def _count_response(self, response: httpx.Response):
+        with self._lock:
+            self.requests += 1
+            if response.extensions.get("http_version") == b"HTTP/2":
+                self.http2_responses += 1
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.settings["max_connections"],
+            max_keepalive_connections=self.settings["max_keepalive_connections"],
+            keepalive_expiry=self.settings["keepalive_expiry_seconds"],
+        )
+
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.settings["read_timeout_seconds"], connect=self.settings["connect_timeout_seconds"])
+
+    def client(self) -> httpx.Client:
+        """The shared httpx.Client, created on first use. Thread-safe."""
+        with self._lock:
+            if self._client is None:
+                transport = httpx.HTTPTransport(http2=self.http2, limits=self._limits())
+                self._client = httpx.Client(transport=_HostLimitedTransport(self, transport), timeout=self._timeout())
+            return self._client
+
+    def async_client(self) -> httpx.AsyncClient:
+        """The httpx.AsyncClient shared by every coroutine on the running event loop, created on first use."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                transport = httpx.AsyncHTTPTransport(http2=self.http2, limits=self._limits())
+                client = self._async_clients[loop] = httpx.AsyncClient(
+                    transport=_AsyncHostLimitedTransport(self, transport), timeout=self._timeout())
+            return client
+
+    async def aclose_async_client(self):
+        """Closes the running event loop's async client; call before the loop shuts down."""
+        with self._lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client:
+            await client.aclose()
+
+    def close(self):
+        with self._lock:
+            client, self._client = self._client, None
+            self._async_clients.clear() # Their loops have to close them; see aclose_async_client
+        if client:
+            client.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            reused = max(0, self.requests - self.connections_opened)
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "tls_handshakes": self.tls_handshakes,
+                "reused": reused,
+                "reuse_rate": reused / self.requests if self.requests else 0.0,
+                "http2_responses": self.http2_responses,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_http_pool(settings: dict | None = None) -> HTTPPool:
+    """Returns the process-wide pool. Settings apply only if given before the pool's client is first used."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or (settings and _pool._client is None):
+            _pool = HTTPPool(settings)
+        return _pool
+
+
+def close_http_pool():
+    """Closes the shared pool's connections; a later get_http_pool() starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool:
+        pool.close()
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_CACHE_DIR = ".llm_cache"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024 # 512 MB
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 60 * 60 # 30 days
+EVICT_EVERY_N_PUTS = 50 # Re-check the size budget periodically rather than on every write
+
+# Context keys that differ between runs without changing what the LLM is asked to do.
+_VOLATILE_CONTEXT_KEYS = {"repo_path"}
+
+
+class LLMResponseCache:
+    """
+    Content-addressed, on-disk store of LLM responses.
+    Entries live at <cache_dir>/<key[:2]>/<key>.json; a hit refreshes the file's mtime so
+    size-based eviction removes the least recently used entries first.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.evict()
+
+    @staticmethod
+    def make_key(provider: str, model: str, prompt: str, context: dict) -> str:
+        """Hashes everything that determines the response: provider, model, prompt and target-file contents."""
+        stable_context = {k: v for k, v in context.items() if k not in _VOLATILE_CONTEXT_KEYS}
+        payload = json.dumps(
+            {"provider": provider, "model": model, "prompt": prompt, "context": stable_context},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> dict | None:
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            self._count_miss()
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Discarding unreadable LLM cache entry {path}: {e}")
+            self._remove(path)
+            self._count_miss()
+            return None
+
+        if time.time() - entry.get("created", 0) > self.max_age_seconds:
+            logging.debug(f"LLM cache entry {key} expired")
+            self._remove(path)
+            self._count_miss()
+            return None
+
+        try:
+            os.utime(path) # Mark as recently used
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return entry["response"]
+
+    def put(self, key: str, response: dict, provider: str = "", model: str = ""):
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"created": time.time(), "provider": provider, "model": model, "response": response}
+        # Write to a temp file and rename so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Failed to write LLM cache entry {path}: {e}")
+            self._remove(tmp_path)
+            return
+
+        with self._lock:
+            self.stores += 1
+            should_evict = self.stores % EVICT_EVERY_N_PUTS == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """Removes entries not used within max_age_seconds, then least recently used ones until under max_bytes."""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if not name.endswith(".json"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    if now - stat.st_mtime > self.max_age_seconds:
+                        self._remove(path)
+                        self.evictions += 1
+                    else:
+                        entries.append((stat.st_mtime, stat.st_size, path))
+
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries): # Oldest access first
+                if total_bytes <= self.max_bytes:
+                    break
+                self._remove(path)
+                self.evictions += 1
+                total_bytes -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class CachingLLMClient:
+    """Wraps an LLM client (OpenAIClient, GeminiClient) and serves repeated requests from an LLMResponseCache."""
+
+    def __init__(self, client, cache: LLMResponseCache):
+        self.client = client
+        self.cache = cache
+
+    def __getattr__(self, name):
+        # Anything not overridden here (model_name, provider_name, ...) comes from the wrapped client
+        return getattr(self.client, name)
+
+    def set_model_from_config(self, global_settings: dict):
+        self.client.set_model_from_config(global_settings)
+
+    def generate_code(self, prompt: str, context: dict, on_file=None) -> dict:
+        key = self.cache.make_key(self.client.provider_name, self.client.model_name, prompt, context)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logging.info(f"LLM cache hit for {context.get('repository', '')} ({self.client.provider_name}/{self.client.model_name})")
+            if on_file:
+                for file_info in cached.get("updated_files") or []:
+                    on_file(file_info)
+            return cached
+
+        response = self.client.generate_code(prompt, context, on_file=on_file)
+        if isinstance(response, dict) and isinstance(response.get("updated_files"), list):
+            self.cache.put(key, response, provider=self.client.provider_name, model=self.client.model_name)
+        return response
+
+    async def agenerate_code(self, prompt: str, context: dict, on_file=None, timeout: float | None = None) -> dict:
+        key = self.cache.make_key(self.client.provider_name, self.client.model_name, prompt, context)
+        cached = self.cache.get(key) # Small local file reads; not worth a thread hop
+        if cached is not None:
+            logging.info(f"LLM cache hit for {context.get('repository', '')} ({self.client.provider_name}/{self.client.model_name})")
+            if on_file:
+                for file_info in cached.get("updated_files") or []:
+                    on_file(file_info)
+            return cached
+
+        response = await self.client.agenerate_code(prompt, context, on_file=on_file, timeout=timeout)
+        if isinstance(response, dict) and isinstance(response.get("updated_files"), list):
+            self.cache.put(key, response, provider=self.client.provider_name, model=self.client.model_name)
+        return response
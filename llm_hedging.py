@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+
+from exceptions import BudgetExceededError, LLMClientError, LLMResponseError
+from file_edits import RESPONSE_MODE_EDITS
+from metrics import percentile
+
+# Override with the 'llm_hedging' global setting, e.g. "llm_hedging": {"hedge_percentile": 90}
+DEFAULT_HEDGING_SETTINGS = {
+    "hedge_percentile": 95, # Hedge once the primary has taken longer than this percentile of its recent latencies
+    "initial_hedge_delay_seconds": 60.0, # Used until min_latency_samples calls have succeeded
+    "min_hedge_delay_seconds": 1.0,
+    "latency_window": 100,
+    "min_latency_samples": 10,
+    "error_rate_threshold": 0.5, # Over the last error_window calls; above it the provider is skipped entirely
+    "error_window": 20,
+    "min_error_samples": 5,
+    "failover_cooldown_seconds": 300.0, # How long a failed-over provider is skipped before it is tried again
+}
+
+
+def validate_response(response, response_mode: str | None = None):
+    """Raises LLMResponseError unless the response matches the generate_code contract for the response mode."""
+    if not isinstance(response, dict) or not isinstance(response.get("updated_files"), list):
+        raise LLMResponseError("Response has no 'updated_files' list.")
+    content_key, content_type = ("edits", list) if response_mode == RESPONSE_MODE_EDITS else ("updated_content", str)
+    for file_info in response["updated_files"]:
+        if not isinstance(file_info, dict) or not isinstance(file_info.get("file_path"), str):
+            raise LLMResponseError(f"Invalid 'updated_files' entry: {str(file_info)[:200]}")
+        if not isinstance(file_info.get(content_key), content_type):
+            raise LLMResponseError(f"'updated_files' entry for {file_info['file_path']} has no '{content_key}'.")
+
+
+class HedgedLLMClient:
+    """
+    Sends each generate_code call to the primary provider and, if it hasn't answered within a
+    percentile of its recent latencies, a hedge request to the next one. The first response that
+    passes validation wins and the other request is cancelled. A provider whose recent error rate
+    crosses the threshold is skipped until its cooldown ends, so every call fails over to the others.
+    Requests run on the providers' agenerate_code on one background event loop, which is what makes
+    the loser cancellable.
+    """
+
+    def __init__(self, clients: dict, settings: dict | None = None):
+        if len(clients) < 2:
+            raise ValueError("Hedging needs at least two LLM providers")
+        self.settings = {**DEFAULT_HEDGING_SETTINGS, **(settings or {})}
+        self.clients = clients # {provider name: client}, in order of preference
+        self.provider_name = "+".join(clients)
+        self.model_name = "+".join(client.model_name for client in clients.values())
+        self._lock = threading.Lock()
+        self._health = {
+            name: {"latencies": deque(maxlen=self.settings["latency_window"]),
+                   "outcomes": deque(maxlen=self.settings["error_window"]), # True for an error
+                   "calls": 0, "errors": 0, "wins": 0, "down_until": 0.0}
+            for name in clients
+        }
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self._loop = None
+        self._loop_thread = None
+
+    @property
+    def usage_tracker(self):
+        return next(iter(self.clients.values())).usage_tracker
+
+    @usage_tracker.setter
+    def usage_tracker(self, tracker):
+        for client in self.clients.values():
+            client.usage_tracker = tracker
+
+    def set_model_from_config(self, global_settings: dict):
+        for client in self.clients.values():
+            client.set_model_from_config(global_settings)
+        self.model_name = "+".join(client.model_name for client in self.clients.values())
+
+    def generate_code(self, prompt: str, context: dict, on_file=None) -> dict:
+        """Blocking wrapper around agenerate_code for worker threads; see agenerate_code."""
+        future = asyncio.run_coroutine_threadsafe(self.agenerate_code(prompt, context, on_file), self._background_loop())
+        return future.result()
+
+    async def agenerate_code(self, prompt: str, context: dict, on_file=None, timeout: float | None = None) -> dict:
+        """
+        Returns the first valid {"updated_files": [...]} from any provider. Raises the preferred
+        provider's error if every provider failed. on_file, if given, receives the winner's files
+        once the race is decided, since either provider's stream could still lose.
+        """
+        providers = self._providers_by_preference()
+        pending = {}
+        errors = {}
+        hedge = None # The provider asked because the first was slow, as opposed to failed
+        self._count("calls")
+
+        def start(name: str):
+            pending[asyncio.create_task(self._attempt(name, prompt, context, timeout))] = name
+
+        primary = providers.pop(0)
+        start(primary)
+        hedge_at = time.monotonic() + self.hedge_delay(primary)
+        try:
+            while pending:
+                wait = max(0.0, hedge_at - time.monotonic()) if providers else None
+                done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done: # The hedge delay passed without an answer
+                    name = providers.pop(0)
+                    logging.info(f"LLM call for {context.get('repository', '')} is slow; hedging with {name}")
+                    self._count("hedges")
+                    hedge = name
+                    start(name)
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    try:
+                        response = task.result()
+                    except BudgetExceededError:
+                        raise # Applies to every provider alike
+                    except (LLMClientError, LLMResponseError) as e:
+                        errors[name] = e
+                        logging.warning(f"{name} failed for {context.get('repository', '')}: {e}")
+                        if providers and not pending: # Fail over without waiting for the hedge delay
+                            start(providers.pop(0))
+                        continue
+                    if name == hedge:
+                        self._count("hedge_wins")
+                    with self._lock:
+                        self._health[name]["wins"] += 1
+                    if on_file:
+                        for file_info in response["updated_files"]:
+                            on_file(file_info)
+                    return response
+        finally:
+            for task in pending: # The losers
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        raise errors.get(primary) or next(iter(errors.values()))
+
+    async def _attempt(self, name: str, prompt: str, context: dict, timeout: float | None) -> dict:
+        client = self.clients[name]
+        started = time.monotonic()
+        try:
+            if hasattr(client, "agenerate_code"):
+                response = await client.agenerate_code(prompt, context, timeout=timeout)
+            else: # A registered provider without an async API; it can't be cancelled, only abandoned
+                response = await asyncio.to_thread(client.generate_code, prompt, context)
+            validate_response(response, context.get("response_mode"))
+        except asyncio.CancelledError:
+            raise # Lost the race; says nothing about the provider's health
+        except BudgetExceededError:
+            raise
+        except (LLMClientError, LLMResponseError):
+            self._record(name, failed=True)
+            raise
+        except Exception as e: # Unexpected errors from a provider count against it like any other
+            self._record(name, failed=True)
+            raise LLMClientError(f"{name} call failed: {e}") from e
+        self._record(name, failed=False, latency=time.monotonic() - started)
+        return response
+
+    def hedge_delay(self, name: str) -> float:
+        with self._lock:
+            latencies = list(self._health[name]["latencies"])
+        if len(latencies) < self.settings["min_latency_samples"]:
+            return self.settings["initial_hedge_delay_seconds"]
+        return max(self.settings["min_hedge_delay_seconds"], percentile(latencies, self.settings["hedge_percentile"] / 100))
+
+    def _providers_by_preference(self) -> list[str]:
+        """Healthy providers in configured order; if all are failed over, all of them."""
+        now = time.monotonic()
+        with self._lock:
+            healthy = [name for name, health in self._health.items() if health["down_until"] <= now]
+        return healthy or list(self.clients)
+
+    def _record(self, name: str, failed: bool, latency: float | None = None):
+        settings = self.settings
+        with self._lock:
+            health = self._health[name]
+            health["calls"] += 1
+            health["outcomes"].append(failed)
+            if failed:
+                health["errors"] += 1
+            else:
+                health["latencies"].append(latency)
+            outcomes = health["outcomes"]
+            error_rate = sum(outcomes) / len(outcomes)
+            if not failed or len(outcomes) < settings["min_error_samples"] or error_rate < settings["error_rate_threshold"]:
+                return
+            health["down_until"] = time.monotonic() + settings["failover_cooldown_seconds"]
+            outcomes.clear() # Judged afresh once the cooldown ends
+            self.failovers += 1
+        logging.warning(f"{name} failed {error_rate:.0%} of recent LLM calls; failing over to the other provider(s) "
+                        f"for {settings['failover_cooldown_seconds']:.0f}s")
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _background_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever, name="llm-hedging", daemon=True)
+                self._loop_thread.start()
+            return self._loop
+
+    def close(self):
+        """Stops the background event loop after closing its HTTP connections."""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        from http_pool import get_http_pool
+        asyncio.run_coroutine_threadsafe(get_http_pool().aclose_async_client(), loop).result(timeout=10)
+        loop.call_soon_threadsafe(loop.stop)
+        self._loop_thread.join(timeout=10)
+        loop.close()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            providers = {}
+            for name, health in self._health.items():
+                latencies = list(health["latencies"])
+                providers[name] = {
+                    "calls": health["calls"],
+                    "errors": health["errors"],
+                    "wins": health["wins"],
+                    "p95_seconds": percentile(latencies, 0.95) if latencies else None,
+                    "failed_over": health["down_until"] > now,
+                }
+            return {"calls": self.calls, "hedges": self.hedges, "hedge_wins": self.hedge_wins,
+                    "failovers": self.failovers, "providers": providers}
+
+    def log_summary(self):
+        stats = self.stats()
+        if not stats["calls"]:
+            return
+        logging.info(f"LLM hedging: {stats['calls']} calls, {stats['hedges']} hedged ({stats['hedge_wins']} won by the hedge), "
+                     f"{stats['failovers']} failover(s)")
+        for name, provider in stats["providers"].items():
+            p95 = f"{provider['p95_seconds']:.1f}s" if provider["p95_seconds"] is not None else "n/a"
+            logging.info(f"  {name}: {provider['calls']} requests, {provider['errors']} errors, {provider['wins']} wins, "
+                         f"p95 {p95}{' (failed over)' if provider['failed_over'] else ''}")
@@ -0,0 +1,67 @@
+import importlib
+import logging
+
+# Provider name -> "module:ClassName". Modules are imported only when their provider is selected,
+# so a run never pays for loading an SDK it doesn't use.
+_PROVIDERS = {
+    "gemini": "gemini_client:GeminiClient",
+    "openai": "openai_client:OpenAIClient",
+}
+
+
+def register_provider(name: str, target: str):
+    """
+    Registers an LLM provider as "module:ClassName". The class must take no constructor arguments
+    and provide set_model_from_config(global_settings) and generate_code(prompt, context, on_file=None).
+    Providers can also be registered from configuration with the 'llm_providers' global setting, e.g.
+    "llm_providers": {"azure": "azure_client:AzureOpenAIClient"}.
+    """
+    module_name, _, class_name = target.partition(":")
+    if not module_name or not class_name:
+        raise ValueError(f"Invalid provider target '{target}' for '{name}', expected 'module:ClassName'")
+    _PROVIDERS[name] = target
+
+
+def register_configured_providers(global_settings: dict):
+    for name, target in global_settings.get("llm_providers", {}).items():
+        register_provider(name, target)
+
+
+def provider_names() -> list[str]:
+    return sorted(_PROVIDERS)
+
+
+def load_provider_class(name: str) -> type:
+    if name not in _PROVIDERS:
+        raise ValueError(f"Unknown LLM provider '{name}'. Expected one of: {', '.join(provider_names())}")
+    module_name, _, class_name = _PROVIDERS[name].partition(":")
+    module = importlib.import_module(module_name)
+    try:
+        return getattr(module, class_name)
+    except AttributeError as e:
+        raise ValueError(f"LLM provider '{name}': module '{module_name}' has no class '{class_name}'") from e
+
+
+def create_client(name: str, global_settings: dict):
+    """Imports the provider's module, instantiates its client and applies the global settings to it."""
+    client = load_provider_class(name)()
+    client.set_model_from_config(global_settings)
+    logging.debug(f"Loaded LLM provider '{name}' from {_PROVIDERS[name]}")
+    return client
+
+
+def create_tier_clients(tiers: list, global_settings: dict) -> list[dict]:
+    """
+    Creates one client per entry of the 'model_tiers' global setting, cheapest first, e.g.
+    [{"name": "small", "provider": "openai", "model": "gpt-4o-mini"}, {"name": "large", "provider": "openai", "model": "gpt-4o-2024-08-06"}].
+    Returns [{"name", "model", "client"}]. A model name set through the provider's environment
+    variable (OPENAI_MODEL_NAME, GEMINI_MODEL_NAME) overrides every tier of that provider.
+    """
+    tier_clients = []
+    for index, tier in enumerate(tiers):
+        if not isinstance(tier, dict) or not tier.get("provider") or not tier.get("model"):
+            raise ValueError(f"model_tiers[{index}] needs a 'provider' and a 'model', got {tier!r}")
+        provider = tier["provider"]
+        client = create_client(provider, {**global_settings, f"{provider}_model_name": tier["model"]})
+        tier_clients.append({"name": tier.get("name", tier["model"]), "model": client.model_name, "client": client})
+    return tier_clients
@@ -0,0 +1,35 @@
+import contextlib
+import contextvars
+import logging
+
+# The repository currently being processed by this thread/task. Worker threads set this
+# at the start of each job so every log line can be attributed to a repo.
+_current_repo = contextvars.ContextVar("current_repo", default="-")
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - [%(repo)s] - %(message)s'
+
+
+class RepoContextFilter(logging.Filter):
+    """Adds a 'repo' attribute to every log record from the current repo context."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.repo = _current_repo.get()
+        return True
+
+
+@contextlib.contextmanager
+def repo_log_context(repo_name: str):
+    """Tags all log records emitted inside the block with repo_name."""
+    token = _current_repo.set(repo_name)
+    try:
+        yield
+    finally:
+        _current_repo.reset(token)
+
+
+def install_repo_log_filter(logger: logging.Logger | None = None):
+    """Attaches RepoContextFilter to the handlers of the given (default: root) logger."""
+    logger = logger or logging.getLogger()
+    for handler in logger.handlers:
+        if not any(isinstance(f, RepoContextFilter) for f in handler.filters):
+            handler.addFilter(RepoContextFilter())
@@ -3,15 +3,83 @@
 import argparse
 import json
 import logging
+import shlex
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# from openai_client import OpenAIClient # Comment out or remove
-from gemini_client import GeminiClient # Import new client
 from github_client import GitHubClient
+from llm_providers import create_client, create_tier_clients, register_configured_providers
+from llm_hedging import HedgedLLMClient
 from repo_processor import RepoProcessor
 from status_enums import RepoStatus
 from exceptions import BaseAppException # For catching general app errors
+from llm_cache import CachingLLMClient, LLMResponseCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, DEFAULT_MAX_AGE_SECONDS
+from log_context import LOG_FORMAT, install_repo_log_filter, repo_log_context
+from pipeline import PipelineOrchestrator, default_stages
+from fleet_dedup import FleetDeduplicator
+from recipe_engine import RecipeEngine
+from rate_limiter import all_rate_limiters
+from mirror_store import MirrorStore, DEFAULT_MIRROR_DIR, DEFAULT_MIRROR_MAX_BYTES
+from sparse_checkout import CLONE_STRATEGY_MIRROR
+from test_runner import MavenCache, DEFAULT_MAVEN_REPO, is_maven_command
+from metrics import MetricsRecorder
+from usage_tracker import UsageTracker
+from campaign_journal import CampaignJournal, COMPLETED_STATUSES, DEFAULT_JOURNAL_DIR
+from fleet_state import FleetStateIndex, DEFAULT_FLEET_STATE_DIR
+from test_result_cache import TestResultCache, DEFAULT_TEST_CACHE_DIR, DEFAULT_MAX_AGE_DAYS as DEFAULT_TEST_CACHE_MAX_AGE_DAYS
+
+
+def run_processor_steps(processor: RepoProcessor, steps, open_workspace: bool = True,
+                        close_workspace: bool = True) -> RepoStatus:
+    """Runs some or all of a RepoProcessor's steps inside its own log context. Safe to call from a worker thread."""
+    with repo_log_context(processor.repo_name):
+        try:
+            if open_workspace:
+                logging.info(f"Processing repository {processor.repo_name}")
+                processor.open_workspace() # Each processor gets its own temporary workspace
+            processor.run_steps(steps)
+        except Exception as e: # run_steps handles step errors; this is a safety net
+            logging.error(f"Worker for {processor.repo_name} failed unexpectedly: {e}", exc_info=True)
+            processor.status = RepoStatus.ERROR_GENERIC
+            processor.halted = True
+        finally:
+            if close_workspace or processor.halted:
+                processor.close_workspace()
+        return processor.status
+
+
+def run_fleet(processors: list, steps, args, stage_concurrency: dict, orchestrators: list,
+              open_workspaces: bool = True, close_workspaces: bool = True):
+    """Runs the given steps for every processor, either pipelined or on a --jobs worker pool."""
+    if args.pipeline:
+        stages = [stage for stage in default_stages(stage_concurrency) if set(stage.steps) <= set(steps)]
+        logging.info(f"Running {', '.join(stage.name for stage in stages)} stage(s) for "
+                     f"{len(processors)} repositories with a pipelined orchestrator")
+        orchestrator = PipelineOrchestrator(stages)
+        orchestrator.run(processors, open_workspaces=open_workspaces, close_workspaces=close_workspaces)
+        orchestrators.append(orchestrator)
+        return
+
+    logging.info(f"Running {', '.join(steps)} for {len(processors)} repositories with {args.jobs} worker(s)")
+    with ThreadPoolExecutor(max_workers=args.jobs, thread_name_prefix="repo-worker") as executor:
+        futures = [
+            executor.submit(run_processor_steps, processor, steps, open_workspaces, close_workspaces)
+            for processor in processors
+        ]
+        for future in as_completed(futures):
+            future.result()
+
+
+def prewarm_maven(maven_cache: MavenCache, processors: list):
+    """Resolves the dependencies of every changed pom.xml into the shared repository, once per distinct pom."""
+    by_executable = {} # mvn, ./mvnw, ...
+    for processor in processors:
+        if not processor.halted and is_maven_command(processor.build_command):
+            by_executable.setdefault(shlex.split(processor.build_command)[0], []).append(processor.repo_path)
+    for executable, project_dirs in by_executable.items():
+        maven_cache.prewarm(project_dirs, executable)
+
 
 def main():
     parser = argparse.ArgumentParser(description="Automate tech debt fixes across multiple repositories")
@@ -20,12 +88,57 @@ def main():
     parser.add_argument("--repo-path", help="Optional path to a single pre-cloned repository for local processing.")
     parser.add_argument("--repo-name", help="Name of the single repository to process (required if --repo-path is used and repo not in context file).")
     parser.add_argument("--keep-temp-dir", action="store_true", help="Keep temporary directories after processing (for debugging).")
-    parser.add_argument("--llm-provider", default="gemini", choices=["gemini", "openai"], help="Specify the LLM provider (gemini or openai)")
+    parser.add_argument("--llm-provider",
+                        help="LLM provider: gemini (default), openai, or one registered with the 'llm_providers' global setting. "
+                             "A comma-separated list (e.g. gemini,openai) hedges slow calls and fails over between them, in that order of preference. "
+                             "Not used with the 'model_tiers' global setting, which names each tier's provider.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of repositories to process in parallel (default: 1).")
+    parser.add_argument("--pipeline", action="store_true", help="Overlap clone, LLM, build and publish stages across repositories (ignores --jobs).")
+    parser.add_argument("--stage-concurrency", action="append", default=[], metavar="STAGE=N",
+                        help="Concurrency limit for a pipeline stage (clone, llm, build, publish). May be repeated.")
+    parser.add_argument("--dedup", action="store_true", help="Clone all repositories first and call the LLM once per group of repositories with identical target files.")
+    parser.add_argument("--dedup-normalize-names", action="store_true", help="With --dedup, also group repositories whose files differ only by the repository name.")
+    parser.add_argument("--no-llm-cache", action="store_true", help="Always call the LLM provider, bypassing the on-disk response cache.")
+    parser.add_argument("--llm-cache-dir", default=DEFAULT_CACHE_DIR, help=f"Directory for cached LLM responses (default: {DEFAULT_CACHE_DIR}).")
+    parser.add_argument("--no-maven-cache", action="store_true", help="Let each Maven build use its own local repository instead of the shared, pre-warmed one.")
+    parser.add_argument("--maven-repo", default=DEFAULT_MAVEN_REPO, help=f"Shared local Maven repository for all builds (default: {DEFAULT_MAVEN_REPO}).")
+    parser.add_argument("--build-log-dir", default="build_logs", help="Directory for the full build output of each repository (default: build_logs).")
+    parser.add_argument("--force-tests", action="store_true", help="Run every build even if the same tree already passed (results are still recorded).")
+    parser.add_argument("--no-test-cache", action="store_true", help="Neither skip builds nor record passing trees.")
+    parser.add_argument("--test-cache-dir", default=DEFAULT_TEST_CACHE_DIR, help=f"Directory for recorded passing builds (default: {DEFAULT_TEST_CACHE_DIR}).")
+    parser.add_argument("--journal", help="Record the campaign in this journal file so it can be resumed (implied by --resume and --retry-failed).")
+    parser.add_argument("--journal-dir", default=DEFAULT_JOURNAL_DIR,
+                        help=f"Directory for the campaign journal when --journal is not given (default: {DEFAULT_JOURNAL_DIR}/<context file name>.journal.jsonl).")
+    parser.add_argument("--resume", action="store_true", help="Continue the journaled campaign: skip finished repositories and resume interrupted ones.")
+    parser.add_argument("--retry-failed", nargs="*", metavar="STATUS",
+                        help="With the journal, also re-run repositories that ended with these statuses (default: every ERROR_* status). Implies --resume.")
+    parser.add_argument("--metrics-json", help="Write per-stage timing percentiles and per-repository records to this JSON file.")
+    parser.add_argument("--metrics-prom", help="Write per-stage timings as a Prometheus textfile (for node_exporter's textfile collector).")
+    parser.add_argument("--max-tokens-budget", type=int, help="Stop calling the LLM once the campaign's prompt plus completion tokens would exceed this.")
+    parser.add_argument("--usage-json", help="Write LLM token usage, latency and cost per repository, per model and per campaign to this JSON file.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip repositories that last ended with a PR or no changes if their remote HEAD, or their target files at a new HEAD, are unchanged.")
+    parser.add_argument("--fleet-state-dir", default=DEFAULT_FLEET_STATE_DIR,
+                        help=f"Directory for the per-repository state read and updated by --incremental runs (default: {DEFAULT_FLEET_STATE_DIR}).")
+    parser.add_argument("--mirror-dir", default=DEFAULT_MIRROR_DIR, help=f"Directory for local repository mirrors used by clone_strategy 'mirror' (default: {DEFAULT_MIRROR_DIR}).")
 
 
     args = parser.parse_args()
 
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    install_repo_log_filter()
+
+    if args.jobs < 1:
+        logging.error(f"--jobs must be at least 1, got {args.jobs}")
+        sys.exit(1)
+
+    stage_concurrency = {}
+    for item in args.stage_concurrency:
+        stage_name, _, limit = item.partition("=")
+        if not limit.isdigit():
+            logging.error(f"Invalid --stage-concurrency value '{item}', expected STAGE=N")
+            sys.exit(1)
+        stage_concurrency[stage_name] = int(limit)
 
     try:
         with open(args.context_file, 'r') as f:
@@ -45,34 +158,61 @@ def main():
         sys.exit(1)
 
     llm_client = None
+    hedged_client = None
+    model_tiers = []
     try:
-        if args.llm_provider == "gemini":
-            google_api_key = os.getenv('GOOGLE_API_KEY')
-            if not google_api_key:
-                logging.warning("GOOGLE_API_KEY environment variable is not set. Gemini calls will fail if not mocked.")
-            llm_client = GeminiClient()
-            llm_client.set_model_from_config(context_data.get("global_settings", {}))
-        elif args.llm_provider == "openai":
-            from openai_client import OpenAIClient # Import only if needed
-            openai_api_key = os.getenv('OPENAI_API_KEY')
-            if not openai_api_key:
-                logging.warning("OPENAI_API_KEY environment variable is not set. OpenAI calls will fail if not mocked.")
-            llm_client = OpenAIClient()
-            llm_client.set_model_from_config(context_data.get("global_settings", {})) # Assuming similar method
+        global_settings = context_data.get("global_settings", {})
+        register_configured_providers(global_settings)
+        if global_settings.get("http_pool"): # Settings apply only to a pool no client has used yet
+            from http_pool import get_http_pool # Imported here: httpx is too slow to load at startup
+            get_http_pool(global_settings["http_pool"])
+        providers = [name.strip() for name in (args.llm_provider or "gemini").split(",") if name.strip()]
+        if global_settings.get("model_tiers"):
+            # Each tier names its own provider, and tiers escalate rather than hedge
+            if len(providers) > 1:
+                logging.error(f"--llm-provider {args.llm_provider} hedges between providers, which model_tiers does not support. "
+                              "Remove one of them.")
+                sys.exit(1)
+            if args.llm_provider:
+                logging.warning(f"Ignoring --llm-provider {args.llm_provider}: model_tiers sets each tier's provider")
+            if global_settings.get("llm_hedging"):
+                logging.warning("Ignoring llm_hedging: it applies to a --llm-provider list, not to model_tiers")
+            # Cheapest model first; a repository escalates when its changes fail validation or tests
+            model_tiers = create_tier_clients(global_settings["model_tiers"], global_settings)
+            llm_client = model_tiers[0]["client"] # Also answers fleet dedup; repos whose shared changes fail escalate too
+            logging.info("Model tiers: " + " -> ".join(f"{tier['name']} ({tier['model']})" for tier in model_tiers))
+        elif len(providers) > 1:
+            llm_client = hedged_client = HedgedLLMClient({name: create_client(name, global_settings) for name in providers},
+                                         global_settings.get("llm_hedging"))
         else:
-            logging.error(f"Unsupported LLM provider: {args.llm_provider}")
-            sys.exit(1)
-
-    except ValueError as e:
+            llm_client = create_client(providers[0], global_settings) # Only the selected provider's SDK is imported
+    except (ValueError, ImportError) as e: # ImportError: the provider's SDK is not installed
         logging.error(f"Error initializing LLM client: {e}")
         sys.exit(1)
     except BaseAppException as e: # Catch our custom app exceptions from client init
         logging.error(f"Error initializing LLM client: {e}")
         sys.exit(1)
 
+    usage_tracker = UsageTracker(context_data.get("global_settings", {}).get("llm_prices"), max_tokens=args.max_tokens_budget)
+    llm_client.usage_tracker = usage_tracker # Set on the provider client, so cache hits cost nothing
+    for tier in model_tiers:
+        tier["client"].usage_tracker = usage_tracker
+
+    llm_cache = None
+    if not args.no_llm_cache:
+        global_settings = context_data.get("global_settings", {})
+        llm_cache = LLMResponseCache(
+            args.llm_cache_dir,
+            max_bytes=int(global_settings.get("llm_cache_max_mb", DEFAULT_MAX_BYTES / (1024 * 1024)) * 1024 * 1024),
+            max_age_seconds=global_settings.get("llm_cache_max_age_days", DEFAULT_MAX_AGE_SECONDS / 86400) * 86400,
+        )
+        llm_client = CachingLLMClient(llm_client, llm_cache)
+        for index, tier in enumerate(model_tiers):
+            tier["client"] = llm_client if index == 0 else CachingLLMClient(tier["client"], llm_cache)
+        logging.info(f"Using LLM response cache at {args.llm_cache_dir}")
+
 
     github_client = GitHubClient()
-    results = {}
 
     if args.repo_path:
         if not args.repo_name:
@@ -91,24 +231,202 @@ def main():
             logging.error("No repositories specified in context file and --repo-path not used.")
             sys.exit(1)
 
-    for repo_name in repos_to_process:
-        current_repo_path_arg = args.repo_path if args.repo_path and repo_name == args.repo_name else None
-
-        processor = RepoProcessor(
-            repo_name,
-            context_data,
-            prompt,
-            llm_client, # Pass the initialized LLM client
-            github_client,
-            repo_path=current_repo_path_arg,
-            keep_temp_dir=args.keep_temp_dir
+    try:
+        default_stages(stage_concurrency) # Validate stage names before doing any work
+    except ValueError as e:
+        logging.error(f"Invalid pipeline configuration: {e}")
+        sys.exit(1)
+
+    try:
+        processors = [
+            RepoProcessor(
+                repo_name,
+                context_data,
+                prompt,
+                llm_client, # Shared LLM client; must be thread-safe
+                github_client,
+                repo_path=args.repo_path if args.repo_path and repo_name == args.repo_name else None,
+                keep_temp_dir=args.keep_temp_dir
+            )
+            for repo_name in repos_to_process
+        ]
+    except ValueError as e: # e.g. an invalid entry in the recipes section
+        logging.error(f"Invalid configuration in {args.context_file}: {e}")
+        sys.exit(1)
+
+    mirror_store = None
+    mirror_users = [processor for processor in processors if processor.clone_strategy == CLONE_STRATEGY_MIRROR]
+    if mirror_users:
+        global_settings = context_data.get("global_settings", {})
+        mirror_store = MirrorStore(
+            args.mirror_dir,
+            max_bytes=int(global_settings.get("mirror_max_gb", DEFAULT_MIRROR_MAX_BYTES / 1024 ** 3) * 1024 ** 3),
+        )
+        for processor in mirror_users:
+            processor.mirror_store = mirror_store # One store, so workers share mirrors and their locks
+
+    for processor in processors:
+        processor.test_runner.log_dir = args.build_log_dir # Only a bounded tail of the output is kept in memory
+
+    for processor in processors:
+        processor.model_tiers = model_tiers
+
+    test_result_cache = None
+    if not args.no_test_cache:
+        global_settings = context_data.get("global_settings", {})
+        test_result_cache = TestResultCache(
+            args.test_cache_dir,
+            max_age_days=global_settings.get("test_cache_max_age_days", DEFAULT_TEST_CACHE_MAX_AGE_DAYS),
+            env_vars=global_settings.get("test_cache_env_vars"),
+            toolchain_commands=global_settings.get("test_cache_toolchain_commands"),
         )
-        processor.process()
-        results[repo_name] = processor.status
+        for processor in processors:
+            processor.test_result_cache = test_result_cache
+            processor.force_tests = args.force_tests
+
+    maven_cache = None
+    maven_users = [processor for processor in processors if is_maven_command(processor.build_command)]
+    if maven_users and not args.no_maven_cache:
+        maven_cache = MavenCache(args.maven_repo)
+        for processor in maven_users:
+            processor.test_runner.maven_cache = maven_cache
+
+    resuming = args.resume or args.retry_failed is not None
+    journal = None
+    if args.journal or resuming: # A first run with --resume finds no journal and starts one
+        journal_path = args.journal or os.path.join(args.journal_dir, f"{os.path.splitext(os.path.basename(args.context_file))[0]}.journal.jsonl")
+        journal = CampaignJournal(journal_path)
+    retry_statuses = set()
+    if args.retry_failed is not None:
+        try:
+            retry_statuses = ({RepoStatus[name] for name in args.retry_failed} if args.retry_failed
+                              else {status for status in RepoStatus if status.name.startswith("ERROR_")})
+        except KeyError as e:
+            logging.error(f"Unknown status for --retry-failed: {e}. Expected one of: {', '.join(s.name for s in RepoStatus)}")
+            sys.exit(1)
+
+    active = processors # Processors with work left in this run
+    if resuming:
+        journal_state = journal.load()
+        active = []
+        for processor in processors:
+            entry = journal_state.get(processor.repo_name)
+            if entry and entry["status"] is not None and (entry["status"] in COMPLETED_STATUSES or entry["status"] not in retry_statuses):
+                processor.status = entry["status"]
+                processor.halted = True
+                logging.info(f"Skipping {processor.repo_name}: {entry['status']} in journal {journal_path}")
+                continue
+            if entry:
+                processor.resume_from(entry["steps"])
+            if not processor.halted:
+                active.append(processor)
+        logging.info(f"Resuming campaign from {journal_path}: {len(active)} of {len(processors)} repositories have work left")
+    fleet_state = None
+    if args.incremental and not args.repo_path: # A local checkout says nothing about the remote
+        fleet_state = FleetStateIndex(args.fleet_state_dir)
+        active_count = len(active)
+        active = fleet_state.select_changed(active) # Before cloning: ls-remote, plus a tree-only fetch if HEAD moved
+        logging.info(f"Incremental run: {len(active)} of {active_count} repositories changed since they were last processed")
+        for processor in active:
+            processor.track_base_revision = True
+    if journal:
+        journal.start(resumed=resuming)
+    metrics = MetricsRecorder()
+    for processor in processors:
+        processor.journal = journal
+        processor.metrics = metrics
+
+    orchestrators = []
+    deduplicator = None
+    done_steps = () # Steps already run for the whole fleet, whose workspaces are still open
+    if args.dedup:
+        # Every repo must be cloned before target files can be compared across the fleet
+        done_steps = ("clone", "branch")
+        run_fleet(active, done_steps, args, stage_concurrency, orchestrators, close_workspaces=False)
+        deduplicator = FleetDeduplicator(llm_client, prompt, normalize_repo_names=args.dedup_normalize_names,
+                                         max_workers=stage_concurrency.get("llm", 4),
+                                         recipe_engine=RecipeEngine(context_data.get("recipes")))
+        # Repositories resumed with recorded file updates already have their LLM output
+        deduplicator.resolve([processor for processor in active if not processor.halted and not processor.precomputed_updates])
+    if maven_cache:
+        # Pre-warm takes the repository's exclusive lock, so it runs once for the union of the changed poms
+        # while no build holds the shared one. Builds then run offline, or online in a private repository.
+        apply_steps = tuple(step for step in RepoProcessor.STEPS[:RepoProcessor.STEPS.index("apply") + 1] if step not in done_steps)
+        run_fleet(active, apply_steps, args, stage_concurrency, orchestrators, open_workspaces=not done_steps, close_workspaces=False)
+        done_steps += apply_steps
+        prewarm_maven(maven_cache, active)
+    remaining_steps = tuple(step for step in RepoProcessor.STEPS if step not in done_steps)
+    run_fleet(active, remaining_steps, args, stage_concurrency, orchestrators, open_workspaces=not done_steps)
+
+    for processor in active:
+        if journal:
+            journal.record_status(processor.repo_name, processor.status) # Also covers halts outside run_steps
+        if fleet_state:
+            fleet_state.record(processor)
+    if fleet_state:
+        fleet_state.save()
+
+    # Report in the order repositories were configured, not completion order
+    results = {processor.repo_name: processor.status for processor in processors}
 
     logging.info("\nProcessing Complete. Summary:")
     for repo_name, status in results.items():
         logging.info(f"{repo_name}: {status}")
+    for processor in processors:
+        metrics.record_status(processor.repo_name, processor.status)
+    metrics.log_summary_table()
+    if args.metrics_json:
+        metrics.export_json(args.metrics_json)
+    if args.metrics_prom:
+        metrics.export_prometheus(args.metrics_prom)
+    usage_tracker.log_summary()
+    if args.usage_json:
+        usage_tracker.export_json(args.usage_json)
+    for orchestrator in orchestrators:
+        orchestrator.log_summary()
+    if fleet_state:
+        stats = fleet_state.stats()
+        logging.info(f"Fleet state: {stats['skipped']} of {stats['checked']} previously finished repositories skipped as unchanged, "
+                     f"{stats['tree_lookups']} tree lookups, {stats['lookup_failures']} failed lookups")
+    if deduplicator:
+        stats = deduplicator.stats()
+        logging.info(f"Fleet dedup: {stats['llm_calls']} LLM calls for {stats['files_seen']} target files "
+                     f"({stats['failed_groups']} group(s) fell back to per-repo calls)")
+    if llm_cache:
+        stats = llm_cache.stats()
+        logging.info(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+                     f"{stats['stores']} stored, {stats['evictions']} evicted")
+    if test_result_cache:
+        stats = test_result_cache.stats()
+        logging.info(f"Test result cache: {stats['hits']} builds skipped, {stats['misses']} run, {stats['stores']} passes recorded")
+    if maven_cache:
+        stats = maven_cache.stats()
+        logging.info(f"Maven cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+                     f"{stats['prewarm_failures']} pre-warm failures, {stats['offline_builds']} offline builds, "
+                     f"{stats['online_builds']} online builds")
+    if mirror_store:
+        mirror_store.prune()
+        mirror_store.evict()
+        stats = mirror_store.stats()
+        logging.info(f"Mirrors: {stats['created']} created, {stats['fetched']} refreshed, "
+                     f"{stats['worktrees']} worktrees, {stats['evicted']} evicted")
+    if hedged_client:
+        hedged_client.log_summary()
+        hedged_client.close()
+    if "http_pool" in sys.modules: # Loaded only if an HTTP-based client (OpenAIClient) was created
+        from http_pool import close_http_pool, get_http_pool
+        stats = get_http_pool().stats()
+        if stats['requests']:
+            logging.info(f"HTTP pool: {stats['requests']} requests over {stats['connections_opened']} connections "
+                         f"({stats['reuse_rate']:.0%} reused), {stats['tls_handshakes']} TLS handshakes, "
+                         f"{stats['http2_responses']} HTTP/2 responses")
+        close_http_pool()
+    for provider, limiter in all_rate_limiters().items():
+        stats = limiter.stats()
+        if stats['calls']:
+            logging.info(f"{provider} rate limiter: {stats['calls']} calls, {stats['retries']} retries "
+                         f"({stats['throttled']} throttled), {stats['wait_seconds']:.1f}s spent waiting, "
+                         f"final concurrency {stats['concurrency_limit']}")
 
 
 if __name__ == "__main__":
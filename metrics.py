@@ -0,0 +1,159 @@
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+METRIC_PREFIX = "tech_debt"
+# Stages timed by RepoProcessor, in the order they run
+STAGES = ("clone", "branch", "read_files", "generate_code", "validate", "write_files", "run_tests", "commit", "push", "pull_request")
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def write_atomically(path: str, text: str):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path) # The Prometheus textfile collector must never read a partial file
+
+
+class MetricsRecorder:
+    """Collects timing spans per repository and stage from all workers, and reports them at the end of a run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {} # {stage: [seconds, ...]} across all repositories
+        self.repos = {} # {repo_name: {"status": str | None, "stages": {stage: seconds}, "tiers": [...] if model tiers are used}}
+
+    @contextmanager
+    def span(self, repo_name: str, stage: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(repo_name, stage, time.monotonic() - started)
+
+    def record(self, repo_name: str, stage: str, seconds: float):
+        with self._lock:
+            self.durations.setdefault(stage, []).append(seconds)
+            stages = self.repos.setdefault(repo_name, {"status": None, "stages": {}})["stages"]
+            stages[stage] = stages.get(stage, 0.0) + seconds # e.g. several file writes per repository
+
+    def record_status(self, repo_name: str, status):
+        with self._lock:
+            self.repos.setdefault(repo_name, {"status": None, "stages": {}})["status"] = status.name
+
+    def record_tier(self, repo_name: str, tier: str, model: str, outcome: str):
+        """Records how one model tier's changes fared for a repository ('passed', 'tests_failed', ...)."""
+        with self._lock:
+            repo = self.repos.setdefault(repo_name, {"status": None, "stages": {}})
+            repo.setdefault("tiers", []).append({"tier": tier, "model": model, "outcome": outcome})
+
+    def record_files(self, repo_name: str, file_changes: dict):
+        """Records which returned target files actually changed: {file_path: "changed" | "unchanged"}."""
+        with self._lock:
+            self.repos.setdefault(repo_name, {"status": None, "stages": {}})["files"] = dict(file_changes)
+
+    def file_summary(self) -> dict:
+        """Changed and unchanged target files across the fleet, and repositories with no changes at all."""
+        summary = {"changed": 0, "unchanged": 0, "unchanged_repositories": 0}
+        with self._lock:
+            for repo in self.repos.values():
+                outcomes = list(repo.get("files", {}).values())
+                summary["changed"] += outcomes.count("changed")
+                summary["unchanged"] += outcomes.count("unchanged")
+                if outcomes and "changed" not in outcomes:
+                    summary["unchanged_repositories"] += 1
+        return summary
+
+    def tier_summary(self) -> dict:
+        """{tier: {outcome: repository count}}, in the order tiers were first used."""
+        summary = {}
+        with self._lock:
+            for repo in self.repos.values():
+                for attempt in repo.get("tiers", []):
+                    outcomes = summary.setdefault(attempt["tier"], {})
+                    outcomes[attempt["outcome"]] = outcomes.get(attempt["outcome"], 0) + 1
+        return summary
+
+    def summary(self) -> dict:
+        """{stage: {"count", "total", "p50", "p95", "max"}}, in pipeline order."""
+        with self._lock:
+            durations = {stage: list(values) for stage, values in self.durations.items()}
+        ordered = [stage for stage in STAGES if stage in durations] + sorted(set(durations) - set(STAGES))
+        return {
+            stage: {
+                "count": len(durations[stage]),
+                "total": sum(durations[stage]),
+                "p50": percentile(durations[stage], 0.5),
+                "p95": percentile(durations[stage], 0.95),
+                "max": max(durations[stage]),
+            }
+            for stage in ordered
+        }
+
+    def export_json(self, path: str):
+        with self._lock:
+            repos = json.loads(json.dumps(self.repos))
+        write_atomically(path, json.dumps({"generated_at": time.time(), "stages": self.summary(), "repositories": repos}, indent=2))
+        logging.info(f"Wrote metrics report to {path}")
+
+    def export_prometheus(self, path: str):
+        name = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines = [
+            f"# HELP {name} Time spent per repository in each processing stage.",
+            f"# TYPE {name} summary",
+        ]
+        max_lines = [
+            f"# HELP {name}_max Longest single span per stage.",
+            f"# TYPE {name}_max gauge",
+        ]
+        for stage, stats in self.summary().items():
+            lines.append(f'{name}{{stage="{stage}",quantile="0.5"}} {stats["p50"]:.6f}')
+            lines.append(f'{name}{{stage="{stage}",quantile="0.95"}} {stats["p95"]:.6f}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {stats["total"]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {stats["count"]}')
+            max_lines.append(f'{name}_max{{stage="{stage}"}} {stats["max"]:.6f}')
+
+        with self._lock:
+            status_counts = {}
+            for repo in self.repos.values():
+                if repo["status"]:
+                    status_counts[repo["status"]] = status_counts.get(repo["status"], 0) + 1
+        status_lines = [
+            f"# HELP {METRIC_PREFIX}_repositories Repositories by final status.",
+            f"# TYPE {METRIC_PREFIX}_repositories gauge",
+        ] + [f'{METRIC_PREFIX}_repositories{{status="{status}"}} {count}' for status, count in sorted(status_counts.items())]
+
+        write_atomically(path, "\n".join(lines + max_lines + status_lines) + "\n")
+        logging.info(f"Wrote Prometheus metrics to {path}")
+
+    def log_summary_table(self):
+        summary = self.summary()
+        if not summary:
+            return
+        logging.info(f"{'stage':<14} {'count':>6} {'p50 s':>9} {'p95 s':>9} {'max s':>9} {'total s':>10}")
+        for stage, stats in summary.items():
+            logging.info(f"{stage:<14} {stats['count']:>6} {stats['p50']:>9.2f} {stats['p95']:>9.2f} "
+                         f"{stats['max']:>9.2f} {stats['total']:>10.1f}")
+        files = self.file_summary()
+        if files["changed"] or files["unchanged"]:
+            logging.info(f"Target files: {files['changed']} changed, {files['unchanged']} unchanged; "
+                         f"{files['unchanged_repositories']} repositories needed no changes")
+        for tier, outcomes in self.tier_summary().items():
+            logging.info(f"Model tier {tier}: " + ", ".join(f"{count} {outcome}" for outcome, count in sorted(outcomes.items())))
+
+
+def maybe_span(metrics: MetricsRecorder | None, repo_name: str, stage: str):
+    """A span when metrics are being collected, otherwise a no-op context."""
+    return metrics.span(repo_name, stage) if metrics else nullcontext()
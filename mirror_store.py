@@ -0,0 +1,159 @@
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+
+from exceptions import GitHubClientError
+from sparse_checkout import run_git
+
+DEFAULT_MIRROR_DIR = ".mirrors"
+DEFAULT_MIRROR_MAX_BYTES = 20 * 1024 * 1024 * 1024 # 20 GB
+
+
+class MirrorStore:
+    """
+    Persistent bare mirrors, one per repository, shared by every run and every worker.
+    Each run gets a lightweight worktree off the mirror instead of a fresh clone, so repeat runs
+    only fetch what changed upstream. Remote branches are fetched into refs/remotes/origin/* so a
+    fetch never touches the branches that worktrees create and check out.
+    """
+
+    def __init__(self, root: str = DEFAULT_MIRROR_DIR, max_bytes: int = DEFAULT_MIRROR_MAX_BYTES):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.mirrors_dir = os.path.join(self.root, "mirrors")
+        self.locks_dir = os.path.join(self.root, "locks")
+        os.makedirs(self.mirrors_dir, exist_ok=True)
+        os.makedirs(self.locks_dir, exist_ok=True)
+        self._stats_lock = threading.Lock()
+        self.created = 0
+        self.fetched = 0
+        self.worktrees = 0
+        self.evicted = 0
+
+    @staticmethod
+    def _mirror_name(repo_url: str) -> str:
+        readable = re.sub(r"[^A-Za-z0-9._-]+", "_", repo_url.rstrip("/").rsplit("/", 1)[-1]).removesuffix(".git")
+        return f"{readable}-{hashlib.sha256(repo_url.encode('utf-8')).hexdigest()[:12]}"
+
+    def mirror_path(self, repo_url: str) -> str:
+        return os.path.join(self.mirrors_dir, f"{self._mirror_name(repo_url)}.git")
+
+    @contextmanager
+    def _locked(self, mirror_path: str, blocking: bool = True):
+        """Exclusive flock per mirror; works across threads (separate descriptors) and across processes."""
+        lock_path = os.path.join(self.locks_dir, f"{os.path.basename(mirror_path)}.lock")
+        with open(lock_path, 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _ensure_mirror(self, repo_url: str, mirror_path: str):
+        """Creates the mirror on first use, otherwise fetches new commits. Caller holds the mirror lock."""
+        if not os.path.isdir(mirror_path):
+            logging.info(f"Creating mirror of {repo_url} in {mirror_path}")
+            tmp_path = f"{mirror_path}.tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True) # Left over from an interrupted clone
+            run_git(["clone", "--bare", "--quiet", repo_url, tmp_path])
+            run_git(["config", "remote.origin.fetch", "+refs/heads/*:refs/remotes/origin/*"], cwd=tmp_path)
+            os.replace(tmp_path, mirror_path)
+            self._count("created")
+        else:
+            logging.debug(f"Fetching updates for mirror {mirror_path}")
+            self._count("fetched")
+        run_git(["fetch", "--prune", "--quiet", "origin"], cwd=mirror_path)
+
+    def create_worktree(self, repo_url: str, dest: str):
+        """Refreshes the mirror and checks out the remote's default branch at 'dest' (detached)."""
+        mirror_path = self.mirror_path(repo_url)
+        try:
+            with self._locked(mirror_path):
+                self._ensure_mirror(repo_url, mirror_path)
+                default_branch = run_git(["symbolic-ref", "--short", "HEAD"], cwd=mirror_path).strip()
+                run_git(["worktree", "add", "--detach", "--quiet", dest, f"refs/remotes/origin/{default_branch}"], cwd=mirror_path)
+        except (GitHubClientError, OSError) as e:
+            raise GitHubClientError(f"Failed to clone {repo_url} from mirror: {e}") from e
+        os.utime(mirror_path) # Marks the mirror as recently used for eviction
+        self._count("worktrees")
+        logging.info(f"Created worktree for {repo_url} at {dest} ({default_branch})")
+
+    def remove_worktree(self, repo_url: str, dest: str):
+        mirror_path = self.mirror_path(repo_url)
+        with self._locked(mirror_path):
+            try:
+                run_git(["worktree", "remove", "--force", dest], cwd=mirror_path)
+            except GitHubClientError as e:
+                logging.warning(f"Failed to remove worktree {dest}: {e}")
+                run_git(["worktree", "prune"], cwd=mirror_path)
+
+    def _active_worktrees(self, mirror_path: str) -> int:
+        output = run_git(["worktree", "list", "--porcelain"], cwd=mirror_path)
+        return sum(1 for line in output.splitlines() if line.startswith("worktree ")) - 1 # The bare repo itself is listed
+
+    def prune(self):
+        """Drops worktree records whose directories are gone (e.g. a run that crashed before cleaning up)."""
+        for name in os.listdir(self.mirrors_dir):
+            mirror_path = os.path.join(self.mirrors_dir, name)
+            if not name.endswith(".git"):
+                continue
+            with self._locked(mirror_path, blocking=False) as acquired:
+                if acquired:
+                    try:
+                        run_git(["worktree", "prune"], cwd=mirror_path)
+                    except GitHubClientError as e:
+                        logging.warning(f"Failed to prune worktrees of {mirror_path}: {e}")
+
+    @staticmethod
+    def _disk_usage(path: str) -> int:
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def evict(self):
+        """Removes least recently used mirrors until the store fits in max_bytes. Mirrors in use are kept."""
+        mirrors = []
+        for name in os.listdir(self.mirrors_dir):
+            mirror_path = os.path.join(self.mirrors_dir, name)
+            if name.endswith(".git") and os.path.isdir(mirror_path):
+                mirrors.append((os.stat(mirror_path).st_mtime, self._disk_usage(mirror_path), mirror_path))
+
+        total_bytes = sum(size for _, size, _ in mirrors)
+        for _, size, mirror_path in sorted(mirrors): # Least recently used first
+            if total_bytes <= self.max_bytes:
+                break
+            with self._locked(mirror_path, blocking=False) as acquired:
+                if not acquired:
+                    continue # Another worker is fetching or checking out from it
+                try:
+                    run_git(["worktree", "prune"], cwd=mirror_path)
+                    if self._active_worktrees(mirror_path) > 0:
+                        continue
+                except GitHubClientError:
+                    pass # A broken mirror is safe to remove
+                logging.info(f"Evicting mirror {mirror_path} ({size / (1024 * 1024):.1f} MB)")
+                shutil.rmtree(mirror_path, ignore_errors=True)
+                total_bytes -= size
+                self._count("evicted")
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {"created": self.created, "fetched": self.fetched, "worktrees": self.worktrees, "evicted": self.evicted}
@@ -1,29 +1,99 @@
+import asyncio
 import logging
 import json
 import os
-from openai import OpenAI, APIError # Import APIError for specific OpenAI errors
-from exceptions import OpenAIClientError, OpenAIResponseError # Import custom exceptions
+from contextlib import nullcontext
+from openai import OpenAI, AsyncOpenAI, APIError, APIConnectionError # Import APIError for specific OpenAI errors
+from exceptions import LLMClientError, LLMResponseError # Import custom exceptions
+from file_edits import FILE_EDITS_SCHEMA, EDITS_MODE_INSTRUCTION, EDITS_OUTPUT_RATIO, RESPONSE_MODE_EDITS
+from file_validators import VALIDATION_FEEDBACK_INSTRUCTION
+from stream_json import UpdatedFilesStreamParser
+from rate_limiter import estimate_tokens, get_rate_limiter
+from usage_tracker import LLMCallUsage, openai_usage
+from http_pool import get_http_pool
 
 MAX_CONTINUATION_ATTEMPTS = 3 # Max attempts for continuation
+CONTINUATION_PROMPT = "The previous response was incomplete or not valid JSON. Please continue generating the JSON output from where you left off, ensuring the final output is a single, complete, and valid JSON object matching the schema. If you were in the middle of a string, continue that string. If you were in the middle of a list or object, continue that structure."
 
 class OpenAIClient:
+    provider_name = "openai"
+
     def __init__(self):
         api_key = os.getenv('OPENAI_API_KEY')
         if not api_key:
             raise ValueError("The OPENAI_API_KEY environment variable is not set.")
-        self.client = OpenAI(api_key=api_key)
+        self._api_key = api_key
+        # Keep-alive connections shared across workers. max_retries=0: ProviderRateLimiter is the only layer that retries,
+        # so it sees every 429 (for its concurrency control and Retry-After) and a call never multiplies into SDK retries
+        self.client = OpenAI(api_key=api_key, http_client=get_http_pool().client(), max_retries=0)
+        self._async_client = None # AsyncOpenAI for agenerate_code, bound to the event loop it was created on
+        self._async_client_loop = None
+        self.call_timeout_seconds = None # Default per-call timeout for agenerate_code ('llm_call_timeout_seconds')
         # Get model from env, then context (passed later or global), then default
         self.model_name = os.getenv('OPENAI_MODEL_NAME', "gpt-4o-2024-08-06") # Default model
+        self.stream = True # Parses the response as it arrives; "llm_streaming": false turns it off
+        self.rate_limiter = get_rate_limiter(self.provider_name) # Shared by every worker in the process
+        self.usage_tracker = None # UsageTracker for token, latency and cost accounting
 
     def set_model_from_config(self, global_settings: dict):
         """Allows setting model name from config if not set by env var."""
         if 'OPENAI_MODEL_NAME' not in os.environ: # Env var takes precedence
             self.model_name = global_settings.get("openai_model_name", self.model_name)
-        logging.info(f"Using OpenAI model: {self.model_name}")
+        self.stream = global_settings.get("llm_streaming", self.stream)
+        self.call_timeout_seconds = global_settings.get("llm_call_timeout_seconds", self.call_timeout_seconds)
+        self.rate_limiter = get_rate_limiter(self.provider_name, global_settings.get("llm_rate_limits", {}).get(self.provider_name))
+        logging.info(f"Using OpenAI model: {self.model_name}{' (streaming)' if self.stream else ''}")
+
+    def _track_usage(self, context: dict, estimated_tokens: int):
+        if self.usage_tracker:
+            return self.usage_tracker.track(context.get('repository', ''), self.provider_name, self.model_name, estimated_tokens)
+        return nullcontext(LLMCallUsage())
 
+    def _get_async_client(self) -> AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            # Same endpoint as the sync client, including an OPENAI_BASE_URL override read at construction
+            self._async_client = AsyncOpenAI(api_key=self._api_key, base_url=self.client.base_url,
+                                             http_client=get_http_pool().async_client(), max_retries=0)
+            self._async_client_loop = loop
+        return self._async_client
 
-    def generate_code(self, prompt: str, context: dict) -> dict:
+    def generate_code(self, prompt: str, context: dict, on_file=None) -> dict:
+        """
+        Returns {"updated_files": [...]}. When streaming (the default), on_file (if given) is called
+        with each 'updated_files' entry as soon as it has been fully received.
+        """
         logging.debug("Generating code with OpenAI API")
+        messages, json_schema, schema_name, estimated_tokens = self._build_request(prompt, context)
+
+        # Refused up front (BudgetExceededError) if the campaign's token budget would be overrun
+        with self._track_usage(context, estimated_tokens) as usage:
+            if self.stream:
+                return self._generate_streaming(messages, json_schema, schema_name, on_file, usage)
+            return self._generate(messages, json_schema, schema_name, usage)
+
+    async def agenerate_code(self, prompt: str, context: dict, on_file=None, timeout: float | None = None) -> dict:
+        """
+        Async generate_code on the AsyncOpenAI SDK, with the same response and exceptions. Many
+        calls can be in flight on one event loop without a thread each. timeout (default:
+        'llm_call_timeout_seconds') bounds the whole call, continuations included, and raises
+        LLMClientError. Cancelling the task cancels the HTTP request.
+        """
+        logging.debug("Generating code with OpenAI API (async)")
+        messages, json_schema, schema_name, estimated_tokens = self._build_request(prompt, context)
+        timeout = timeout if timeout is not None else self.call_timeout_seconds
+
+        with self._track_usage(context, estimated_tokens) as usage:
+            try:
+                async with asyncio.timeout(timeout):
+                    if self.stream:
+                        return await self._agenerate_streaming(messages, json_schema, schema_name, on_file, usage)
+                    return await self._agenerate(messages, json_schema, schema_name, usage)
+            except TimeoutError as e:
+                raise LLMClientError(f"OpenAI call timed out after {timeout:.0f}s") from e
+
+    def _build_request(self, prompt: str, context: dict) -> tuple[list, dict, str, int]:
+        """Returns (messages, json_schema, schema_name, estimated_tokens) for a generate_code call."""
 
         # Allow context to override model_name if not set by env
         # This is now handled by set_model_from_config, called externally if needed
@@ -68,85 +138,230 @@ class OpenAIClient:
             "additionalProperties": False
         }
 
+        schema_name = "updated_files_schema"
+        if context.get("response_mode") == RESPONSE_MODE_EDITS:
+            # Ask for search/replace edits instead of full file contents to cut output tokens
+            json_schema = FILE_EDITS_SCHEMA
+            schema_name = "file_edits_schema"
+            user_prompt = f"{user_prompt}\n\n{EDITS_MODE_INSTRUCTION}"
+        if context.get("validation_feedback"): # A retry after the previous answer failed local validation
+            user_prompt = f"{user_prompt}\n\n{VALIDATION_FEEDBACK_INSTRUCTION}"
+
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ]
 
+        return messages, json_schema, schema_name, self._estimate_tokens(messages, json_schema)
+
+    @staticmethod
+    def _estimate_tokens(messages: list, json_schema: dict) -> int:
+        """Prompt plus expected completion tokens, reserved with the rate limiter on every path (plain, streaming, continuation)."""
+        output_ratio = EDITS_OUTPUT_RATIO if json_schema is FILE_EDITS_SCHEMA else 1.0
+        return estimate_tokens("".join(message["content"] for message in messages), output_ratio)
+
+    def _completion_request(self, messages: list, json_schema: dict, schema_name: str, attempt: int = 1) -> dict:
+        request = {"model": self.model_name, "messages": messages, "temperature": 0}
+        if attempt == 1:
+            # Structured output forces a fresh JSON document, so continuations must be free-form
+            request["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": schema_name,
+                    "schema": json_schema,
+                    "strict": True # Request strict adherence
+                }
+            }
+        return request
+
+    def _handle_attempt(self, response, attempt: int, full_response_content: str, messages: list, usage: LLMCallUsage) -> tuple[dict | None, str]:
+        """
+        Processes one non-streaming response. Returns (document, accumulated content); the document
+        is None when the output was truncated (finish_reason == "length") and a continuation request
+        has been appended to messages. The accumulated content is parsed only once it is complete.
+        """
+        logging.debug(f"Raw OpenAI response object: {response}")
+        usage.add(*openai_usage(getattr(response, "usage", None))) # Continuations are billed too
+
+        choice = response.choices[0]
+        assistant_content = choice.message.content or ""
+        full_response_content += assistant_content
+        logging.debug(f"Assistant's content (attempt {attempt}): {assistant_content}")
+
+        if choice.finish_reason == "length":
+            if attempt == MAX_CONTINUATION_ATTEMPTS:
+                raise LLMResponseError(f"OpenAI output still truncated after {MAX_CONTINUATION_ATTEMPTS} attempts. Content so far: {full_response_content[:500]}")
+            logging.warning(f"OpenAI output truncated on attempt {attempt}; requesting continuation")
+            messages.append({"role": "assistant", "content": assistant_content})
+            messages.append({"role": "user", "content": CONTINUATION_PROMPT})
+            return None, full_response_content
+        if choice.finish_reason == "content_filter":
+            raise LLMResponseError("OpenAI stopped the response with finish_reason 'content_filter'.")
+
+        try:
+            return json.loads(full_response_content), full_response_content
+        except json.JSONDecodeError as e:
+            raise LLMResponseError(f"OpenAI returned invalid JSON (finish_reason={choice.finish_reason!r}): {full_response_content[:500]}") from e
+
+    def _generate(self, messages: list, json_schema: dict, schema_name: str, usage: LLMCallUsage) -> dict:
         full_response_content = ""
-        continuation_prompt = "The previous response was incomplete or not valid JSON. Please continue generating the JSON output from where you left off, ensuring the final output is a single, complete, and valid JSON object matching the schema. If you were in the middle of a string, continue that string. If you were in the middle of a list or object, continue that structure."
 
         for attempt in range(1, MAX_CONTINUATION_ATTEMPTS + 1):
             logging.debug(f"OpenAI API Call Attempt #{attempt}")
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=messages,
-                    response_format={
-                        "type": "json_schema",
-                        "json_schema": {
-                            "name": "updated_files_schema",
-                            "schema": json_schema,
-                            "strict": True # Request strict adherence
-                        }
-                    },
-                    temperature=0,
+                # Throttling and transient failures are retried (with backoff) inside the rate limiter
+                response = self.rate_limiter.call(
+                    lambda: self.client.chat.completions.create(**self._completion_request(messages, json_schema, schema_name, attempt)),
+                    self._estimate_tokens(messages, json_schema),
+                    retryable_errors=(APIConnectionError,),
                 )
-                logging.debug(f"Raw OpenAI response object: {response}")
-
-                assistant_message = response.choices[0].message
-                assistant_content = assistant_message.content
-
-                if not assistant_content: # Handle empty content from LLM
-                    logging.warning("OpenAI returned empty content.")
-                    if attempt < MAX_CONTINUATION_ATTEMPTS:
-                        messages.append({"role": "assistant", "content": ""}) # Add empty assistant message
-                        messages.append({"role": "user", "content": continuation_prompt})
-                        continue
-                    else:
-                        raise OpenAIResponseError("OpenAI returned empty content after multiple attempts.")
-
-                logging.debug(f"Assistant's content (attempt {attempt}): {assistant_content}")
-
-                # It's better to try parsing the current piece if the LLM is supposed to return full JSON each time.
-                # However, with the continuation prompt, we are asking it to complete, so we append.
-                current_potential_json = full_response_content + assistant_content
-
-                # Try to parse the accumulated content
-                try:
-                    parsed_json = json.loads(current_potential_json)
-                    # If parsing succeeds, assume it's complete if no explicit "Continue"
-                    if "continue" not in assistant_content.lower(): # More robust check
-                        logging.debug("JSON parsed successfully and no explicit continuation cue.")
-                        return parsed_json
-                    else:
-                        logging.debug("JSON parsed but 'continue' cue found. Will attempt continuation.")
-                        full_response_content = current_potential_json # Save successfully parsed part
-                        messages.append({"role": "assistant", "content": assistant_content})
-                        messages.append({"role": "user", "content": continuation_prompt})
-                        # Continue to next attempt
-                except json.JSONDecodeError:
-                    logging.warning(f"JSON parsing failed for accumulated content (attempt {attempt}). Content so far: '{current_potential_json[:500]}...'")
-                    full_response_content = current_potential_json # Keep accumulating
-                    if attempt < MAX_CONTINUATION_ATTEMPTS:
-                        messages.append({"role": "assistant", "content": assistant_content}) # Add what we got
-                        messages.append({"role": "user", "content": continuation_prompt})
-                        # Continue to next attempt
-                    else:
-                        raise OpenAIResponseError(f"Failed to get complete JSON after {MAX_CONTINUATION_ATTEMPTS} attempts. Last content: {current_potential_json[:500]}")
+                document, full_response_content = self._handle_attempt(response, attempt, full_response_content, messages, usage)
+                if document is not None:
+                    return document
 
+            except LLMResponseError:
+                raise
             except APIError as e:
+                # The rate limiter has already retried transient errors; anything left is not worth repeating
                 logging.error(f"OpenAI API error on attempt {attempt}: {e}", exc_info=True)
-                if attempt == MAX_CONTINUATION_ATTEMPTS:
-                    raise OpenAIClientError(f"OpenAI API error after {MAX_CONTINUATION_ATTEMPTS} attempts: {e}") from e
-                # Potentially add a small delay before retrying for transient API errors
-                # time.sleep(1)
+                raise LLMClientError(f"OpenAI API error on attempt {attempt}: {e}") from e
             except Exception as e: # Catch other unexpected errors during API call
                 logging.error(f"Unexpected error during OpenAI API call on attempt {attempt}: {e}", exc_info=True)
                 if attempt == MAX_CONTINUATION_ATTEMPTS:
-                    raise OpenAIClientError(f"Unexpected error after {MAX_CONTINUATION_ATTEMPTS} attempts: {e}") from e
+                    raise LLMClientError(f"Unexpected error after {MAX_CONTINUATION_ATTEMPTS} attempts: {e}") from e
 
         # If loop finishes without returning/raising, something went wrong with continuation logic
-        raise OpenAIResponseError(f"Failed to obtain a complete JSON response after {MAX_CONTINUATION_ATTEMPTS} attempts. Final accumulated content: {full_response_content[:500]}")
+        raise LLMResponseError(f"Failed to obtain a complete JSON response after {MAX_CONTINUATION_ATTEMPTS} attempts. Final accumulated content: {full_response_content[:500]}")
+
+    async def _agenerate(self, messages: list, json_schema: dict, schema_name: str, usage: LLMCallUsage) -> dict:
+        client = self._get_async_client()
+        full_response_content = ""
+        for attempt in range(1, MAX_CONTINUATION_ATTEMPTS + 1):
+            logging.debug(f"OpenAI async API call attempt #{attempt}")
+            try:
+                response = await self.rate_limiter.acall(
+                    lambda: client.chat.completions.create(**self._completion_request(messages, json_schema, schema_name, attempt)),
+                    self._estimate_tokens(messages, json_schema),
+                    retryable_errors=(APIConnectionError,),
+                )
+            except APIError as e:
+                raise LLMClientError(f"OpenAI API error on attempt {attempt}: {e}") from e
+            document, full_response_content = self._handle_attempt(response, attempt, full_response_content, messages, usage)
+            if document is not None:
+                return document
+        raise LLMResponseError(f"Failed to obtain a complete JSON response after {MAX_CONTINUATION_ATTEMPTS} attempts. Final accumulated content: {full_response_content[:500]}")
+
+    # _response_incomplete is removed as its logic is now integrated into the loop
+
+    def _generate_streaming(self, messages: list, json_schema: dict, schema_name: str, on_file=None,
+                            usage: LLMCallUsage | None = None) -> dict:
+        """
+        Streams the response through an incremental parser instead of parsing the accumulated text
+        after every attempt. Truncation is detected from finish_reason == "length"; only then is the
+        model asked to continue, and the parser simply carries on with the continuation's text.
+        """
+        parser = UpdatedFilesStreamParser()
+        usage = usage or LLMCallUsage()
+
+        for attempt in range(1, MAX_CONTINUATION_ATTEMPTS + 1):
+            logging.debug(f"OpenAI streaming call attempt #{attempt}")
+            request = self._streaming_request(messages, json_schema, schema_name, attempt)
+            state = {"segment": [], "finish_reason": None, "usage": None}
+            try:
+                # Only opening the stream is retried; a partly consumed stream cannot be replayed
+                stream = self.rate_limiter.call(
+                    lambda: self.client.chat.completions.create(**request),
+                    self._estimate_tokens(request["messages"], json_schema),
+                    retryable_errors=(APIConnectionError,),
+                    stream=True, # The concurrency slot is held until the stream has been read
+                )
+                with stream: # Closes the HTTP response, freeing its host slot, if a chunk handler raises mid-stream
+                    for chunk in stream:
+                        self._handle_chunk(chunk, state, parser, usage, on_file)
+                usage.add(*openai_usage(state["usage"]))
+            except APIError as e:
+                raise LLMClientError(f"OpenAI API error during streaming attempt {attempt}: {e}") from e
+
+            if self._stream_finished(state, parser, attempt):
+                return parser.document()
+            messages = self._continuation_messages(messages, state)
+
+        raise LLMResponseError(f"OpenAI output still truncated after {MAX_CONTINUATION_ATTEMPTS} attempts. Content so far: {parser.text()[:500]}")
+
+    async def _agenerate_streaming(self, messages: list, json_schema: dict, schema_name: str, on_file=None,
+                                   usage: LLMCallUsage | None = None) -> dict:
+        client = self._get_async_client()
+        parser = UpdatedFilesStreamParser()
+        usage = usage or LLMCallUsage()
 
-    # _response_incomplete is removed as its logic is now integrated into the loop
\ No newline at end of file
+        for attempt in range(1, MAX_CONTINUATION_ATTEMPTS + 1):
+            logging.debug(f"OpenAI async streaming call attempt #{attempt}")
+            request = self._streaming_request(messages, json_schema, schema_name, attempt)
+            state = {"segment": [], "finish_reason": None, "usage": None}
+            try:
+                stream = await self.rate_limiter.acall(
+                    lambda: client.chat.completions.create(**request),
+                    self._estimate_tokens(request["messages"], json_schema),
+                    retryable_errors=(APIConnectionError,),
+                    stream=True, # The concurrency slot is held until the stream has been read
+                )
+                async with stream: # Closes the HTTP response if the task is cancelled mid-stream
+                    async for chunk in stream:
+                        self._handle_chunk(chunk, state, parser, usage, on_file)
+                usage.add(*openai_usage(state["usage"]))
+            except APIError as e:
+                raise LLMClientError(f"OpenAI API error during streaming attempt {attempt}: {e}") from e
+
+            if self._stream_finished(state, parser, attempt):
+                return parser.document()
+            messages = self._continuation_messages(messages, state)
+
+        raise LLMResponseError(f"OpenAI output still truncated after {MAX_CONTINUATION_ATTEMPTS} attempts. Content so far: {parser.text()[:500]}")
+
+    def _streaming_request(self, messages: list, json_schema: dict, schema_name: str, attempt: int) -> dict:
+        request = {"model": self.model_name, "messages": messages, "temperature": 0, "stream": True,
+                   "stream_options": {"include_usage": True}} # Usage arrives in a final chunk without choices
+        if attempt == 1:
+            # Structured output forces a fresh JSON document, so continuations must be free-form
+            request["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": schema_name, "schema": json_schema, "strict": True}
+            }
+        return request
+
+    @staticmethod
+    def _handle_chunk(chunk, state: dict, parser: UpdatedFilesStreamParser, usage: LLMCallUsage, on_file=None):
+        if getattr(chunk, "usage", None):
+            state["usage"] = chunk.usage
+        if not chunk.choices:
+            return
+        choice = chunk.choices[0]
+        delta = choice.delta.content if choice.delta else None
+        if delta:
+            usage.mark_first_token()
+            state["segment"].append(delta)
+            for file_info in parser.feed(delta):
+                if on_file:
+                    on_file(file_info)
+        if choice.finish_reason:
+            state["finish_reason"] = choice.finish_reason
+
+    @staticmethod
+    def _stream_finished(state: dict, parser: UpdatedFilesStreamParser, attempt: int) -> bool:
+        """True when the stream completed normally; False when it was truncated and should be continued."""
+        finish_reason = state["finish_reason"]
+        if finish_reason == "stop":
+            return True
+        if finish_reason == "content_filter":
+            raise LLMResponseError("OpenAI stopped the response with finish_reason 'content_filter'.")
+        if finish_reason != "length":
+            raise LLMResponseError(f"OpenAI stream ended unexpectedly (finish_reason={finish_reason!r}).")
+        logging.warning(f"OpenAI output truncated on attempt {attempt} after {parser.items_emitted} complete file(s); requesting continuation")
+        return False
+
+    @staticmethod
+    def _continuation_messages(messages: list, state: dict) -> list:
+        return messages + [
+            {"role": "assistant", "content": "".join(state["segment"])},
+            {"role": "user", "content": CONTINUATION_PROMPT},
+        ]
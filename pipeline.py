@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from log_context import repo_log_context
+from status_enums import RepoStatus
+
+
+class PipelineStage:
+    """A group of RepoProcessor steps that share a concurrency limit, plus its timing counters."""
+
+    def __init__(self, name: str, steps: tuple, concurrency: int):
+        if concurrency < 1:
+            raise ValueError(f"Concurrency for stage '{name}' must be at least 1, got {concurrency}")
+        self.name = name
+        self.steps = steps
+        self.concurrency = concurrency
+        self.items_processed = 0
+        self.busy_seconds = 0.0 # Total time workers spent running steps
+        self.queue_wait_seconds = 0.0 # Total time items sat in this stage's input queue
+        self.max_queue_wait_seconds = 0.0
+
+
+def default_stages(overrides: dict | None = None) -> list[PipelineStage]:
+    """
+    Default stage layout: many concurrent clones, a few LLM calls, one build per CPU.
+    overrides maps a stage name to a concurrency limit.
+    """
+    overrides = overrides or {}
+    cpu_count = os.cpu_count() or 1
+    defaults = [
+        ("clone", ("clone", "branch"), 16),
+        ("llm", ("apply",), 4),
+        ("build", ("test",), cpu_count),
+        ("publish", ("publish",), 4),
+    ]
+    unknown = set(overrides) - {name for name, _, _ in defaults}
+    if unknown:
+        raise ValueError(f"Unknown pipeline stage(s): {', '.join(sorted(unknown))}")
+    return [PipelineStage(name, steps, overrides.get(name, concurrency)) for name, steps, concurrency in defaults]
+
+
+class PipelineOrchestrator:
+    """
+    Runs RepoProcessors through a series of stages connected by bounded queues, so that
+    different repositories can be cloning, waiting on the LLM and building at the same time.
+    """
+
+    def __init__(self, stages: list[PipelineStage], queue_size: int = 8):
+        if not stages:
+            raise ValueError("PipelineOrchestrator needs at least one stage.")
+        self.stages = stages
+        self.queue_size = queue_size
+        self.wall_seconds = 0.0
+        self.open_workspaces = True
+        self.close_workspaces = True
+
+    def run(self, processors: list, open_workspaces: bool = True, close_workspaces: bool = True):
+        """
+        Processes all repositories through every stage. Blocks until the pipeline drains.
+        Pass open_workspaces/close_workspaces=False when a run covers only part of the steps
+        and the workspaces must survive into a later run.
+        """
+        self.open_workspaces = open_workspaces
+        self.close_workspaces = close_workspaces
+        asyncio.run(self._run(processors))
+
+    async def _run(self, processors: list):
+        total_workers = sum(stage.concurrency for stage in self.stages)
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=total_workers, thread_name_prefix="pipeline-worker")
+        loop.set_default_executor(executor) # Stage work runs in threads; size the pool to fit every worker
+
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        started_at = time.monotonic()
+        try:
+            await asyncio.gather(
+                self._feed(processors, queues[0], self.stages[0].concurrency),
+                *(self._run_stage(index, queues) for index in range(len(self.stages))),
+            )
+        finally:
+            self.wall_seconds = time.monotonic() - started_at
+            executor.shutdown(wait=True)
+
+    async def _feed(self, processors: list, queue: asyncio.Queue, worker_count: int):
+        for processor in processors:
+            await queue.put((processor, time.monotonic()))
+        for _ in range(worker_count):
+            await queue.put(None) # One sentinel per worker
+
+    async def _run_stage(self, index: int, queues: list):
+        stage = self.stages[index]
+        await asyncio.gather(*(self._stage_worker(index, queues) for _ in range(stage.concurrency)))
+        if index + 1 < len(self.stages):
+            for _ in range(self.stages[index + 1].concurrency):
+                await queues[index + 1].put(None)
+
+    async def _stage_worker(self, index: int, queues: list):
+        stage = self.stages[index]
+        is_last_stage = index == len(self.stages) - 1
+        while True:
+            item = await queues[index].get()
+            if item is None:
+                return
+            processor, enqueued_at = item
+            waited = time.monotonic() - enqueued_at
+            stage.queue_wait_seconds += waited
+            stage.max_queue_wait_seconds = max(stage.max_queue_wait_seconds, waited)
+
+            started = time.monotonic()
+            should_continue = await asyncio.to_thread(self._run_steps, stage, processor, index == 0 and self.open_workspaces)
+            stage.busy_seconds += time.monotonic() - started
+            stage.items_processed += 1
+
+            if should_continue and not is_last_stage:
+                await queues[index + 1].put((processor, time.monotonic()))
+            elif self.close_workspaces:
+                await asyncio.to_thread(self._finish, processor)
+
+    @staticmethod
+    def _run_steps(stage: PipelineStage, processor, open_workspace: bool) -> bool:
+        with repo_log_context(processor.repo_name):
+            try:
+                if open_workspace:
+                    logging.info(f"Processing repository {processor.repo_name}")
+                    processor.open_workspace()
+                return processor.run_steps(stage.steps)
+            except Exception as e: # run_steps handles step errors; this keeps a worker alive on anything else
+                logging.error(f"Stage '{stage.name}' failed unexpectedly for {processor.repo_name}: {e}", exc_info=True)
+                processor.status = RepoStatus.ERROR_GENERIC
+                processor.halted = True
+                return False
+
+    @staticmethod
+    def _finish(processor):
+        with repo_log_context(processor.repo_name):
+            processor.close_workspace()
+
+    def summary(self) -> list[dict]:
+        """Per-stage utilization (busy time / available worker time) and queue wait statistics."""
+        rows = []
+        for stage in self.stages:
+            capacity = stage.concurrency * self.wall_seconds
+            rows.append({
+                "stage": stage.name,
+                "concurrency": stage.concurrency,
+                "items": stage.items_processed,
+                "utilization": stage.busy_seconds / capacity if capacity else 0.0,
+                "busy_seconds": stage.busy_seconds,
+                "avg_queue_wait_seconds": stage.queue_wait_seconds / stage.items_processed if stage.items_processed else 0.0,
+                "max_queue_wait_seconds": stage.max_queue_wait_seconds,
+            })
+        return rows
+
+    def log_summary(self):
+        logging.info(f"Pipeline stage summary (wall time {self.wall_seconds:.1f}s):")
+        for row in self.summary():
+            logging.info(
+                f"  {row['stage']:<8} workers={row['concurrency']:<3} items={row['items']:<4} "
+                f"utilization={row['utilization']:.0%} busy={row['busy_seconds']:.1f}s "
+                f"queue_wait avg={row['avg_queue_wait_seconds']:.2f}s max={row['max_queue_wait_seconds']:.2f}s"
+            )
@@ -0,0 +1,382 @@
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+
+# Defaults per provider; override with the 'llm_rate_limits' global setting, e.g.
+# "llm_rate_limits": {"openai": {"requests_per_minute": 500, "tokens_per_minute": 300000, "max_concurrency": 8}}
+DEFAULT_LIMITS = {
+    "requests_per_minute": 60,
+    "tokens_per_minute": 200000,
+    "max_concurrency": 8,
+    "max_retries": 6,
+    "base_delay_seconds": 1.0,
+    "max_delay_seconds": 60.0,
+}
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+CHARS_PER_TOKEN = 4 # Rough estimate used to debit the token bucket before a call
+ASYNC_SLOT_POLL_SECONDS = 0.05 # Async callers can't block on the slot condition, so they poll for a free slot
+
+
+def estimate_tokens(text: str, expected_output_ratio: float = 1.0) -> int:
+    """Estimates prompt plus completion tokens. Full-content responses are roughly as long as the input files."""
+    prompt_tokens = len(text) // CHARS_PER_TOKEN + 1
+    return int(prompt_tokens * (1 + expected_output_ratio))
+
+
+def _status_code(exc: Exception) -> int | None:
+    # openai exposes status_code; google.api_core exceptions expose an HTTP code as .code
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def retry_after_seconds(exc: Exception) -> float | None:
+    """Reads Retry-After (seconds or HTTP date) from the error's HTTP response, if it has one."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc: Exception, retryable_errors: tuple = ()) -> bool:
+    if retryable_errors and isinstance(exc, retryable_errors):
+        return True
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS_CODES
+
+
+class TokenBucket:
+    """Classic token bucket: holds up to 'capacity' tokens and refills continuously at 'per_minute'."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Debits 'amount' (possibly going negative) and returns how long the caller must wait before using it."""
+        self._refill(now)
+        amount = min(amount, self.capacity) # A single oversized request must still be able to run
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class _SlotHoldingStream:
+    """
+    Wraps a streamed response so the caller's concurrency slot is held until the stream has been
+    read to the end or closed; a request is in flight until its last chunk arrives.
+    """
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+        self._entered = False # Inside a with block, the slot is released on exit rather than when iteration stops
+
+    def _done(self, succeeded: bool):
+        release, self._release = self._release, None
+        if release:
+            release(succeeded=succeeded)
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        except GeneratorExit: # An unfinished iteration was abandoned
+            if not self._entered:
+                self._done(False)
+            raise
+        except BaseException:
+            self._done(False)
+            raise
+        self._done(True)
+
+    def __enter__(self):
+        if hasattr(self._stream, "__enter__"):
+            self._stream.__enter__()
+        self._entered = True
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if hasattr(self._stream, "__exit__"):
+                return self._stream.__exit__(exc_type, exc, tb)
+        finally:
+            self._done(exc_type is None)
+
+    def close(self):
+        try:
+            if hasattr(self._stream, "close"):
+                self._stream.close()
+        finally:
+            self._done(False)
+
+
+class _SlotHoldingAsyncStream(_SlotHoldingStream):
+    """Async counterpart of _SlotHoldingStream."""
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except GeneratorExit:
+            if not self._entered:
+                self._done(False)
+            raise
+        except BaseException:
+            self._done(False)
+            raise
+        self._done(True)
+
+    async def __aenter__(self):
+        if hasattr(self._stream, "__aenter__"):
+            await self._stream.__aenter__()
+        self._entered = True
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if hasattr(self._stream, "__aexit__"):
+                return await self._stream.__aexit__(exc_type, exc, tb)
+        finally:
+            self._done(exc_type is None)
+
+    async def aclose(self):
+        try:
+            if hasattr(self._stream, "close"):
+                await self._stream.close() # openai.AsyncStream.close is a coroutine
+        finally:
+            self._done(False)
+
+
+class ProviderRateLimiter:
+    """
+    Shared limiter for every call to one LLM provider in this process.
+    Calls wait for both token buckets (requests/minute and estimated tokens/minute) and for a
+    concurrency slot. Throttled or transient failures are retried with exponential backoff and
+    full jitter, honouring Retry-After. Concurrency is adapted AIMD-style: halved on every 429 and
+    raised by one after a run of successful calls, up to max_concurrency.
+    """
+
+    def __init__(self, provider: str, **limits):
+        self.provider = provider
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._paused_until = 0.0 # Set from Retry-After so every worker backs off, not just the throttled one
+        self._successes_since_change = 0
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+        self._limits = None
+        self.concurrency_limit = None
+        self.configure(**limits)
+
+    def configure(self, **limits):
+        """
+        Applies the limits. Unchanged limits are left alone, so reconfiguring (once per model tier,
+        say) keeps the buckets' levels and the concurrency limit learned from 429s.
+        """
+        unknown = set(limits) - set(DEFAULT_LIMITS)
+        if unknown:
+            raise ValueError(f"Unknown rate limit setting(s) for {self.provider}: {', '.join(sorted(unknown))}")
+        settings = {**DEFAULT_LIMITS, **limits}
+        with self._lock:
+            previous, self._limits = self._limits or {}, settings
+            if settings == previous:
+                return
+            self.requests_per_minute = settings["requests_per_minute"]
+            self.tokens_per_minute = settings["tokens_per_minute"]
+            self.max_concurrency = max(1, int(settings["max_concurrency"]))
+            self.max_retries = int(settings["max_retries"])
+            self.base_delay = settings["base_delay_seconds"]
+            self.max_delay = settings["max_delay_seconds"]
+            if self.requests_per_minute != previous.get("requests_per_minute"):
+                self.request_bucket = TokenBucket(self.requests_per_minute)
+            if self.tokens_per_minute != previous.get("tokens_per_minute"):
+                self.token_bucket = TokenBucket(self.tokens_per_minute)
+            # A lower cap applies at once; a limit lowered by throttling stays and recovers under the new cap
+            self.concurrency_limit = min(self.concurrency_limit or self.max_concurrency, self.max_concurrency)
+            self._slot_freed.notify_all()
+
+    def call(self, fn, estimated_tokens: int = 0, retryable_errors: tuple = (), stream: bool = False):
+        """
+        Runs fn() under the limits, retrying transient failures. Re-raises the last error when retries
+        run out. With stream=True, fn() opens a streamed response, which is returned wrapped so that
+        the concurrency slot is held until it has been read to the end or closed.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._acquire(estimated_tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                self._release()
+                if attempt >= self.max_retries or not is_retryable(e, retryable_errors):
+                    raise
+                delay = self._on_failure(e, attempt)
+                logging.warning(f"{self.provider} call failed ({e.__class__.__name__}: {e}); "
+                                f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            if stream:
+                return _SlotHoldingStream(result, self._release)
+            self._release(succeeded=True)
+            return result
+
+    async def acall(self, fn, estimated_tokens: int = 0, retryable_errors: tuple = (), stream: bool = False):
+        """
+        Async counterpart of call(): awaits fn() under the same shared limits without blocking the
+        event loop. Cancellation releases the caller's concurrency slot.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self._aacquire(estimated_tokens)
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                self._release()
+                raise
+            except Exception as e:
+                self._release()
+                if attempt >= self.max_retries or not is_retryable(e, retryable_errors):
+                    raise
+                delay = self._on_failure(e, attempt)
+                logging.warning(f"{self.provider} call failed ({e.__class__.__name__}: {e}); "
+                                f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            if stream:
+                return _SlotHoldingAsyncStream(result, self._release)
+            self._release(succeeded=True)
+            return result
+
+    def _reserve(self, estimated_tokens: int) -> float | None:
+        """
+        Takes a concurrency slot and debits both buckets. Returns how long to wait before calling,
+        or None if no slot is free. Caller holds the lock.
+        """
+        if self._in_flight >= self.concurrency_limit:
+            return None
+        self._in_flight += 1
+        self.calls += 1
+        now = time.monotonic()
+        return max(
+            self._paused_until - now,
+            self.request_bucket.reserve(1, now),
+            self.token_bucket.reserve(estimated_tokens, now),
+        )
+
+    def _acquire(self, estimated_tokens: int):
+        started = time.monotonic()
+        with self._lock:
+            while (wait := self._reserve(estimated_tokens)) is None:
+                self._slot_freed.wait()
+        if wait > 0:
+            logging.debug(f"{self.provider} rate limiter: waiting {wait:.1f}s")
+            time.sleep(wait)
+        with self._lock:
+            self.wait_seconds += time.monotonic() - started
+
+    async def _aacquire(self, estimated_tokens: int):
+        started = time.monotonic()
+        while True:
+            with self._lock: # Held only briefly, so taking it on the event loop is fine
+                wait = self._reserve(estimated_tokens)
+            if wait is not None:
+                break
+            await asyncio.sleep(ASYNC_SLOT_POLL_SECONDS)
+        if wait > 0:
+            logging.debug(f"{self.provider} rate limiter: waiting {wait:.1f}s")
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self._release()
+                raise
+        with self._lock:
+            self.wait_seconds += time.monotonic() - started
+
+    def _release(self, succeeded: bool = False):
+        with self._lock:
+            self._in_flight -= 1
+            if succeeded:
+                self._successes_since_change += 1
+                if self.concurrency_limit < self.max_concurrency and self._successes_since_change >= self.concurrency_limit:
+                    self.concurrency_limit += 1
+                    self._successes_since_change = 0
+                    logging.debug(f"{self.provider} concurrency raised to {self.concurrency_limit}")
+            self._slot_freed.notify()
+
+    def _on_failure(self, exc: Exception, attempt: int) -> float:
+        """Returns the delay before the next attempt and adapts the shared limits."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)) # Full jitter
+        retry_after = retry_after_seconds(exc)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        with self._lock:
+            self.retries += 1
+            if _status_code(exc) == 429:
+                self.throttled += 1
+                self._successes_since_change = 0
+                if self.concurrency_limit > 1:
+                    self.concurrency_limit = max(1, self.concurrency_limit // 2)
+                    logging.info(f"{self.provider} is throttling; concurrency lowered to {self.concurrency_limit}")
+                if retry_after is not None:
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "wait_seconds": self.wait_seconds,
+                "concurrency_limit": self.concurrency_limit,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, limits: dict | None = None) -> ProviderRateLimiter:
+    """Returns the process-wide limiter for a provider, reconfiguring it when limits are given."""
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            limiter = _limiters[provider] = ProviderRateLimiter(provider, **(limits or {}))
+            return limiter
+    if limits:
+        limiter.configure(**limits)
+    return limiter
+
+
+def all_rate_limiters() -> dict:
+    with _limiters_lock:
+        return dict(_limiters)
@@ -0,0 +1,183 @@
+import fnmatch
+import json
+import logging
+import re
+import xml.etree.ElementTree as ET
+
+# Outcome of applying one rule to one file
+APPLIED = "applied" # The rule found its target and rewrote it
+SATISFIED = "satisfied" # The target is already in the desired state
+UNMATCHED = "unmatched" # The rule could not find anything it knows how to handle
+
+
+class RegexRule:
+    """Rewrites text with re.sub. 'satisfied_pattern' recognises files that are already migrated."""
+
+    def __init__(self, spec: dict):
+        self.pattern = re.compile(spec["pattern"], re.MULTILINE)
+        self.replacement = spec["replacement"]
+        self.satisfied_pattern = re.compile(spec["satisfied_pattern"], re.MULTILINE) if spec.get("satisfied_pattern") else None
+
+    def apply(self, content: str) -> tuple[str, str]:
+        new_content, count = self.pattern.subn(self.replacement, content)
+        if count:
+            return new_content, APPLIED
+        if self.satisfied_pattern and self.satisfied_pattern.search(content):
+            return content, SATISFIED
+        return content, UNMATCHED
+
+
+class XmlPathRule:
+    """
+    Replaces the text of the elements at a slash-separated path (e.g. 'properties/java.version'),
+    ignoring namespaces. The document is parsed only to locate the elements; the edit itself is
+    made on the original text so formatting and comments are preserved.
+    """
+
+    def __init__(self, spec: dict):
+        self.path = [part for part in spec["path"].split("/") if part]
+        if not self.path:
+            raise ValueError("XML rule requires a non-empty 'path'")
+        self.from_values = list(spec["from"])
+        self.to_value = spec["to"]
+
+    @staticmethod
+    def _local_name(tag: str) -> str:
+        return tag.rsplit("}", 1)[-1]
+
+    def _find(self, root: ET.Element) -> list[ET.Element]:
+        elements = [root]
+        for part in self.path:
+            elements = [child for element in elements for child in element if self._local_name(child.tag) == part]
+        return elements
+
+    def apply(self, content: str) -> tuple[str, str]:
+        try:
+            root = ET.fromstring(content.encode("utf-8"))
+        except ET.ParseError as e:
+            logging.debug(f"XML rule skipped, document does not parse: {e}")
+            return content, UNMATCHED
+
+        elements = self._find(root)
+        if not elements:
+            return content, UNMATCHED
+        values = [(element.text or "").strip() for element in elements]
+        if all(value == self.to_value for value in values):
+            return content, SATISFIED
+        if any(value not in self.from_values and value != self.to_value for value in values):
+            return content, UNMATCHED # An unexpected value; leave it for the LLM
+
+        leaf = re.escape(self.path[-1])
+        expected_edits = sum(1 for value in values if value in self.from_values)
+        old_values = "|".join(re.escape(value) for value in self.from_values)
+        element_pattern = re.compile(rf"(<(?:[\w.-]+:)?{leaf}(?:\s[^>]*)?>\s*)(?:{old_values})(\s*</(?:[\w.-]+:)?{leaf}>)")
+        new_content, count = element_pattern.subn(lambda m: f"{m.group(1)}{self.to_value}{m.group(2)}", content)
+        if count != expected_edits:
+            return content, UNMATCHED # The same element name appears elsewhere; too ambiguous to edit textually
+        return new_content, APPLIED
+
+
+class JsonPathRule:
+    """
+    Replaces string values (or items of a string list) at a dotted path such as 'packaging.requires'.
+    The JSON is parsed to locate the values; the edit is made on the original text to keep its formatting.
+    """
+
+    def __init__(self, spec: dict):
+        self.path = [part for part in spec["path"].split(".") if part]
+        if not self.path:
+            raise ValueError("JSON rule requires a non-empty 'path'")
+        self.from_values = list(spec["from"])
+        self.to_value = spec["to"]
+
+    def _find(self, document) -> list[str] | None:
+        node = document
+        for part in self.path:
+            if isinstance(node, dict) and part in node:
+                node = node[part]
+            elif isinstance(node, list) and part.isdigit() and int(part) < len(node):
+                node = node[int(part)]
+            else:
+                return None
+        if isinstance(node, str):
+            return [node]
+        if isinstance(node, list) and all(isinstance(item, str) for item in node):
+            return node
+        return None
+
+    def apply(self, content: str) -> tuple[str, str]:
+        try:
+            document = json.loads(content)
+        except json.JSONDecodeError as e:
+            logging.debug(f"JSON rule skipped, document does not parse: {e}")
+            return content, UNMATCHED
+
+        values = self._find(document)
+        if values is None:
+            return content, UNMATCHED
+        old_values = [value for value in values if value in self.from_values]
+        if not old_values:
+            return content, SATISFIED if self.to_value in values else UNMATCHED
+
+        new_content = content
+        for old_value in set(old_values):
+            encoded_old = json.dumps(old_value)
+            if content.count(encoded_old) != old_values.count(old_value):
+                return content, UNMATCHED # The value also appears outside the path; too ambiguous
+            new_content = new_content.replace(encoded_old, json.dumps(self.to_value))
+        return new_content, APPLIED
+
+
+RULE_TYPES = {
+    "regex": RegexRule,
+    "xml": XmlPathRule,
+    "json": JsonPathRule,
+}
+
+
+class RecipeEngine:
+    """
+    Applies the declarative rules from the 'recipes' section of context.json to target files.
+    A file counts as fully handled when at least one rule targets it and every such rule either
+    rewrote it or found it already migrated; only files that are not fully handled need the LLM.
+    """
+
+    def __init__(self, recipes: list[dict] | None):
+        self.rules = []
+        for index, spec in enumerate(recipes or []):
+            name = spec.get("name", f"recipe #{index + 1}")
+            rule_type = spec.get("type")
+            if rule_type not in RULE_TYPES:
+                raise ValueError(f"Recipe '{name}' has unknown type '{rule_type}'. Expected one of: {', '.join(RULE_TYPES)}")
+            if not spec.get("file"):
+                raise ValueError(f"Recipe '{name}' is missing 'file'")
+            try:
+                rule = RULE_TYPES[rule_type](spec)
+            except (KeyError, re.error) as e:
+                raise ValueError(f"Recipe '{name}' is invalid: {e}") from e
+            self.rules.append((name, spec["file"], rule))
+
+    def rules_for(self, file_path: str) -> list:
+        return [(name, rule) for name, file_pattern, rule in self.rules if fnmatch.fnmatch(file_path, file_pattern)]
+
+    def apply(self, file_path: str, content: str) -> tuple[str, bool]:
+        """Returns (new_content, fully_handled) for one file."""
+        rules = self.rules_for(file_path)
+        if not rules:
+            return content, False
+        fully_handled = True
+        for name, rule in rules:
+            content, outcome = rule.apply(content)
+            logging.debug(f"Recipe '{name}' on {file_path}: {outcome}")
+            if outcome == UNMATCHED:
+                fully_handled = False
+        return content, fully_handled
+
+    def apply_all(self, current_files: dict) -> dict:
+        """Returns {file_path: updated_content} for the files the rules fully handled."""
+        handled = {}
+        for file_path, content in current_files.items():
+            new_content, fully_handled = self.apply(file_path, content)
+            if fully_handled:
+                handled[file_path] = new_content
+        return handled
@@ -1,21 +1,39 @@
+import hashlib
 import logging
 import os
 import tempfile
-import shutil # For cleanup if repo_path is provided and we don't want to keep it
+import shutil # For cleaning up temporary workspaces
 
-from openai_client import OpenAIClient, OpenAIClientError, OpenAIResponseError
 from github_client import GitHubClient, GitHubClientError
-from test_runner import TestRunner, TestRunnerError
+from test_runner import TestRunner, TestRunnerError, DEFAULT_BUILD_TIMEOUT_SECONDS, DEFAULT_NO_OUTPUT_TIMEOUT_SECONDS
 from status_enums import RepoStatus
-from exceptions import BaseAppException
+from exceptions import BaseAppException, BudgetExceededError, LLMClientError, LLMResponseError, PatchApplyError
+from file_edits import apply_search_replace, RESPONSE_MODE_EDITS, RESPONSE_MODE_FULL, RESPONSE_MODES
+from recipe_engine import RecipeEngine
+from sparse_checkout import CLONE_STRATEGIES, CLONE_STRATEGY_FULL, CLONE_STRATEGY_MIRROR, CLONE_STRATEGY_SPARSE, build_paths, is_sparse, sparse_clone, widen_checkout
+from mirror_store import MirrorStore
+from sparse_checkout import run_git
+from test_result_cache import tree_hash
+from metrics import maybe_span
+from file_validators import validate_files
+from fleet_state import parse_ls_tree
+
+
+def content_hash(content: str) -> str:
+    """Hash for comparing returned and original file content. Only CRLF line endings are normalized; any other difference, a final newline included, is a change."""
+    return hashlib.sha256(content.replace("\r\n", "\n").encode('utf-8')).hexdigest()
 
 
 class RepoProcessor:
+    # Processing steps in order. Each maps to a _step_<name> method; see run_steps().
+    STEPS = ("clone", "branch", "apply", "test", "publish")
+
     def __init__(self, repo_name: str, context: dict, prompt: str,
-                 openai_client: OpenAIClient, github_client: GitHubClient,
+                 openai_client, github_client: GitHubClient, # openai_client: any provider client from llm_providers
                  # Allow repo_path to be explicitly None or a path
                  repo_path: str | None = None,
-                 keep_temp_dir: bool = False): # For debugging
+                 keep_temp_dir: bool = False, # For debugging
+                 mirror_store: MirrorStore | None = None): # Shared store used by the 'mirror' clone strategy
         self.repo_name = repo_name
         self.context = context
         self.prompt = prompt
@@ -25,6 +43,26 @@ class RepoProcessor:
         self.repo_path = repo_path # This will be the actual path used
         self.status = RepoStatus.NOT_PROCESSED
         self.keep_temp_dir = keep_temp_dir
+        self.halted = False # Set once a step stops processing (error or nothing to do)
+        self._temp_dir = None
+        self.mirror_store = mirror_store
+        self._worktree_url = None # Set while repo_path is a worktree of a mirror
+        self.test_result_cache = None # Shared TestResultCache; builds of a tree that already passed are skipped
+        self.force_tests = False # Run the build even when the test result cache has a pass for this tree
+        self.metrics = None # MetricsRecorder collecting per-stage timings
+        self.journal = None # CampaignJournal recording each completed step and its artifacts
+        self.applied_updates = {} # {file_path: content} written to the working copy by apply_changes
+        self.resumed_test_tree = None # Tree hash that passed tests in an earlier, interrupted run
+        self.pr_url = None
+        self.precomputed_updates = {} # {file_path: updated_content} resolved before apply_changes runs
+        self.model_tiers = [] # [{"name", "model", "client"}], cheapest first; see llm_providers.create_tier_clients
+        self.tier_index = 0 # Tier whose model answers the next LLM call
+        self.tier_outcomes = [] # [{"tier", "model", "outcome"}] for each tier that produced changes
+        self._original_files = {} # Target files as read before the LLM pass, restored before escalating
+        self._llm_used = False # Whether the last apply_changes called the LLM (not only recipes/precomputed updates)
+        self.file_changes = {} # {file_path: "changed" | "unchanged"} for each update apply_changes considered
+        self.base_revision = None # {"head", "target_blobs"} of the checkout this run started from; see FleetStateIndex
+        self.track_base_revision = False # Set for --incremental runs, whose FleetStateIndex records base_revision
 
         self.global_settings = context.get("global_settings", {})
         self.repo_settings = context.get("repository_settings", {}).get(repo_name, {})
@@ -38,106 +76,457 @@ class RepoProcessor:
         self.commit_message_template = self._get_setting("commit_message_template", "Automated update: Applied tech debt fix for {repo_name}")
         self.pr_title_template = self._get_setting("pr_title_template", "[Automated PR] Tech debt fix for {repo_name}")
         self.pr_body_template = self._get_setting("pr_body_template", "This PR was created automatically to apply a tech debt fix for {repo_name}.\n\nPlease review and merge.")
+        self.branch_name = self.branch_name_template.format(repo_name=self.repo_name)
+        self.repo_url = f"{self.repo_base_url.rstrip('/')}/{self.repo_name}"
+        self.recipe_engine = RecipeEngine(context.get("recipes")) # Deterministic rewrites tried before the LLM
+        self.response_mode = self._get_setting("response_mode", RESPONSE_MODE_FULL)
+        if self.response_mode not in RESPONSE_MODES:
+            raise ValueError(f"Unknown response_mode '{self.response_mode}' for {self.repo_name}. Expected one of: {', '.join(RESPONSE_MODES)}")
+        self.clone_strategy = self._get_setting("clone_strategy", CLONE_STRATEGY_FULL)
+        if self.clone_strategy not in CLONE_STRATEGIES:
+            raise ValueError(f"Unknown clone_strategy '{self.clone_strategy}' for {self.repo_name}. Expected one of: {', '.join(CLONE_STRATEGIES)}")
+        self.sparse_extra_paths = self._get_setting("sparse_extra_paths", []) # Checked out alongside target_files in sparse mode
+        self.validation_enabled = self._get_setting("validate_files", True) # Check changed files (file_validators) before building
+        self.validation_retries = self._get_setting("validation_retries", 1) # LLM calls with the problems as feedback
 
 
         logging.debug(f"Build command for {self.repo_name}: {self.build_command}")
-        self.test_runner = TestRunner(self.build_command)
+        self.test_runner = TestRunner(
+            self.build_command,
+            timeout_seconds=self._get_setting("build_timeout_seconds", DEFAULT_BUILD_TIMEOUT_SECONDS),
+            no_output_timeout_seconds=self._get_setting("build_no_output_timeout_seconds", DEFAULT_NO_OUTPUT_TIMEOUT_SECONDS),
+        )
 
     def _get_setting(self, key: str, default: any = None) -> any:
         return self.repo_settings.get(key, self.global_settings.get(key, default))
 
     def process(self):
         logging.info(f"Processing repository {self.repo_name}")
+        self.open_workspace()
+        try:
+            self._process_repository()
+        finally:
+            self.close_workspace()
 
+    def open_workspace(self):
+        """Sets self.repo_path to the provided path or a fresh temporary directory for this repo."""
         if self.provided_repo_path:
             self.repo_path = self.provided_repo_path
             logging.debug(f"Using provided repo path: {self.repo_path}")
-            self._process_repository()
         else:
-            with tempfile.TemporaryDirectory() as tmpdirname:
-                self.repo_path = os.path.join(tmpdirname, self.repo_name)
-                logging.debug(f"Created temporary directory: {self.repo_path}")
-                try:
-                    self._process_repository()
-                finally:
-                    if self.keep_temp_dir:
-                        logging.info(f"Keeping temporary directory: {tmpdirname} (repo: {self.repo_path})")
-                        # To keep it, we need to move it out of the context manager's control
-                        # This is a bit hacky; for real "keep", copy elsewhere before exiting.
-                        # For now, just log and let it be deleted if not keep_temp_dir.
-                        pass
-                    # If not self.keep_temp_dir, it's cleaned up automatically by TemporaryDirectory
+            self._temp_dir = tempfile.mkdtemp(prefix=f"{self.repo_name}-")
+            self.repo_path = os.path.join(self._temp_dir, self.repo_name)
+            logging.debug(f"Created temporary directory: {self.repo_path}")
+
+    def close_workspace(self):
+        """Removes the temporary workspace created by open_workspace, unless keep_temp_dir is set."""
+        if not self._temp_dir:
+            return
+        if self._worktree_url and not self.keep_temp_dir:
+            self.mirror_store.remove_worktree(self._worktree_url, self.repo_path)
+            self._worktree_url = None
+        if self.keep_temp_dir:
+            logging.info(f"Keeping temporary directory: {self._temp_dir} (repo: {self.repo_path})")
+        else:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+        self._temp_dir = None
 
     def _process_repository(self):
+        self.run_steps(self.STEPS)
+
+    def run_steps(self, steps) -> bool:
+        """
+        Runs the named steps in order, stopping at the first one that halts processing.
+        Returns True if processing should continue with later steps, False once halted.
+        """
+        for step in steps:
+            if self.halted:
+                return False
+            try:
+                should_continue = getattr(self, f"_step_{step}")()
+            except Exception as e:
+                self._handle_error(e)
+                should_continue = False
+            if not should_continue:
+                self.halted = True
+                if self.journal:
+                    self.journal.record_status(self.repo_name, self.status)
+                return False
+            if self.journal:
+                self.journal.record_step(self.repo_name, step, self._step_artifacts(step))
+                if step == self.STEPS[-1]:
+                    self.journal.record_status(self.repo_name, self.status)
+        return True
+
+    def _span(self, stage: str):
+        return maybe_span(self.metrics, self.repo_name, stage)
+
+    def _current_tree_hash(self) -> str | None:
         try:
-            repo_full_url = f"{self.repo_base_url.rstrip('/')}/{self.repo_name}"
-            logging.debug(f"Repository URL: {repo_full_url}")
-            logging.debug(f"Repository path for operations: {self.repo_path}")
+            return tree_hash(self.repo_path)
+        except GitHubClientError as e:
+            logging.debug(f"Cannot hash working tree of {self.repo_name}: {e}")
+            return None
+
+    def _step_artifacts(self, step: str) -> dict:
+        """What the campaign journal keeps for a completed step, enough to resume without redoing it."""
+        if step == "apply":
+            artifacts = {"updated_files": dict(self.applied_updates), "tree_hash": self._current_tree_hash()}
+            if self.model_tiers:
+                artifacts["tier"] = self.model_tiers[self.tier_index]["name"]
+            return artifacts
+        if step == "test":
+            return {"passed": True, "tree_hash": self._current_tree_hash()}
+        if step == "publish":
+            try:
+                head_sha = run_git(["rev-parse", "HEAD"], cwd=self.repo_path).strip()
+            except GitHubClientError:
+                head_sha = None
+            return {"head_sha": head_sha, "pr_url": self.pr_url}
+        return {}
 
-            if not self.provided_repo_path: # Only clone if not using a pre-existing path
-                logging.info(f"Cloning repository {self.repo_name} into {self.repo_path}")
-                self.github_client.clone_repo(repo_full_url, self.repo_path)
+    def resume_from(self, completed_steps: dict):
+        """
+        Reuses the artifacts of steps completed in an earlier run. The workspace is temporary, so clone
+        and branch always run again; the recorded file updates replace the recipe/LLM pass, and tests
+        are skipped if the rebuilt tree matches the one that passed.
+        """
+        if "publish" in completed_steps:
+            self.status = RepoStatus.SUCCESS_PR_CREATED
+            self.pr_url = completed_steps["publish"].get("pr_url")
+            self.halted = True
+            return
+        if "apply" in completed_steps:
+            self.precomputed_updates = dict(completed_steps["apply"].get("updated_files") or {})
+            tier_names = [tier["name"] for tier in self.model_tiers]
+            if completed_steps["apply"].get("tier") in tier_names: # Don't fall back to a tier that already failed
+                self.tier_index = tier_names.index(completed_steps["apply"]["tier"])
+        if "test" in completed_steps:
+            self.resumed_test_tree = completed_steps["test"].get("tree_hash")
+        logging.info(f"Resuming {self.repo_name} after completed step(s): {', '.join(completed_steps)}")
+
+    def _step_clone(self) -> bool:
+        repo_full_url = self.repo_url
+        logging.debug(f"Repository URL: {repo_full_url}")
+        logging.debug(f"Repository path for operations: {self.repo_path}")
+
+        if not self.provided_repo_path: # Only clone if not using a pre-existing path
+            if self.clone_strategy == CLONE_STRATEGY_MIRROR:
+                if self.mirror_store is None:
+                    self.mirror_store = MirrorStore()
+                logging.info(f"Checking out {self.repo_name} from the local mirror into {self.repo_path}")
+                with self._span("clone"):
+                    self.mirror_store.create_worktree(repo_full_url, self.repo_path)
+                self._worktree_url = repo_full_url
+            elif self.clone_strategy == CLONE_STRATEGY_SPARSE:
+                logging.info(f"Sparse-cloning repository {self.repo_name} into {self.repo_path}")
+                with self._span("clone"):
+                    sparse_clone(repo_full_url, self.repo_path, self.sparse_paths())
             else:
-                logging.info(f"Skipping clone for provided repo_path: {self.repo_path}")
-
-
-            branch_name = self.branch_name_template.format(repo_name=self.repo_name)
-            logging.info(f"Ensuring branch {branch_name} (create or reset)")
-            self.github_client.create_or_reset_branch(self.repo_path, branch_name) # Changed to create_or_reset
+                logging.info(f"Cloning repository {self.repo_name} into {self.repo_path}")
+                with self._span("clone"):
+                    self.github_client.clone_repo(repo_full_url, self.repo_path)
+        else:
+            logging.info(f"Skipping clone for provided repo_path: {self.repo_path}")
+        if self.track_base_revision:
+            self.base_revision = self._read_base_revision()
+        return True
 
+    def _read_base_revision(self) -> dict | None:
+        """The checked-out commit and the blob ids of the target files in it, before anything is changed."""
+        try:
+            head = run_git(["rev-parse", "HEAD"], cwd=self.repo_path).strip()
+            listing = run_git(["ls-tree", "HEAD", "--", *self.target_files], cwd=self.repo_path) if self.target_files else ""
+        except GitHubClientError as e:
+            logging.debug(f"Cannot read the base revision of {self.repo_name}: {e}")
+            return None
+        return {"head": head, "target_blobs": parse_ls_tree(listing)}
+
+    def sparse_paths(self) -> list[str]:
+        """Paths checked out by a sparse clone: the target files plus what the build command reads first."""
+        return list(dict.fromkeys([*self.target_files, *build_paths(self.build_command), *self.sparse_extra_paths]))
+
+    def _step_branch(self) -> bool:
+        logging.info(f"Ensuring branch {self.branch_name} (create or reset)")
+        with self._span("branch"):
+            self.github_client.create_or_reset_branch(self.repo_path, self.branch_name) # Changed to create_or_reset
+        return True
+
+    def _step_apply(self) -> bool:
+        num_files_changed = self.apply_changes()
+        escalate_on = {RepoStatus.ERROR_OPENAI_RESPONSE_FORMAT: "invalid_response", RepoStatus.ERROR_VALIDATION: "validation_failed"}
+        while num_files_changed < 0 and self.status in escalate_on and self._escalate(escalate_on[self.status]):
             num_files_changed = self.apply_changes()
-            if num_files_changed == 0: # No files were targeted or found to update by LLM
-                logging.info(f"No changes applied to {self.repo_name} by LLM or no target files found.")
-                self.status = RepoStatus.SUCCESS_NO_CHANGES # Or a more specific status if files weren't found
-                return
-            elif num_files_changed < 0: # Indicates an error in apply_changes itself
-                # Status already set by apply_changes
-                return
-
-
-            logging.info(f"Running tests for {self.repo_name}")
+        if num_files_changed == 0: # No files were targeted or found to update by LLM
+            logging.info(f"No changes applied to {self.repo_name} by LLM or no target files found.")
+            self.status = RepoStatus.SUCCESS_NO_CHANGES # Or a more specific status if files weren't found
+            return False
+        elif num_files_changed < 0: # Indicates an error in apply_changes itself
+            # Status already set by apply_changes
+            return False
+        return True
+
+    def _step_test(self) -> bool:
+        if self.resumed_test_tree and self._current_tree_hash() == self.resumed_test_tree:
+            logging.info(f"Skipping tests for {self.repo_name}: they passed for this tree in the interrupted run")
+            self._record_tier_outcome("passed")
+            return True
+        # Keyed before widening: a sparse checkout's index already describes the full tree
+        cache_key = self.test_result_cache.make_key(self.repo_path, self.build_command) if self.test_result_cache else None
+        if cache_key and not self.force_tests and self.test_result_cache.has_passed(cache_key):
+            logging.info(f"Skipping tests for {self.repo_name}: this exact tree already passed with the same build and toolchain")
+            self._record_tier_outcome("passed")
+            return True
+
+        if self.clone_strategy == CLONE_STRATEGY_SPARSE and is_sparse(self.repo_path):
+            widen_checkout(self.repo_path) # The build needs the whole tree
+        logging.info(f"Running tests for {self.repo_name}")
+        with self._span("run_tests"):
             tests_passed, test_output = self.test_runner.run_tests(self.repo_path)
-            if not tests_passed:
-                logging.error(f"Tests failed in {self.repo_name}. Output:\n{test_output}")
-                self.status = RepoStatus.ERROR_TESTS_FAILED
-                return
-            logging.info(f"Tests passed for {self.repo_name}. Output:\n{test_output}")
-
-            commit_message = self.commit_message_template.format(repo_name=self.repo_name)
-            logging.info(f"Committing changes in {self.repo_name}")
+        if not tests_passed:
+            logging.error(f"Tests failed in {self.repo_name}. Output:\n{test_output}")
+            self.status = RepoStatus.ERROR_TESTS_FAILED
+            if self._escalate("tests_failed"):
+                # The larger model's changes are generated and built here, holding this build slot
+                if not self._step_apply():
+                    return False
+                if self.journal: # Replaces the failed tier's files, so a resume doesn't rebuild them
+                    self.journal.record_step(self.repo_name, "apply", self._step_artifacts("apply"))
+                return self._step_test()
+            return False
+        if cache_key:
+            last_result = self.test_runner.last_result or {}
+            self.test_result_cache.record_pass(cache_key, self.repo_name, last_result.get("duration_seconds"))
+        logging.info(f"Tests passed for {self.repo_name}.")
+        self._record_tier_outcome("passed")
+        logging.debug(f"Test output for {self.repo_name}:\n{test_output}")
+        return True
+
+    def _llm_client(self):
+        return self.model_tiers[self.tier_index]["client"] if self.model_tiers else self.openai_client
+
+    def _record_tier_outcome(self, outcome: str):
+        if not self.model_tiers or not self._llm_used:
+            return
+        tier = self.model_tiers[self.tier_index]
+        self.tier_outcomes.append({"tier": tier["name"], "model": tier["model"], "outcome": outcome})
+        if self.metrics:
+            self.metrics.record_tier(self.repo_name, tier["name"], tier["model"], outcome)
+
+    def _escalate(self, outcome: str) -> bool:
+        """
+        Records the current tier's outcome. If a larger tier is left, restores the target files and
+        switches to it, returning True; the caller then applies changes again.
+        """
+        if not self.model_tiers or not self._llm_used:
+            return False
+        self._record_tier_outcome(outcome)
+        if self.tier_index + 1 >= len(self.model_tiers):
+            return False
+        for file_path in self.applied_updates:
+            full_path = os.path.join(self.repo_path, file_path)
+            if file_path in self._original_files:
+                with open(full_path, 'w', encoding='utf-8') as f:
+                    f.write(self._original_files[file_path])
+            elif os.path.exists(full_path):
+                os.remove(full_path)
+        self.applied_updates = {}
+        self.precomputed_updates = {} # May have come from the cheaper tier (fleet dedup, resume); recipes are redone
+        self.tier_index += 1
+        self.status = RepoStatus.NOT_PROCESSED
+        logging.info(f"Escalating {self.repo_name} from model tier '{self.model_tiers[self.tier_index - 1]['name']}' "
+                     f"to '{self.model_tiers[self.tier_index]['name']}' ({outcome})")
+        return True
+
+    def _step_publish(self) -> bool:
+        commit_message = self.commit_message_template.format(repo_name=self.repo_name)
+        logging.info(f"Committing changes in {self.repo_name}")
+        with self._span("commit"):
             self.github_client.commit_changes(self.repo_path, commit_message)
 
-            logging.info(f"Pushing branch {branch_name}")
-            self.github_client.push_branch(self.repo_path, branch_name)
+        logging.info(f"Pushing branch {self.branch_name}")
+        with self._span("push"):
+            self.github_client.push_branch(self.repo_path, self.branch_name)
 
-            pr_title = self.pr_title_template.format(repo_name=self.repo_name)
-            pr_body = self.pr_body_template.format(repo_name=self.repo_name)
-            logging.info(f"Creating pull request for {self.repo_name}")
-            self.github_client.create_pull_request(self.repo_path, pr_title, pr_body, self.reviewers)
+        pr_title = self.pr_title_template.format(repo_name=self.repo_name)
+        pr_body = self.pr_body_template.format(repo_name=self.repo_name)
+        logging.info(f"Creating pull request for {self.repo_name}")
+        with self._span("pull_request"):
+            pr = self.github_client.create_pull_request(self.repo_path, pr_title, pr_body, self.reviewers)
+        self.pr_url = pr if isinstance(pr, str) else None
 
-            self.status = RepoStatus.SUCCESS_PR_CREATED
+        self.status = RepoStatus.SUCCESS_PR_CREATED
+        return True
 
-        except GitHubClientError as e:
+    def _handle_error(self, e: Exception):
+        """Maps an exception raised by a processing step to a RepoStatus."""
+        if isinstance(e, GitHubClientError):
             logging.error(f"GitHub client error processing repository {self.repo_name}: {e}", exc_info=True)
-            # More specific status based on the type of GitHubClientError if defined
-            if "clone" in str(e).lower(): self.status = RepoStatus.ERROR_CLONING
-            elif "branch" in str(e).lower(): self.status = RepoStatus.ERROR_BRANCHING
-            elif "commit" in str(e).lower(): self.status = RepoStatus.ERROR_COMMITTING
-            elif "push" in str(e).lower(): self.status = RepoStatus.ERROR_PUSHING
-            elif "pull request" in str(e).lower(): self.status = RepoStatus.ERROR_PR_CREATION
-            else: self.status = RepoStatus.ERROR_GENERIC
-        except TestRunnerError as e: # Assuming TestRunner might raise this
+            # More specific status from the operation named first: git output quoted later in the
+            # message (e.g. "On branch ..." from a failed commit) may mention other operations
+            message = str(e).lower()
+            operations = (("clone", RepoStatus.ERROR_CLONING), ("branch", RepoStatus.ERROR_BRANCHING),
+                          ("commit", RepoStatus.ERROR_COMMITTING), ("push", RepoStatus.ERROR_PUSHING),
+                          ("pull request", RepoStatus.ERROR_PR_CREATION))
+            found = [(message.find(keyword), status) for keyword, status in operations if keyword in message]
+            self.status = min(found, key=lambda item: item[0])[1] if found else RepoStatus.ERROR_GENERIC
+        elif isinstance(e, TestRunnerError): # Assuming TestRunner might raise this
             logging.error(f"Test runner error for {self.repo_name}: {e}", exc_info=True)
             self.status = RepoStatus.ERROR_TESTS_FAILED # Or a more specific test error
-        except BaseAppException as e: # Catch other custom app exceptions
+        elif isinstance(e, BaseAppException): # Catch other custom app exceptions
             logging.error(f"Application error processing repository {self.repo_name}: {e}", exc_info=True)
-            if isinstance(e, OpenAIClientError): self.status = RepoStatus.ERROR_OPENAI_API
-            elif isinstance(e, OpenAIResponseError): self.status = RepoStatus.ERROR_OPENAI_RESPONSE_FORMAT
+            # LLMResponseError is a subclass of LLMClientError, so it is checked first
+            if isinstance(e, LLMResponseError): self.status = RepoStatus.ERROR_OPENAI_RESPONSE_FORMAT
+            elif isinstance(e, LLMClientError): self.status = RepoStatus.ERROR_OPENAI_API
             else: self.status = RepoStatus.ERROR_GENERIC
-        except Exception as e:
+        else:
             logging.error(f"Unexpected error processing repository {self.repo_name}: {e}", exc_info=True)
             self.status = RepoStatus.ERROR_GENERIC
 
+    def read_target_files(self) -> dict:
+        """Returns {relative_path: content} for every target file that exists in the working copy."""
+        current_files = {}
+        for file_rel_path in self.target_files:
+            full_path = os.path.join(self.repo_path, file_rel_path)
+            if os.path.exists(full_path):
+                with open(full_path, 'r', encoding='utf-8') as f: # Specify encoding
+                    current_files[file_rel_path] = f.read()
+                logging.debug(f"Read content of {file_rel_path} in {self.repo_name}")
+            else:
+                logging.warning(f"Target file {file_rel_path} does not exist in {self.repo_path}")
+        return current_files
+
+    def _call_llm(self, repo_context: dict, on_file=None) -> dict | None:
+        """Calls the LLM client. Returns None (with self.status set) if the call fails."""
+        try:
+            with self._span("generate_code"):
+                return self._llm_client().generate_code(self.prompt, repo_context, on_file=on_file)
+        except BudgetExceededError as e:
+            logging.error(f"Not calling the LLM for {self.repo_name}: {e}")
+            self.status = RepoStatus.ERROR_BUDGET_EXCEEDED
+            return None
+        except LLMResponseError as e: # Subclass of LLMClientError, so caught first
+            logging.error(f"LLM response format error for {self.repo_name}: {e}")
+            self.status = RepoStatus.ERROR_OPENAI_RESPONSE_FORMAT
+            return None
+        except LLMClientError as e: # Catch specific client errors
+            logging.error(f"LLM API client error during apply_changes for {self.repo_name}: {e}")
+            self.status = RepoStatus.ERROR_OPENAI_API
+            return None
+
+    def _resolve_edits(self, file_updates: list, current_files: dict, repo_context: dict) -> list | None:
+        """
+        Turns search/replace edits from the LLM into full 'updated_content' entries.
+        Files whose edits do not apply cleanly are requested again in full-content mode.
+        Returns None (with self.status set) if that fallback call fails.
+        """
+        resolved = []
+        failed_files = {}
+        for file_info in file_updates:
+            file_path = file_info.get('file_path')
+            if "edits" not in file_info or file_path not in current_files:
+                resolved.append(file_info) # Left for the checks in apply_changes
+                continue
+            try:
+                updated_content = apply_search_replace(current_files[file_path], file_info.get("edits") or [])
+                resolved.append({"file_path": file_path, "updated_content": updated_content})
+            except PatchApplyError as e:
+                logging.warning(f"Edits for {file_path} in {self.repo_name} did not apply ({e}); falling back to full content")
+                failed_files[file_path] = current_files[file_path]
+
+        if failed_files:
+            fallback_context = {key: value for key, value in repo_context.items() if key != "response_mode"}
+            fallback_context["current_files"] = failed_files
+            response = self._call_llm(fallback_context)
+            if response is None:
+                return None
+            resolved.extend(response.get("updated_files") or [])
+        return resolved
+
+    @staticmethod
+    def _is_unchanged(file_info: dict, current_files: dict) -> bool:
+        file_path, content = file_info.get('file_path'), file_info.get('updated_content')
+        return file_path in current_files and isinstance(content, str) and content_hash(content) == content_hash(current_files[file_path])
+
+    def _tree_changed(self, file_paths: list) -> bool:
+        """Asks git whether the written files differ from what is committed. True if git can't tell."""
+        if not file_paths:
+            return False
+        try:
+            return bool(run_git(["status", "--porcelain", "--", *file_paths], cwd=self.repo_path).strip())
+        except GitHubClientError as e:
+            logging.debug(f"Cannot check git status of {self.repo_name}: {e}")
+            return True
+
+    def _validate_updates(self, updated_files_data: list, current_files: dict, llm_files: dict, repo_context: dict) -> list | None:
+        """
+        Checks the updated target files with file_validators before anything is built. Files the LLM
+        produced are requested again (up to validation_retries times) with the problems as feedback.
+        Returns the possibly corrected updates, or None (with self.status set) if problems remain.
+        """
+        for attempt in range(self.validation_retries + 1):
+            with self._span("validate"):
+                failures = validate_files({
+                    file_info['file_path']: file_info['updated_content'] for file_info in updated_files_data
+                    if file_info.get('file_path') in current_files and isinstance(file_info.get('updated_content'), str)
+                    and not self._is_unchanged(file_info, current_files) # An untouched file is not the LLM's to fix
+                }, current_files)
+            if not failures:
+                return updated_files_data
+            for file_path, problems in failures.items():
+                logging.warning(f"{file_path} in {self.repo_name} failed validation: {'; '.join(problems)}")
+            retryable = {file_path: llm_files[file_path] for file_path in failures if file_path in llm_files}
+            if attempt == self.validation_retries or len(retryable) < len(failures):
+                break # Out of retries, or a recipe/precomputed update is broken, which the LLM can't fix
+
+            # Full-content mode for the retry, so the corrected file is validated as a whole
+            retry_context = {key: value for key, value in repo_context.items() if key != "response_mode"}
+            retry_context["current_files"] = retryable
+            retry_context["validation_feedback"] = {file_path: failures[file_path] for file_path in retryable}
+            logging.info(f"Asking the LLM to fix {len(retryable)} file(s) that failed validation in {self.repo_name}")
+            response = self._call_llm(retry_context)
+            if response is None:
+                return None
+            fixes = {file_info.get('file_path'): file_info for file_info in response.get("updated_files") or []
+                     if file_info.get('file_path') in retryable}
+            updated_files_data = [fixes.get(file_info.get('file_path'), file_info) for file_info in updated_files_data]
+
+        self.status = RepoStatus.ERROR_VALIDATION
+        return None
+
+    def _write_file_update(self, file_info: dict) -> bool:
+        """Writes one 'updated_files' entry to the working copy. Returns True if the file was written."""
+        file_path = file_info.get('file_path')
+        updated_code = file_info.get('updated_content')
+
+        if not file_path: # updated_code can be empty if LLM wants to delete a file (not handled here)
+            logging.warning(f"Missing 'file_path' in LLM response item: {file_info} for {self.repo_name}")
+            return False
+        if updated_code is None: # Explicitly check for None, as empty string is valid
+            logging.warning(f"Missing 'updated_content' in LLM response item: {file_info} for {self.repo_name}")
+            return False
+
+        full_write_path = os.path.join(self.repo_path, file_path)
+        # Ensure the original file was one of the targets to prevent arbitrary writes
+        if file_path not in self.target_files:
+            logging.warning(f"LLM tried to update non-target file '{file_path}'. Skipping.")
+            return False
+
+        try:
+            os.makedirs(os.path.dirname(full_write_path), exist_ok=True)
+            with open(full_write_path, 'w', encoding='utf-8') as f: # Specify encoding
+                f.write(updated_code)
+            logging.debug(f"Updated file {file_path} in {self.repo_name}")
+            self.applied_updates[file_path] = updated_code
+            return True
+        except IOError as e:
+            logging.error(f"Failed to write updated file {full_write_path}: {e}")
+            self.status = RepoStatus.ERROR_APPLYING_CHANGES # Or a more specific IO error status
+            # Decide if one file write error should stop the whole process for this repo
+            # For now, let's continue trying to write other files but mark overall as error.
+            # If this happens, it might be better to return -1 to stop further processing.
+            return False
+
     def apply_changes(self) -> int:
         """
         Applies changes using OpenAI and writes them to files.
@@ -153,19 +542,12 @@ class RepoProcessor:
             "target_files": self.target_files,
         }
 
-        current_files = {}
-        found_any_target_file = False
-        for file_rel_path in self.target_files:
-            full_path = os.path.join(self.repo_path, file_rel_path)
-            if os.path.exists(full_path):
-                found_any_target_file = True
-                with open(full_path, 'r', encoding='utf-8') as f: # Specify encoding
-                    current_files[file_rel_path] = f.read()
-                logging.debug(f"Read content of {file_rel_path} in {self.repo_name}")
-            else:
-                logging.warning(f"Target file {file_rel_path} does not exist in {self.repo_path}")
+        with self._span("read_files"):
+            current_files = self.read_target_files()
+        self._original_files = dict(current_files)
+        self._llm_used = False
 
-        if not found_any_target_file and self.target_files:
+        if not current_files and self.target_files:
             logging.error(f"None of the target files {self.target_files} were found in {self.repo_path}.")
             self.status = RepoStatus.ERROR_TARGET_FILES_NOT_FOUND_ALL
             return -1 # Indicate error
@@ -174,22 +556,54 @@ class RepoProcessor:
             self.status = RepoStatus.SUCCESS_NO_CHANGES
             return 0
 
+        # Files already resolved elsewhere (e.g. by the fleet-level dedup pass) skip the LLM call
+        updated_files_data = [
+            {"file_path": file_path, "updated_content": content}
+            for file_path, content in self.precomputed_updates.items()
+            if file_path in current_files
+        ]
+        pending_files = {path: content for path, content in current_files.items() if path not in self.precomputed_updates}
+        self._llm_used = bool(updated_files_data) # Precomputed updates are LLM output too (fleet dedup, an earlier run)
+        if updated_files_data:
+            logging.info(f"Using {len(updated_files_data)} precomputed file update(s) for {self.repo_name}")
+
+        recipe_updates = self.recipe_engine.apply_all(pending_files)
+        if recipe_updates:
+            logging.info(f"Recipes fully handled {', '.join(recipe_updates)} for {self.repo_name}; "
+                         f"{len(pending_files) - len(recipe_updates)} file(s) left for the LLM")
+            updated_files_data.extend({"file_path": path, "updated_content": content} for path, content in recipe_updates.items())
+            pending_files = {path: content for path, content in pending_files.items() if path not in recipe_updates}
+
+        streamed_files = {} # {file_path: content} written as soon as the LLM finished streaming them
+        def on_streamed_file(file_info: dict):
+            # Edits are resolved against the full response (with fallback), so only full content is written early
+            if self.response_mode != RESPONSE_MODE_EDITS and file_info.get('file_path') in pending_files:
+                if self._is_unchanged(file_info, current_files):
+                    return
+                if self._write_file_update(file_info):
+                    streamed_files[file_info['file_path']] = file_info['updated_content']
+
+        if pending_files:
+            self._llm_used = True
+            repo_context["current_files"] = pending_files
+            if self.response_mode == RESPONSE_MODE_EDITS:
+                repo_context["response_mode"] = RESPONSE_MODE_EDITS
+
+            response = self._call_llm(repo_context, on_file=on_streamed_file)
+            if response is None:
+                return -1 # Status already set by _call_llm
+            llm_updates = response.get("updated_files") or []
+            if self.response_mode == RESPONSE_MODE_EDITS:
+                llm_updates = self._resolve_edits(llm_updates, pending_files, repo_context)
+                if llm_updates is None:
+                    return -1
+            updated_files_data.extend(llm_updates)
+
+        if self.validation_enabled and updated_files_data:
+            updated_files_data = self._validate_updates(updated_files_data, current_files, pending_files, repo_context)
+            if updated_files_data is None:
+                return -1 # Status already set by _validate_updates
 
-        repo_context["current_files"] = current_files
-
-        try:
-            response = self.openai_client.generate_code(self.prompt, repo_context)
-        except OpenAIClientError as e: # Catch specific client errors
-            logging.error(f"OpenAI API client error during apply_changes for {self.repo_name}: {e}")
-            self.status = RepoStatus.ERROR_OPENAI_API
-            return -1
-        except OpenAIResponseError as e:
-            logging.error(f"OpenAI response format error for {self.repo_name}: {e}")
-            self.status = RepoStatus.ERROR_OPENAI_RESPONSE_FORMAT
-            return -1
-
-
-        updated_files_data = response.get("updated_files")
         if not updated_files_data: # Handles None or empty list
             logging.warning(f"No updated files returned by LLM for {self.repo_name}")
             # This isn't necessarily an error, could be that LLM found no changes needed
@@ -200,37 +614,33 @@ class RepoProcessor:
             return 0
 
         files_changed_count = 0
-        for file_info in updated_files_data:
-            file_path = file_info.get('file_path')
-            updated_code = file_info.get('updated_content')
-
-            if not file_path: # updated_code can be empty if LLM wants to delete a file (not handled here)
-                logging.warning(f"Missing 'file_path' in LLM response item: {file_info} for {self.repo_name}")
-                continue
-            if updated_code is None: # Explicitly check for None, as empty string is valid
-                logging.warning(f"Missing 'updated_content' in LLM response item: {file_info} for {self.repo_name}")
-                continue
-
-
-            full_write_path = os.path.join(self.repo_path, file_path)
-            # Ensure the original file was one of the targets to prevent arbitrary writes
-            if file_path not in self.target_files:
-                logging.warning(f"LLM tried to update non-target file '{file_path}'. Skipping.")
-                continue
-
-            try:
-                os.makedirs(os.path.dirname(full_write_path), exist_ok=True)
-                with open(full_write_path, 'w', encoding='utf-8') as f: # Specify encoding
-                    f.write(updated_code)
-                logging.debug(f"Updated file {file_path} in {self.repo_name}")
-                files_changed_count += 1
-            except IOError as e:
-                logging.error(f"Failed to write updated file {full_write_path}: {e}")
-                self.status = RepoStatus.ERROR_APPLYING_CHANGES # Or a more specific IO error status
-                # Decide if one file write error should stop the whole process for this repo
-                # For now, let's continue trying to write other files but mark overall as error.
-                # If this happens, it might be better to return -1 to stop further processing.
-
+        self.file_changes = {}
+        with self._span("write_files"): # One span per repository; files written while streaming count toward generate_code
+            for file_info in updated_files_data:
+                file_path = file_info.get('file_path')
+                if self._is_unchanged(file_info, current_files):
+                    self.file_changes[file_path] = "unchanged" # Returned as-is, as the prompt asks when nothing needs changing
+                    continue
+                if file_path in streamed_files and streamed_files[file_path] == file_info.get('updated_content'):
+                    files_changed_count += 1 # Already written while the response was streaming
+                    self.file_changes[file_path] = "changed"
+                    continue
+                if self._write_file_update(file_info):
+                    files_changed_count += 1
+                    self.file_changes[file_path] = "changed"
+
+        if files_changed_count and not self._tree_changed(list(self.applied_updates)):
+            logging.info(f"git reports no changes to the target files of {self.repo_name}")
+            self.file_changes = {file_path: "unchanged" for file_path in self.file_changes}
+            files_changed_count = 0
+        if self.metrics and self.file_changes:
+            self.metrics.record_files(self.repo_name, self.file_changes)
+
+        if files_changed_count == 0 and self.file_changes:
+            logging.info(f"All {len(self.file_changes)} returned file(s) for {self.repo_name} match the originals; "
+                         f"skipping build, commit and pull request")
+            self.status = RepoStatus.SUCCESS_NO_CHANGES
+            return 0
         if files_changed_count == 0 and updated_files_data:
             # LLM returned file data, but none were valid targets or writable
             logging.warning(f"LLM returned data but no valid target files were updated for {self.repo_name}.")
@@ -0,0 +1,78 @@
+import logging
+import os
+import shlex
+import subprocess
+
+from exceptions import GitHubClientError
+
+# Values for the 'clone_strategy' setting
+CLONE_STRATEGY_FULL = "full" # Regular clone through GitHubClient
+CLONE_STRATEGY_SPARSE = "sparse" # Depth-1, blob-filtered clone that checks out only the paths we need
+CLONE_STRATEGY_MIRROR = "mirror" # Worktree off a persistent local mirror (see mirror_store.py)
+CLONE_STRATEGIES = (CLONE_STRATEGY_FULL, CLONE_STRATEGY_SPARSE, CLONE_STRATEGY_MIRROR)
+
+# Files the build tool reads before anything else, keyed by the executable in build_command
+BUILD_TOOL_PATHS = {
+    "make": ["Makefile", "makefile", "GNUmakefile"],
+    "mvn": ["pom.xml", ".mvn/"],
+    "./mvnw": ["pom.xml", "mvnw", ".mvn/"],
+    "gradle": ["build.gradle", "build.gradle.kts", "settings.gradle", "settings.gradle.kts", "gradle.properties"],
+    "./gradlew": ["build.gradle", "build.gradle.kts", "settings.gradle", "settings.gradle.kts", "gradle.properties", "gradlew", "gradle/"],
+    "npm": ["package.json", "package-lock.json"],
+    "tox": ["tox.ini", "setup.py", "setup.cfg", "pyproject.toml"],
+}
+
+
+def run_git(args: list[str], cwd: str | None = None, env: dict | None = None) -> str:
+    cmd = ["git", *args]
+    logging.debug(f"Running: {' '.join(cmd)}")
+    try:
+        process = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, check=True,
+                                 env={**os.environ, **env} if env else None)
+    except FileNotFoundError as e:
+        raise GitHubClientError(f"git executable not found: {e}") from e
+    except subprocess.CalledProcessError as e:
+        raise GitHubClientError(f"'{' '.join(cmd)}' failed with code {e.returncode}: {e.stderr.strip()}") from e
+    return process.stdout
+
+
+def build_paths(build_command: str) -> list[str]:
+    """Returns the manifest paths the build command needs, based on its executable."""
+    try:
+        executable = shlex.split(build_command)[0] if build_command else ""
+    except ValueError:
+        return []
+    return list(BUILD_TOOL_PATHS.get(executable, []))
+
+
+def sparse_clone(repo_url: str, dest: str, paths: list[str]):
+    """
+    Clones only the latest commit, without file contents, and checks out just 'paths'.
+    Blobs for other paths are fetched lazily from the remote if the checkout is widened later.
+    """
+    # Top-level patterns in non-cone mode: '/pom.xml' matches only the root file, 'dir/' a whole directory
+    patterns = sorted({path if path.startswith("/") else f"/{path}" for path in paths})
+    try:
+        run_git(["clone", "--depth", "1", "--filter=blob:none", "--no-checkout", repo_url, dest])
+        run_git(["sparse-checkout", "set", "--no-cone", *patterns], cwd=dest)
+        run_git(["checkout"], cwd=dest)
+    except GitHubClientError as e:
+        raise GitHubClientError(f"Sparse clone of {repo_url} failed: {e}") from e
+    logging.info(f"Sparse clone of {repo_url} checked out {len(patterns)} path pattern(s)")
+
+
+def is_sparse(repo_path: str) -> bool:
+    try:
+        value = run_git(["config", "--bool", "core.sparseCheckout"], cwd=repo_path)
+    except GitHubClientError:
+        return False # Unset config exits non-zero
+    return value.strip() == "true"
+
+
+def widen_checkout(repo_path: str):
+    """Turns a sparse checkout into a full one, fetching the missing blobs. Local edits are kept."""
+    try:
+        run_git(["sparse-checkout", "disable"], cwd=repo_path)
+    except GitHubClientError as e:
+        raise GitHubClientError(f"Failed to widen sparse clone to a full checkout: {e}") from e
+    logging.info(f"Widened sparse checkout in {repo_path}")
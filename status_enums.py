@@ -16,6 +16,9 @@ class RepoStatus(Enum):
     ERROR_GENERIC = auto()
     ERROR_TARGET_FILES_NOT_FOUND_PARTIAL = auto() # Some target files were not found
     ERROR_TARGET_FILES_NOT_FOUND_ALL = auto() # All target files were not found
+    ERROR_BUDGET_EXCEEDED = auto() # LLM call refused because the campaign's token budget was spent
+    ERROR_VALIDATION = auto() # Changed target files failed local validation (XML, JSON, shell syntax) even after a retry
+    SKIPPED_UNCHANGED = auto() # Incremental run: remote and inputs unchanged since the repository last ended with a PR or no changes
 
     def __str__(self):
         return self.name.replace("_", " ").title()
\ No newline at end of file
@@ -0,0 +1,92 @@
+import json
+
+from exceptions import LLMResponseError
+
+
+class UpdatedFilesStreamParser:
+    """
+    Incremental parser for streamed {"updated_files": [ {...}, {...} ]} responses.
+    Each feed() scans only the new text and returns the 'updated_files' entries that closed in it,
+    so callers can act on a file while the rest of the response is still being generated.
+    """
+
+    def __init__(self, array_key: str = "updated_files"):
+        self.array_key = array_key
+        self._parts = [] # Every chunk fed so far, joined once in document()
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_chars = [] # Current string at depth 1, used to recognise keys
+        self._last_string = None
+        self._current_key = None
+        self._in_target_array = False
+        self._item_chars = None # Characters of the entry currently being captured
+        self._started = False
+        self.items_emitted = 0
+
+    @property
+    def complete(self) -> bool:
+        """True once the top-level object has been closed."""
+        return self._started and self._depth == 0
+
+    def feed(self, chunk: str) -> list[dict]:
+        self._parts.append(chunk)
+        completed = []
+        for char in chunk:
+            if self._item_chars is not None:
+                self._item_chars.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = "".join(self._string_chars)
+                elif self._depth == 1:
+                    self._string_chars.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_chars = []
+            elif char == ":" and self._depth == 1:
+                self._current_key = self._last_string
+            elif char in "{[":
+                if self._depth == 1 and char == "[" and self._current_key == self.array_key:
+                    self._in_target_array = True
+                elif self._depth == 2 and char == "{" and self._in_target_array:
+                    self._item_chars = [char]
+                self._depth += 1
+                self._started = True
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth < 0:
+                    raise LLMResponseError("Streamed JSON has more closing brackets than opening ones.")
+                if self._depth == 2 and self._item_chars is not None:
+                    completed.append(self._finish_item())
+                elif self._depth == 1 and self._in_target_array:
+                    self._in_target_array = False
+        self.items_emitted += len(completed)
+        return completed
+
+    def _finish_item(self) -> dict:
+        text = "".join(self._item_chars)
+        self._item_chars = None
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            raise LLMResponseError(f"Streamed '{self.array_key}' entry is not valid JSON: {text[:200]}") from e
+
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def document(self) -> dict:
+        """Parses the full accumulated response. Call once the stream has finished."""
+        text = self.text()
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            raise LLMResponseError(f"Streamed response is not valid JSON: {text[:500]}") from e
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from exceptions import GitHubClientError
+from sparse_checkout import run_git
+from test_runner import is_maven_command
+
+DEFAULT_TEST_CACHE_DIR = ".test_cache"
+DEFAULT_MAX_AGE_DAYS = 7
+# Commands whose output identifies the toolchain a build ran with; override with 'test_cache_toolchain_commands'
+MAVEN_TOOLCHAIN_COMMANDS = ["java -version", "mvn -v"]
+
+
+def tree_hash(repo_path: str) -> str:
+    """
+    Hashes the working tree as git would commit it (tracked and untracked, non-ignored files),
+    using a throwaway index so the repository's real index is left untouched.
+    """
+    index_path = run_git(["rev-parse", "--git-path", "index"], cwd=repo_path).strip()
+    index_path = os.path.join(repo_path, index_path) # --git-path may be relative to repo_path
+    fd, temp_index = tempfile.mkstemp(prefix="tree-hash-", suffix=".index")
+    os.close(fd)
+    try:
+        if os.path.exists(index_path):
+            shutil.copyfile(index_path, temp_index) # Starting from the real index keeps 'git add' incremental
+        else:
+            os.remove(temp_index)
+        env = {"GIT_INDEX_FILE": temp_index}
+        run_git(["add", "-A"], cwd=repo_path, env=env)
+        return run_git(["write-tree"], cwd=repo_path, env=env).strip()
+    finally:
+        if os.path.exists(temp_index):
+            os.remove(temp_index)
+
+
+class TestResultCache:
+    """
+    Remembers builds that passed, keyed by (tree hash, build command, toolchain fingerprint, selected
+    environment variables). A repository whose working tree matches a tree that already passed with
+    the same toolchain can skip its build. Entries expire after max_age_days.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_TEST_CACHE_DIR, max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+                 env_vars: list[str] | None = None, toolchain_commands: list[str] | None = None):
+        self.cache_dir = cache_dir
+        self.max_age_seconds = max_age_days * 24 * 60 * 60
+        self.env_vars = list(env_vars or [])
+        self.toolchain_commands = toolchain_commands # None picks defaults from the build command
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _toolchain_fingerprint(self, build_command: str) -> str:
+        if self.toolchain_commands is not None:
+            commands = self.toolchain_commands
+        elif is_maven_command(build_command):
+            commands = MAVEN_TOOLCHAIN_COMMANDS
+        else:
+            commands = [f"{shlex.split(build_command)[0]} --version"] if build_command else []
+
+        key = tuple(commands)
+        with self._lock:
+            if key in self._fingerprints:
+                return self._fingerprints[key]
+        digest = hashlib.sha256()
+        for command in commands:
+            try:
+                process = subprocess.run(shlex.split(command), capture_output=True, text=True, timeout=60, check=False)
+                output = f"{process.returncode}\n{process.stdout}{process.stderr}"
+            except (OSError, subprocess.TimeoutExpired) as e:
+                output = f"unavailable: {e.__class__.__name__}"
+            digest.update(f"{command}\n{output}\n".encode("utf-8"))
+        with self._lock:
+            self._fingerprints[key] = digest.hexdigest()
+        return self._fingerprints[key]
+
+    def make_key(self, repo_path: str, build_command: str) -> str | None:
+        """Returns the cache key for the current working tree, or None if it cannot be hashed."""
+        try:
+            tree = tree_hash(repo_path)
+        except GitHubClientError as e:
+            logging.warning(f"Cannot hash working tree of {repo_path}, test cache disabled for it: {e}")
+            return None
+        payload = json.dumps({
+            "tree": tree,
+            "build_command": build_command,
+            "toolchain": self._toolchain_fingerprint(build_command),
+            "env": {name: os.environ.get(name) for name in sorted(self.env_vars)},
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def has_passed(self, key: str) -> bool:
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            fresh = time.time() - entry.get("created", 0) <= self.max_age_seconds
+        except (OSError, json.JSONDecodeError):
+            fresh = False
+        with self._lock:
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return fresh
+
+    def record_pass(self, key: str, repo_name: str, duration_seconds: float | None = None):
+        entry = {"created": time.time(), "repository": repo_name, "duration_seconds": duration_seconds}
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._entry_path(key))
+        with self._lock:
+            self.stores += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "stores": self.stores}
@@ -1,13 +1,261 @@
+import fcntl
+import hashlib
 import logging
+import os
+import signal
 import subprocess
 import shlex # For robust command splitting
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from exceptions import TestRunnerError
 
+DEFAULT_MAVEN_REPO = ".maven_cache"
+MAVEN_EXECUTABLES = ("mvn", "mvnw", "./mvnw")
+DEFAULT_BUILD_TIMEOUT_SECONDS = 60 * 60
+DEFAULT_NO_OUTPUT_TIMEOUT_SECONDS = 15 * 60 # A hung Surefire fork typically goes silent
+DEFAULT_TAIL_LINES = 200 # Lines of build output kept in memory and returned to the caller
+KILL_GRACE_SECONDS = 10 # Between SIGTERM and SIGKILL of the build's process group
+MAX_LINE_BYTES = 64 * 1024
+# Maven output when an offline build needs an artifact that is not in the local repository
+OFFLINE_MISS_MARKERS = ("in offline mode", "offline mode and the artifact")
+
+
+def is_maven_command(build_command: str) -> bool:
+    try:
+        return bool(build_command) and shlex.split(build_command)[0] in MAVEN_EXECUTABLES
+    except ValueError:
+        return False
+
+
+class MavenCache:
+    """
+    A local Maven repository shared by every build in the fleet (-Dmaven.repo.local).
+    main pre-warms the fleet's projects with dependency:go-offline, once per distinct pom.xml and
+    before any build starts, so builds can then run offline. Pre-warm, the only writer, holds an
+    exclusive flock on the repository; builds hold a shared one, so concurrent builds never see
+    half-written artifacts. Builds of poms that weren't pre-warmed go online into a private
+    repository of their own instead, so they never block each other or wait for a pre-warm.
+    """
+
+    def __init__(self, repo_dir: str = DEFAULT_MAVEN_REPO):
+        self.repo_dir = os.path.abspath(repo_dir)
+        self.marker_dir = os.path.join(self.repo_dir, ".prewarmed") # One marker per resolved pom.xml hash
+        self.private_dir = os.path.join(self.repo_dir, ".private") # Per-build repositories of online fallback builds
+        os.makedirs(self.marker_dir, exist_ok=True)
+        os.makedirs(self.private_dir, exist_ok=True)
+        self._lock_path = os.path.join(self.repo_dir, ".lock")
+        self._stats_lock = threading.Lock()
+        self._pom_locks = {} # In-process guard so two workers don't pre-warm the same pom twice
+        self.hits = 0
+        self.misses = 0
+        self.prewarm_failures = 0
+        self.offline_builds = 0
+        self.online_builds = 0
+
+    @contextmanager
+    def locked(self, exclusive: bool):
+        with open(self._lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def record(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @staticmethod
+    def _pom_hash(project_dir: str) -> str | None:
+        try:
+            with open(os.path.join(project_dir, "pom.xml"), 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+
+    def _pom_lock(self, pom_hash: str) -> threading.Lock:
+        with self._stats_lock:
+            return self._pom_locks.setdefault(pom_hash, threading.Lock())
+
+    def is_warm(self, project_dir: str) -> bool:
+        pom_hash = self._pom_hash(project_dir)
+        return pom_hash is not None and os.path.exists(os.path.join(self.marker_dir, pom_hash))
+
+    def prewarm(self, project_dirs: list[str], maven_executable: str = "mvn"):
+        """
+        Resolves the union of dependencies and plugins of the given projects into the shared repository.
+        Projects with identical pom.xml files are resolved once; already resolved poms are cache hits.
+        """
+        distinct = {}
+        for project_dir in project_dirs:
+            pom_hash = self._pom_hash(project_dir)
+            if pom_hash:
+                distinct.setdefault(pom_hash, project_dir)
+
+        for pom_hash, project_dir in distinct.items():
+            marker = os.path.join(self.marker_dir, pom_hash)
+            with self._pom_lock(pom_hash):
+                if os.path.exists(marker):
+                    self.record("hits")
+                    continue
+                self.record("misses")
+                logging.info(f"Pre-warming Maven dependencies for {project_dir}")
+                cmd = [maven_executable, "-B", "-q", f"-Dmaven.repo.local={self.repo_dir}", "dependency:go-offline"]
+                with self.locked(exclusive=True):
+                    try:
+                        process = subprocess.run(cmd, cwd=project_dir, capture_output=True, text=True, check=False)
+                    except FileNotFoundError as e:
+                        raise TestRunnerError(f"Maven executable not found while pre-warming: {e}") from e
+                if process.returncode == 0:
+                    with open(marker, 'w') as f:
+                        f.write(project_dir)
+                else:
+                    self.record("prewarm_failures") # The build itself will resolve online
+                    logging.warning(f"Maven pre-warm failed for {project_dir} (code {process.returncode}): {process.stdout[-2000:]}")
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "prewarm_failures": self.prewarm_failures,
+                "offline_builds": self.offline_builds,
+                "online_builds": self.online_builds,
+            }
+
+
+@contextmanager
+def _no_log():
+    yield None
+
+
 class TestRunner:
     """Runs tests for the given repository."""
 
-    def __init__(self, build_command: str):
+    def __init__(self, build_command: str, maven_cache: MavenCache | None = None,
+                 timeout_seconds: float = DEFAULT_BUILD_TIMEOUT_SECONDS,
+                 no_output_timeout_seconds: float = DEFAULT_NO_OUTPUT_TIMEOUT_SECONDS,
+                 tail_lines: int = DEFAULT_TAIL_LINES, log_dir: str | None = None):
         self.build_command = build_command
+        self.maven_cache = maven_cache # Shared local Maven repository; only used for Maven build commands
+        self.timeout_seconds = timeout_seconds
+        self.no_output_timeout_seconds = no_output_timeout_seconds
+        self.tail_lines = tail_lines
+        self.log_dir = log_dir # Full build output goes to <log_dir>/<repo>.log; only a tail is kept in memory
+        self.last_result = None # {"returncode", "duration_seconds", "peak_rss_kb", "timed_out", "log_path"} of the last build
+
+    def _log_path(self, repo_path: str) -> str | None:
+        if not self.log_dir:
+            return None
+        os.makedirs(self.log_dir, exist_ok=True)
+        return os.path.join(self.log_dir, f"{os.path.basename(os.path.normpath(repo_path))}.log")
+
+    @staticmethod
+    def _kill_group(process: subprocess.Popen, sig: int):
+        try:
+            os.killpg(process.pid, sig) # The build runs in its own session, so this reaches every fork
+        except ProcessLookupError:
+            pass
+
+    def _execute(self, cmd: list[str], repo_path: str) -> tuple[int, str]:
+        """
+        Runs the build with stdout and stderr merged and streamed line by line: every line goes to the
+        per-repo log file, and only the last tail_lines stay in memory. The whole process group is
+        killed on the wall-clock or no-output timeout.
+        """
+        log_path = self._log_path(repo_path)
+        tail = deque(maxlen=self.tail_lines)
+        last_output = [time.monotonic()]
+        started = time.monotonic()
+
+        process = subprocess.Popen(cmd, cwd=repo_path, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   start_new_session=True)
+
+        def pump(log_file):
+            for raw_line in iter(lambda: process.stdout.readline(MAX_LINE_BYTES), b""):
+                last_output[0] = time.monotonic()
+                line = raw_line.decode("utf-8", errors="replace")
+                tail.append(line)
+                if log_file:
+                    log_file.write(line)
+
+        with open(log_path, 'w', encoding='utf-8') if log_path else _no_log() as log_file:
+            reader = threading.Thread(target=pump, args=(log_file,), daemon=True)
+            reader.start()
+
+            timed_out = None
+            status, rusage = None, None
+            while status is None:
+                pid, wait_status, usage = os.wait4(process.pid, os.WNOHANG)
+                if pid:
+                    status, rusage = wait_status, usage
+                    break
+                now = time.monotonic()
+                if timed_out is None:
+                    if now - started > self.timeout_seconds:
+                        timed_out = f"Build exceeded the {self.timeout_seconds:.0f}s time limit"
+                    elif now - last_output[0] > self.no_output_timeout_seconds:
+                        timed_out = f"Build produced no output for {self.no_output_timeout_seconds:.0f}s"
+                    if timed_out:
+                        logging.error(f"{timed_out} in {repo_path}; killing its process group")
+                        self._kill_group(process, signal.SIGTERM)
+                        kill_deadline = now + KILL_GRACE_SECONDS
+                elif now > kill_deadline:
+                    self._kill_group(process, signal.SIGKILL)
+                time.sleep(0.1)
+
+            process.returncode = os.waitstatus_to_exitcode(status) # Reaped by wait4 above
+            self._kill_group(process, signal.SIGKILL) # Forks that outlived the build would keep the pipe open
+            reader.join(KILL_GRACE_SECONDS)
+            process.stdout.close()
+
+        duration = time.monotonic() - started
+        self.last_result = {
+            "returncode": process.returncode,
+            "duration_seconds": duration,
+            "peak_rss_kb": rusage.ru_maxrss, # Largest of the build and the children it waited for
+            "timed_out": bool(timed_out),
+            "log_path": log_path,
+        }
+        summary = (f"Exit code {process.returncode} after {duration:.1f}s, peak RSS {rusage.ru_maxrss / 1024:.0f} MB"
+                   + (f". {timed_out}" if timed_out else "")
+                   + (f". Full log: {log_path}" if log_path else ""))
+        logging.info(f"Build in {repo_path}: {summary}")
+        return process.returncode, f"{summary}\nOUTPUT (last {len(tail)} lines):\n{''.join(tail)}"
+
+    def _run_with_maven_cache(self, cmd: list[str], repo_path: str) -> tuple[int, str]:
+        """
+        Builds offline against the shared repository, falling back to an online build if the pom wasn't
+        pre-warmed (e.g. a model tier rewrote it after the pre-warm) or artifacts are missing. The online build downloads into a private repository, so no
+        fleet-wide exclusive lock is held for a whole build; Maven 3.9+ still reads what the shared
+        repository has through maven.repo.local.tail, older versions download everything.
+        """
+        cache = self.maven_cache
+        repo_arg = f"-Dmaven.repo.local={cache.repo_dir}"
+        if cache.is_warm(repo_path):
+            with cache.locked(exclusive=False):
+                returncode, output = self._execute([cmd[0], "-o", repo_arg, *cmd[1:]], repo_path)
+            cache.record("offline_builds")
+            if returncode == 0 or not any(marker in output for marker in OFFLINE_MISS_MARKERS):
+                return returncode, output
+            logging.warning(f"Offline build in {repo_path} is missing artifacts; retrying online")
+
+        private_repo = tempfile.mkdtemp(prefix="build-", dir=cache.private_dir)
+        try:
+            with cache.locked(exclusive=False): # The shared repository is only read, as the tail
+                returncode, output = self._execute(
+                    [cmd[0], f"-Dmaven.repo.local={private_repo}", f"-Dmaven.repo.local.tail={cache.repo_dir}", *cmd[1:]],
+                    repo_path)
+        finally:
+            shutil.rmtree(private_repo, ignore_errors=True)
+        cache.record("online_builds")
+        return returncode, output
 
     def run_tests(self, repo_path: str) -> tuple[bool, str]:
         """
@@ -17,21 +265,16 @@ class TestRunner:
         logging.debug(f"Running tests in {repo_path} using command: {self.build_command}")
         try:
             cmd = shlex.split(self.build_command) # Use shlex for robust splitting
-            # Use subprocess.run to capture output
-            process = subprocess.run(
-                cmd,
-                cwd=repo_path,
-                capture_output=True,
-                text=True, # Decodes stdout/stderr to string
-                check=False # We'll check returncode manually
-            )
-            combined_output = f"STDOUT:\n{process.stdout}\nSTDERR:\n{process.stderr}"
-
-            if process.returncode == 0:
+            if self.maven_cache and is_maven_command(self.build_command):
+                returncode, combined_output = self._run_with_maven_cache(cmd, repo_path)
+            else:
+                returncode, combined_output = self._execute(cmd, repo_path)
+
+            if returncode == 0:
                 logging.info(f"Tests passed in {repo_path}.")
                 return True, combined_output
             else:
-                logging.error(f"Tests failed in {repo_path}. Return code: {process.returncode}")
+                logging.error(f"Tests failed in {repo_path}. Return code: {returncode}")
                 return False, combined_output
         except subprocess.CalledProcessError as e: # Should not be reached if check=False
             err_msg = f"Test execution failed with CalledProcessError for command '{self.build_command}': {e}"
@@ -46,4 +289,4 @@ class TestRunner:
         except Exception as e: # Catch any other exception during test run
             err_msg = f"An unexpected error occurred during test execution for command '{self.build_command}': {e}"
             logging.error(err_msg, exc_info=True)
-            raise TestRunnerError(err_msg) from e
\ No newline at end of file
+            raise TestRunnerError(err_msg) from e
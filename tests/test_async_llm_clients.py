@@ -0,0 +1,119 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+from benchmarks.fake_llm_server import FakeLLMServer
+from exceptions import LLMClientError
+from http_pool import close_http_pool, get_http_pool
+from openai_client import OpenAIClient
+from rate_limiter import ProviderRateLimiter
+
+CONTEXT = {"repository": "componenta", "current_files": {"pom.xml": "<source>1.8</source>"}}
+
+
+class TestOpenAIClientAsync(unittest.TestCase):
+
+    def make_client(self, latency_seconds=0.0, max_concurrency=8, **settings):
+        self.server = server = FakeLLMServer(latency_seconds=latency_seconds, tokens_per_second=1e6).start()
+        self.addCleanup(server.stop)
+        self.addCleanup(close_http_pool)
+        with patch.dict('os.environ', {"OPENAI_API_KEY": "test-key", "OPENAI_BASE_URL": server.base_url}):
+            client = OpenAIClient()
+            client.set_model_from_config({"openai_model_name": "fake-model", **settings})
+        client.rate_limiter = ProviderRateLimiter("openai", requests_per_minute=100_000, tokens_per_minute=100_000_000,
+                                                  max_concurrency=max_concurrency)
+        return client
+
+    def run_async(self, coroutine):
+        async def run():
+            try:
+                return await coroutine
+            finally:
+                await get_http_pool().aclose_async_client()
+        return asyncio.run(run())
+
+    def test_agenerate_code_returns_the_same_contract(self):
+        client = self.make_client()
+        response = self.run_async(client.agenerate_code("Upgrade {component_name}", CONTEXT))
+        self.assertEqual(response, {"updated_files": [{"file_path": "pom.xml", "updated_content": "<source>11</source>"}]})
+        self.assertEqual(client.generate_code("Upgrade {component_name}", CONTEXT), response)
+
+    def test_streaming_reports_files_as_they_arrive(self):
+        client = self.make_client(llm_streaming=True)
+        files, in_flight = [], []
+
+        def on_file(entry):
+            files.append(entry)
+            in_flight.append(client.rate_limiter._in_flight) # The slot is held while the stream is read
+        response = self.run_async(client.agenerate_code("Upgrade {component_name}", CONTEXT, on_file=on_file))
+        self.assertEqual(files, response["updated_files"])
+        self.assertEqual(in_flight, [1] * len(files))
+        self.assertEqual(client.rate_limiter._in_flight, 0)
+
+    def test_timeout_raises_llm_client_error(self):
+        client = self.make_client(latency_seconds=2.0, llm_call_timeout_seconds=0.2)
+        started = time.monotonic()
+        with self.assertRaises(LLMClientError):
+            self.run_async(client.agenerate_code("Upgrade {component_name}", CONTEXT))
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(client.rate_limiter._in_flight, 0)
+
+    def test_cancellation_releases_the_rate_limiter_slot(self):
+        client = self.make_client(latency_seconds=2.0)
+
+        async def cancel_midway():
+            task = asyncio.create_task(client.agenerate_code("Upgrade {component_name}", CONTEXT))
+            await asyncio.sleep(0.2)
+            self.assertEqual(client.rate_limiter._in_flight, 1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        self.run_async(cancel_midway())
+        self.assertEqual(client.rate_limiter._in_flight, 0)
+
+    def test_a_stream_aborted_midway_frees_its_host_slot(self):
+        close_http_pool()
+        get_http_pool({"max_connections_per_host": 1, "slot_timeout_seconds": 2})
+        client = self.make_client(llm_streaming=True)
+
+        def fail_on_file(entry):
+            raise OSError("disk full")
+        for generate in (lambda on_file: client.generate_code("Upgrade {component_name}", CONTEXT, on_file=on_file),
+                         lambda on_file: self.run_async(client.agenerate_code("Upgrade {component_name}", CONTEXT, on_file=on_file))):
+            with self.assertRaises(OSError):
+                generate(fail_on_file)
+            # With the one slot still held this would fail with a pool timeout
+            self.assertIn("updated_files", generate(None))
+
+    def test_a_429_is_retried_by_the_rate_limiter_not_the_sdk(self):
+        for generate in (lambda client: client.generate_code("Upgrade {component_name}", CONTEXT),
+                         lambda client: self.run_async(client.agenerate_code("Upgrade {component_name}", CONTEXT))):
+            client = self.make_client(max_concurrency=8)
+            # The first request gets a 429 (with Retry-After: 0), the next succeeds
+            with patch.object(self.server, "_should_fail", side_effect=[True, False]) as should_fail, \
+                    patch.object(self.server, "_random") as server_random:
+                server_random.random.return_value = 0.0
+                self.assertIn("updated_files", generate(client))
+
+            self.assertEqual(should_fail.call_count, 2)
+            stats = client.rate_limiter.stats()
+            self.assertEqual((stats["retries"], stats["throttled"]), (1, 1))
+            self.assertEqual(stats["concurrency_limit"], 4) # Halved by the limiter's AIMD control
+
+    def test_many_calls_overlap_on_one_event_loop(self):
+        client = self.make_client(latency_seconds=0.3, max_concurrency=64)
+
+        async def fan_out():
+            return await asyncio.gather(*(client.agenerate_code("Upgrade {component_name}", CONTEXT) for _ in range(40)))
+
+        started = time.monotonic()
+        responses = self.run_async(fan_out())
+        self.assertEqual(len(responses), 40)
+        self.assertLess(time.monotonic() - started, 40 * 0.3 / 4) # Far from sequential
+        self.assertEqual(client.rate_limiter._in_flight, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from campaign_journal import CampaignJournal
+from repo_processor import RepoProcessor
+from status_enums import RepoStatus
+
+
+class TestCampaignJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.journal = CampaignJournal(os.path.join(self.temp_dir, "campaign.journal.jsonl"))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_load_replays_the_current_campaign(self):
+        self.journal.start(resumed=False)
+        self.journal.record_step("old-repo", "clone")
+        self.journal.start(resumed=False) # A fresh campaign forgets the previous one
+        self.journal.record_step("repo1", "clone")
+        self.journal.record_step("repo1", "apply", {"updated_files": {"pom.xml": "<new/>"}})
+        self.journal.record_status("repo1", RepoStatus.ERROR_PUSHING)
+        self.journal.start(resumed=True)
+        self.journal.record_step("repo2", "clone")
+        with open(self.journal.path, 'a') as f:
+            f.write('{"event": "step", "repo": "repo2", "st') # Crash mid-write
+
+        state = self.journal.load()
+
+        self.assertEqual(set(state), {"repo1", "repo2"})
+        self.assertEqual(state["repo1"]["status"], RepoStatus.ERROR_PUSHING)
+        self.assertEqual(state["repo1"]["steps"]["apply"]["updated_files"], {"pom.xml": "<new/>"})
+        self.assertEqual(list(state["repo2"]["steps"]), ["clone"])
+        self.assertIsNone(state["repo2"]["status"])
+
+    def test_missing_journal_is_empty(self):
+        self.assertEqual(self.journal.load(), {})
+
+    @patch('repo_processor.GitHubClient')
+    @patch('repo_processor.TestRunner')
+    def test_processor_journals_steps_and_resumes_without_llm(self, MockTestRunner, MockGitHubClient):
+        repo_path = os.path.join(self.temp_dir, "repo1")
+        os.makedirs(repo_path)
+        with open(os.path.join(repo_path, "pom.xml"), 'w') as f:
+            f.write("<old/>")
+        context = {"global_settings": {"target_files": ["pom.xml"], "build_command": "make test"}}
+        llm_client = MagicMock()
+        llm_client.generate_code.return_value = {"updated_files": [{"file_path": "pom.xml", "updated_content": "<new/>"}]}
+        github_client = MockGitHubClient.return_value
+        github_client.push_branch.side_effect = Exception("push rejected")
+        MockTestRunner.return_value.run_tests.return_value = (True, "ok")
+
+        processor = RepoProcessor("repo1", context, "prompt", llm_client, github_client, repo_path=repo_path)
+        processor.journal = self.journal
+        processor.process()
+        state = self.journal.load()["repo1"]
+        self.assertEqual(list(state["steps"]), ["clone", "branch", "apply", "test"])
+        self.assertEqual(state["steps"]["apply"]["updated_files"], {"pom.xml": "<new/>"})
+        self.assertEqual(state["status"], RepoStatus.ERROR_GENERIC)
+
+        github_client.push_branch.side_effect = None
+        github_client.create_pull_request.return_value = "https://github.com/org/repo1/pull/1"
+        with open(os.path.join(repo_path, "pom.xml"), 'w') as f:
+            f.write("<old/>") # A fresh workspace
+        retry = RepoProcessor("repo1", context, "prompt", llm_client, github_client, repo_path=repo_path)
+        retry.journal = self.journal
+        retry.resume_from(state["steps"])
+        retry.process()
+
+        self.assertEqual(retry.status, RepoStatus.SUCCESS_PR_CREATED)
+        llm_client.generate_code.assert_called_once() # The retry replayed the journaled update
+        state = self.journal.load()["repo1"]
+        self.assertEqual(state["steps"]["publish"]["pr_url"], "https://github.com/org/repo1/pull/1")
+        self.assertEqual(state["status"], RepoStatus.SUCCESS_PR_CREATED)
+
+
+if __name__ == '__main__':
+    unittest.main()
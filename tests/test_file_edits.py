@@ -0,0 +1,42 @@
+import unittest
+
+from exceptions import PatchApplyError
+from file_edits import apply_search_replace
+
+
+class TestApplySearchReplace(unittest.TestCase):
+
+    def setUp(self):
+        self.pom = (
+            "<properties>\n"
+            "    <java.version>1.8</java.version>\n"
+            "    <slf4j.version>1.7.25</slf4j.version>\n"
+            "</properties>\n"
+        )
+
+    def test_edits_apply_in_order(self):
+        updated = apply_search_replace(self.pom, [
+            {"search": "<java.version>1.8</java.version>", "replace": "<java.version>11</java.version>"},
+            {"search": "<java.version>11</java.version>\n", "replace": "<java.version>11</java.version>\n    <!-- bumped -->\n"},
+        ])
+        self.assertIn("<java.version>11</java.version>\n    <!-- bumped -->\n", updated)
+        self.assertIn("<slf4j.version>1.7.25</slf4j.version>", updated)
+
+    def test_no_edits_returns_original(self):
+        self.assertEqual(apply_search_replace(self.pom, []), self.pom)
+
+    def test_missing_search_text_fails(self):
+        with self.assertRaises(PatchApplyError):
+            apply_search_replace(self.pom, [{"search": "<java.version>1.7</java.version>", "replace": "x"}])
+
+    def test_ambiguous_search_text_fails(self):
+        with self.assertRaises(PatchApplyError):
+            apply_search_replace(self.pom, [{"search": ".version>", "replace": "x"}])
+
+    def test_empty_search_fails(self):
+        with self.assertRaises(PatchApplyError):
+            apply_search_replace(self.pom, [{"search": "", "replace": "x"}])
+
+
+if __name__ == '__main__':
+    unittest.main()
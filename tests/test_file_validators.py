@@ -0,0 +1,59 @@
+import os
+import shutil
+import unittest
+from unittest.mock import patch
+
+import file_validators
+from file_validators import check_json_schema, register_validator, validate_file, validate_files, PROJECT_JSON_SCHEMA
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def read_fixture(component: str, name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, component, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+class TestFileValidators(unittest.TestCase):
+
+    def test_fixtures_and_expected_updates_pass(self):
+        for component in ("componenta", "componentb", "componentc", "componentd", "componente"):
+            files = {name: read_fixture(component, name) for name in ("pom.xml", "project.json", "run")}
+            expected = {name: read_fixture(os.path.join("expected_updates", component), name) for name in files}
+            self.assertEqual(validate_files(files, files), {}, component)
+            self.assertEqual(validate_files(expected, files), {}, component)
+
+    def test_pom_must_be_well_formed_and_keep_its_coordinates(self):
+        original = read_fixture("componenta", "pom.xml")
+        self.assertIn("not well-formed XML", validate_file("pom.xml", original[:-20], original)[0])
+        renamed = original.replace("<artifactId>componenta</artifactId>", "<artifactId>other</artifactId>", 1)
+        self.assertEqual(validate_file("pom.xml", renamed, original), ["<artifactId> changed from 'componenta' to 'other'"])
+        self.assertEqual(validate_file("pom.xml", original.replace("<modelVersion>4.0.0</modelVersion>", ""), original),
+                         ["<modelVersion> was removed"])
+
+    def test_project_json_is_checked_against_its_schema(self):
+        self.assertIn("invalid JSON", validate_file("project.json", '{"name": "a",}')[0])
+        self.assertEqual(validate_file("project.json", '{"name": "a", "packaging": {"type": "jar", "requires": ["curl", 1]}}'),
+                         ["$.packaging.requires[1] should be string, got int"])
+        self.assertEqual(check_json_schema({"packaging": {}}, PROJECT_JSON_SCHEMA), ["$.name is missing", "$.packaging.type is missing"])
+
+    @unittest.skipUnless(shutil.which("bash"), "bash not installed")
+    def test_run_script_is_parsed_with_bash(self):
+        original = read_fixture("componenta", "run")
+        problems = validate_file("run", original.replace("\nfi\n", "\n"), original)
+        self.assertTrue(problems and problems[0].startswith("bash -n:"), problems)
+        self.assertIn("the shebang line was removed", validate_file("run", original.split("\n", 1)[1], original))
+
+    def test_llm_artifacts_are_rejected_for_any_file(self):
+        self.assertEqual(validate_file("notes.txt", "```\ntext\n```"), ["content is wrapped in a Markdown code fence"])
+        self.assertEqual(validate_file("pom.xml", "", "<project/>"), ["file is empty"])
+
+    def test_registered_validators_take_precedence(self):
+        with patch.object(file_validators, "_VALIDATORS", list(file_validators._VALIDATORS)):
+            register_validator("*.xml", lambda content, original: ["custom"])
+            self.assertEqual(validate_file("pom.xml", "<project/>"), ["custom"])
+        self.assertEqual(validate_file("pom.xml", "<project/>"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+from unittest.mock import patch
+
+from benchmarks.fake_llm_server import FakeLLMServer
+from benchmarks.fleet_benchmark import make_remotes, run_benchmark
+from openai_client import OpenAIClient
+
+
+class TestFleetBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_remotes_cycle_through_the_fixtures(self):
+        remotes_dir = os.path.join(self.temp_dir, "remotes")
+        names = make_remotes(7, remotes_dir)
+
+        self.assertEqual(len(names), 7)
+        self.assertEqual(names[0].rsplit("-", 1)[0], names[5].rsplit("-", 1)[0]) # Five component fixtures
+        clone = os.path.join(self.temp_dir, "clone")
+        subprocess.run(["git", "clone", "--quiet", f"file://{remotes_dir}/{names[0]}", clone], check=True)
+        self.assertTrue(os.path.exists(os.path.join(clone, "pom.xml")))
+
+    def test_migrated_remotes_already_have_the_rewrite(self):
+        remotes_dir = os.path.join(self.temp_dir, "remotes")
+        names = make_remotes(2, remotes_dir, migrated=1)
+
+        def pom(name):
+            return subprocess.run(["git", "show", "HEAD:pom.xml"], cwd=os.path.join(remotes_dir, name),
+                                  capture_output=True, text=True, check=True).stdout
+        self.assertNotIn("<java.version>1.8</java.version>", pom(names[0]))
+        self.assertIn("1.8", pom(names[1]))
+
+    def test_fake_server_answers_openai_client(self):
+        context = {"repository": "componenta", "current_files": {"pom.xml": "<java.version>1.8</java.version>\n"}}
+        with FakeLLMServer(latency_seconds=0, tokens_per_second=1e6) as server:
+            with patch.dict(os.environ, {"OPENAI_API_KEY": "fake-key", "OPENAI_BASE_URL": server.base_url}):
+                client = OpenAIClient()
+            for stream in (False, True):
+                client.stream = stream
+                result = client.generate_code("Upgrade {component_name}", context)
+                self.assertEqual(result["updated_files"], [{"file_path": "pom.xml", "updated_content": "<java.version>11</java.version>\n"}])
+            self.assertEqual(server.stats()["requests"], 2)
+
+    def test_fake_server_injects_errors(self):
+        with FakeLLMServer(latency_seconds=0, error_rate=1.0) as server:
+            request = urllib.request.Request(f"{server.base_url}/chat/completions", data=json.dumps({"messages": []}).encode(), method="POST")
+            with self.assertRaises(urllib.error.HTTPError) as raised:
+                urllib.request.urlopen(request)
+            raised.exception.close()
+        self.assertIn(raised.exception.code, (429, 500))
+
+    def test_run_benchmark_end_to_end(self):
+        args = argparse.Namespace(repos=2, jobs=2, build_command="true", llm_latency=0, llm_tokens_per_second=1e6,
+                                  llm_error_rate=0.0, migrated_fraction=0.0, stream=False, seed=0,
+                                  work_dir=self.temp_dir, keep_work_dir=False)
+        cwd = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cwd)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(cwd)
+        report = run_benchmark(args, [])
+
+        self.assertEqual(report["repositories"], 2)
+        self.assertEqual(report["statuses"], {"SUCCESS_PR_CREATED": 2})
+        self.assertEqual(report["llm"]["requests"], 2)
+        self.assertEqual(report["llm"]["errors"], 0)
+        self.assertEqual(os.listdir(self.temp_dir), []) # The work directory is removed afterwards
+        self.assertEqual(os.listdir(cwd), []) # No journal or other state is left in the current directory
+
+    def test_fleet_state_is_kept_only_by_incremental_runs(self):
+        for main_args, kept in (([], False), (["--incremental"], True)):
+            work_dir = tempfile.mkdtemp(dir=self.temp_dir)
+            args = argparse.Namespace(repos=1, jobs=1, build_command="true", llm_latency=0, llm_tokens_per_second=1e6,
+                                      llm_error_rate=0.0, migrated_fraction=0.0, stream=False, seed=0,
+                                      work_dir=work_dir, keep_work_dir=True)
+            run_benchmark(args, main_args)
+            [bench_dir] = os.listdir(work_dir)
+            self.assertEqual(os.path.exists(os.path.join(work_dir, bench_dir, "fleet_state", "index.json")), kept, main_args)
+
+    def test_maven_dependencies_are_prewarmed_once_before_any_build(self):
+        bin_dir, log_path = os.path.join(self.temp_dir, "bin"), os.path.join(self.temp_dir, "mvn.log")
+        os.makedirs(bin_dir)
+        with open(os.path.join(bin_dir, "mvn"), 'w') as f:
+            f.write('#!/bin/sh\necho "$@" >> "$FAKE_MVN_LOG"\n')
+        os.chmod(os.path.join(bin_dir, "mvn"), 0o755)
+        work_dir = os.path.join(self.temp_dir, "work")
+        os.makedirs(work_dir)
+
+        for main_args in ([], ["--pipeline"]):
+            args = argparse.Namespace(repos=3, jobs=3, build_command="mvn -q test", llm_latency=0, llm_tokens_per_second=1e6,
+                                      llm_error_rate=0.0, migrated_fraction=0.0, stream=False, seed=0,
+                                      work_dir=work_dir, keep_work_dir=False)
+            with patch.dict(os.environ, {"PATH": f"{bin_dir}:{os.environ['PATH']}", "FAKE_MVN_LOG": log_path}):
+                report = run_benchmark(args, main_args)
+            with open(log_path) as f:
+                calls = [line.split() for line in f.read().splitlines()]
+            os.remove(log_path)
+
+            self.assertEqual(report["statuses"], {"SUCCESS_PR_CREATED": 3}, main_args)
+            prewarms = [call for call in calls if "dependency:go-offline" in call]
+            self.assertEqual(len(prewarms), 3, main_args) # Three distinct fixture poms
+            self.assertEqual(calls[:3], prewarms, main_args) # All of them before the first build
+            self.assertTrue(all("-o" in call for call in calls[3:]), main_args) # Every build found its pom pre-warmed
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import re
+import unittest
+from unittest.mock import MagicMock
+
+from exceptions import LLMClientError
+from fleet_dedup import FleetDeduplicator, REPO_NAME_TOKEN
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+COMPONENTS = ["componenta", "componentb", "componentc", "componentd", "componente"]
+TARGET_FILES = ["run", "project.json", "pom.xml"]
+
+
+class FixtureProcessor:
+    """Minimal RepoProcessor stand-in backed by a fixture directory."""
+
+    def __init__(self, repo_name):
+        self.repo_name = repo_name
+        self.repo_path = os.path.join(FIXTURE_DIR, repo_name)
+        self.precomputed_updates = {}
+
+    def read_target_files(self):
+        files = {}
+        for file_path in TARGET_FILES:
+            with open(os.path.join(self.repo_path, file_path), 'r', encoding='utf-8') as f:
+                files[file_path] = f.read()
+        return files
+
+
+def fake_java11_upgrade(prompt, context):
+    """Applies the Java 11 edits the real prompt asks for."""
+    updated = []
+    for file_path, content in context["current_files"].items():
+        content = (content.replace("<java.version>1.8</java.version>", "<java.version>11</java.version>")
+                   .replace('"java-1.8.0-openjdk"', '"java-11-openjdk"')
+                   .replace("address=5005", "address=*:5005"))
+        updated.append({"file_path": file_path, "updated_content": content})
+    return {"updated_files": updated}
+
+
+class TestFleetDeduplicator(unittest.TestCase):
+
+    def _expected(self, repo_name, file_path):
+        with open(os.path.join(FIXTURE_DIR, 'expected_updates', repo_name, file_path), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def test_exact_grouping_only_merges_byte_identical_repositories(self):
+        processors = [FixtureProcessor(name) for name in COMPONENTS]
+        groups = FleetDeduplicator(MagicMock(), "prompt").group(processors)
+        # Every fixture mentions its own component name, so nothing is byte-identical across repos
+        self.assertEqual(len(groups), len(COMPONENTS))
+        self.assertEqual([list(group.files) for group in groups], [TARGET_FILES] * len(COMPONENTS))
+
+    def test_normalized_grouping_calls_llm_once_per_group_and_fans_out(self):
+        processors = [FixtureProcessor(name) for name in COMPONENTS]
+        llm_client = MagicMock()
+        llm_client.generate_code.side_effect = fake_java11_upgrade
+
+        distinct_file_sets = {
+            tuple(re.sub(rf"\b{processor.repo_name}\b", REPO_NAME_TOKEN, content) for content in processor.read_target_files().values())
+            for processor in processors
+        }
+
+        deduplicator = FleetDeduplicator(llm_client, "prompt for {component_name}", normalize_repo_names=True)
+        deduplicator.resolve(processors)
+
+        self.assertEqual(llm_client.generate_code.call_count, len(distinct_file_sets))
+        self.assertLess(len(distinct_file_sets), len(COMPONENTS))
+        for call in llm_client.generate_code.call_args_list:
+            context = call.args[1]
+            self.assertEqual(context["repository"], REPO_NAME_TOKEN)
+            self.assertEqual(list(context["current_files"]), TARGET_FILES) # A repository's files stay in one request
+
+        # Each repo gets the shared answer with its own name restored
+        for processor in processors:
+            own_answer = fake_java11_upgrade("prompt", {"current_files": processor.read_target_files()})
+            for file_info in own_answer["updated_files"]:
+                self.assertEqual(processor.precomputed_updates[file_info["file_path"]], file_info["updated_content"],
+                                 f"{file_info['file_path']} mismatch for {processor.repo_name}")
+        for repo_name in ("componenta", "componentb"):
+            processor = next(p for p in processors if p.repo_name == repo_name)
+            for file_path in TARGET_FILES:
+                self.assertEqual(processor.precomputed_updates[file_path], self._expected(repo_name, file_path))
+        self.assertEqual(deduplicator.stats(), {"files_seen": 15, "llm_calls": len(distinct_file_sets), "failed_groups": 0})
+
+    def test_only_the_standalone_repository_name_and_the_exact_token_are_replaced(self):
+        processors = [FixtureProcessor("core"), FixtureProcessor("api")]
+        files = {"core": {"run": "java -jar core.jar --score=1 --coreutils\n"},
+                 "api": {"run": "java -jar api.jar --score=1 --coreutils\n"}}
+        for processor in processors:
+            processor.read_target_files = lambda name=processor.repo_name: files[name]
+        llm_client = MagicMock()
+        llm_client.generate_code.return_value = {"updated_files": [
+            {"file_path": "run", "updated_content": "java -Xmx1g -jar @@REPO_NAME@@.jar --score=1 --coreutils # REPO_NAME\n"}]}
+
+        deduplicator = FleetDeduplicator(llm_client, "prompt", normalize_repo_names=True)
+        deduplicator.resolve(processors)
+
+        llm_client.generate_code.assert_called_once() # "score" and "coreutils" are left alone, so the two repositories match
+        self.assertEqual(llm_client.generate_code.call_args.args[1]["current_files"]["run"],
+                         "java -jar @@REPO_NAME@@.jar --score=1 --coreutils\n")
+        self.assertEqual(processors[0].precomputed_updates["run"], "java -Xmx1g -jar core.jar --score=1 --coreutils # REPO_NAME\n")
+        self.assertEqual(processors[1].precomputed_updates["run"], "java -Xmx1g -jar api.jar --score=1 --coreutils # REPO_NAME\n")
+
+    def test_failed_group_leaves_members_to_request_individually(self):
+        processors = [FixtureProcessor(name) for name in COMPONENTS[:2]]
+        llm_client = MagicMock()
+        llm_client.generate_code.side_effect = LLMClientError("provider down")
+
+        deduplicator = FleetDeduplicator(llm_client, "prompt", normalize_repo_names=True)
+        deduplicator.resolve(processors)
+
+        for processor in processors:
+            self.assertEqual(processor.precomputed_updates, {})
+        self.assertEqual(deduplicator.stats()["failed_groups"], llm_client.generate_code.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from fleet_state import FleetStateIndex, git_blob_hash
+from repo_processor import RepoProcessor
+from status_enums import RepoStatus
+
+
+def git(*args, cwd):
+    return subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@example.com", *args],
+                          cwd=cwd, check=True, capture_output=True, text=True).stdout
+
+
+@unittest.skipUnless(shutil.which("git"), "git is not installed")
+class TestFleetStateIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.origin = os.path.join(self.temp_dir, "origin")
+        os.makedirs(self.origin)
+        git("init", "-q", "-b", "main", cwd=self.origin)
+        self.commit("pom.xml", "<java.version>1.8</java.version>\n")
+        self.state_dir = os.path.join(self.temp_dir, "state")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def commit(self, path, content):
+        with open(os.path.join(self.origin, path), 'w') as f:
+            f.write(content)
+        git("add", "-A", cwd=self.origin)
+        git("commit", "-q", "-m", f"update {path}", cwd=self.origin)
+
+    def make_processor(self, prompt="Upgrade to Java 11"):
+        context = {"repositories": ["origin"],
+                   "repository_settings": {"origin": {"repo_base_url": self.temp_dir, "target_files": ["pom.xml", "run"]}}}
+        return RepoProcessor("origin", context, prompt, MagicMock(), MagicMock())
+
+    def record_run(self, status, applied_updates=None):
+        """Records a processor as if it had just handled the origin's current HEAD, and saves the index."""
+        processor = self.make_processor()
+        processor.repo_path = os.path.join(self.temp_dir, f"checkout-{len(os.listdir(self.temp_dir))}")
+        git("clone", "-q", self.origin, processor.repo_path, cwd=self.temp_dir)
+        processor.base_revision = processor._read_base_revision()
+        processor.status = status
+        processor.applied_updates = applied_updates or {}
+        index = FleetStateIndex(self.state_dir)
+        index.record(processor)
+        index.save()
+        return processor
+
+    def select(self, prompt="Upgrade to Java 11"):
+        index = FleetStateIndex(self.state_dir)
+        processor = self.make_processor(prompt)
+        return index, processor, index.select_changed([processor])
+
+    def test_unchanged_head_is_skipped_without_a_fetch(self):
+        self.record_run(RepoStatus.SUCCESS_NO_CHANGES)
+
+        index, processor, changed = self.select()
+        self.assertEqual(changed, [])
+        self.assertEqual(processor.status, RepoStatus.SKIPPED_UNCHANGED)
+        self.assertTrue(processor.halted)
+        self.assertEqual(index.stats()["tree_lookups"], 0)
+
+    def test_failed_runs_and_changed_inputs_are_processed_again(self):
+        self.record_run(RepoStatus.ERROR_TESTS_FAILED)
+        self.assertEqual(len(self.select()[2]), 1)
+
+        self.record_run(RepoStatus.SUCCESS_NO_CHANGES)
+        index, processor, changed = self.select(prompt="Upgrade to Java 17")
+        self.assertEqual(changed, [processor])
+        self.assertEqual(index.stats()["checked"], 0) # Decided without asking the remote
+
+    def test_new_head_is_skipped_only_if_target_files_are_unchanged(self):
+        self.record_run(RepoStatus.SUCCESS_NO_CHANGES)
+        self.commit("README.md", "docs\n")
+
+        index, _, changed = self.select()
+        self.assertEqual(changed, [])
+        self.assertEqual(index.stats()["tree_lookups"], 1)
+        index.save()
+        self.assertEqual(self.select()[0].stats()["tree_lookups"], 0) # The new HEAD was remembered
+
+        self.commit("pom.xml", "<java.version>1.7</java.version>\n")
+        self.assertEqual(len(self.select()[2]), 1)
+
+    def test_merged_pull_request_is_not_processed_again(self):
+        updated = "<java.version>11</java.version>\n"
+        self.record_run(RepoStatus.SUCCESS_PR_CREATED, applied_updates={"pom.xml": updated})
+        self.commit("pom.xml", updated)
+
+        self.assertEqual(self.select()[2], [])
+        self.assertEqual(git_blob_hash(updated), git("hash-object", "pom.xml", cwd=self.origin).strip())
+
+    def test_unreachable_remote_is_processed(self):
+        self.record_run(RepoStatus.SUCCESS_NO_CHANGES)
+        shutil.rmtree(self.origin)
+
+        index, processor, changed = self.select()
+        self.assertEqual(changed, [processor])
+        self.assertEqual(index.stats()["lookup_failures"], 1)
+
+    def test_processors_that_never_cloned_leave_their_entry_alone(self):
+        self.record_run(RepoStatus.SUCCESS_NO_CHANGES)
+        index = FleetStateIndex(self.state_dir)
+        processor = self.make_processor()
+        processor.status = RepoStatus.ERROR_CLONING
+        index.record(processor)
+        self.assertEqual(index.entries["origin"]["status"], "SUCCESS_NO_CHANGES")
+
+
+if __name__ == '__main__':
+    unittest.main()
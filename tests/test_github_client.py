@@ -0,0 +1,84 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from exceptions import GitHubClientError
+from github_client import GitHubClient
+from repo_processor import RepoProcessor
+from status_enums import RepoStatus
+
+GIT_ENV = {"GIT_AUTHOR_NAME": "t", "GIT_AUTHOR_EMAIL": "t@example.com", "GIT_COMMITTER_NAME": "t", "GIT_COMMITTER_EMAIL": "t@example.com"}
+
+
+def git(*args, cwd):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True, env={**os.environ, **GIT_ENV}).stdout
+
+
+@unittest.skipUnless(shutil.which("git"), "git is not installed")
+class TestGitHubClient(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.origin = os.path.join(self.temp_dir, "origin.git")
+        seed = os.path.join(self.temp_dir, "seed")
+        os.makedirs(seed)
+        git("init", "-q", "-b", "main", cwd=seed)
+        with open(os.path.join(seed, "pom.xml"), 'w') as f:
+            f.write("<java.version>1.8</java.version>\n")
+        git("add", "-A", cwd=seed)
+        git("commit", "-q", "-m", "initial", cwd=seed)
+        git("clone", "-q", "--bare", seed, self.origin, cwd=self.temp_dir)
+        self.client = GitHubClient()
+        self.repo_path = os.path.join(self.temp_dir, "work", "origin")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @patch.dict(os.environ, GIT_ENV)
+    def test_clone_branch_commit_and_push(self):
+        self.client.clone_repo(self.origin, self.repo_path)
+        self.client.create_or_reset_branch(self.repo_path, "automated-fix")
+        with open(os.path.join(self.repo_path, "pom.xml"), 'w') as f:
+            f.write("<java.version>11</java.version>\n")
+        self.client.commit_changes(self.repo_path, "Upgrade to Java 11")
+        self.client.push_branch(self.repo_path, "automated-fix")
+
+        self.assertEqual(git("show", "automated-fix:pom.xml", cwd=self.origin), "<java.version>11</java.version>\n")
+        # A later run resets the branch and force-pushes over the earlier one
+        self.client.create_or_reset_branch(self.repo_path, "automated-fix")
+        self.client.push_branch(self.repo_path, "automated-fix")
+
+    def test_errors_name_the_operation_for_the_repository_status(self):
+        with self.assertRaisesRegex(GitHubClientError, "^clone of "):
+            self.client.clone_repo(os.path.join(self.temp_dir, "missing.git"), self.repo_path)
+
+        self.client.clone_repo(self.origin, self.repo_path)
+        with self.assertRaises(GitHubClientError) as raised:
+            self.client.commit_changes(self.repo_path, "nothing changed") # git says "On branch main, nothing to commit"
+        processor = RepoProcessor("origin", {}, "prompt", MagicMock(), self.client, repo_path=self.repo_path)
+        processor._handle_error(raised.exception)
+        self.assertEqual(processor.status, RepoStatus.ERROR_COMMITTING)
+
+    @patch('github_client.subprocess.run')
+    def test_pull_request_url_is_returned_even_if_one_is_already_open(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=0, stdout="\nhttps://github.com/org/repo/pull/7\n", stderr="")
+        self.assertEqual(self.client.create_pull_request(self.repo_path, "Title", "Body", ["alice", "bob"]),
+                         "https://github.com/org/repo/pull/7")
+        cmd = mock_run.call_args.args[0]
+        self.assertEqual(cmd[:3], ["gh", "pr", "create"])
+        self.assertEqual(cmd[-4:], ["--reviewer", "alice", "--reviewer", "bob"])
+
+        mock_run.return_value = MagicMock(returncode=1, stdout="", stderr=(
+            'a pull request for branch "fix" into branch "main" already exists:\nhttps://github.com/org/repo/pull/7\n'))
+        self.assertEqual(self.client.create_pull_request(self.repo_path, "Title", "Body", []), "https://github.com/org/repo/pull/7")
+
+        mock_run.return_value = MagicMock(returncode=1, stdout="", stderr="HTTP 403: Resource not accessible")
+        with self.assertRaisesRegex(GitHubClientError, "^pull request creation failed"):
+            self.client.create_pull_request(self.repo_path, "Title", "Body", [])
+
+
+if __name__ == '__main__':
+    unittest.main()
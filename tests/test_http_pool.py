@@ -0,0 +1,60 @@
+import json
+import threading
+import unittest
+
+import httpx
+
+from benchmarks.fake_llm_server import FakeLLMServer
+from http_pool import HTTPPool
+
+REQUEST = {"messages": [{"role": "user", "content": "Upgrade\n\nContext:\n{}"}]}
+
+
+class TestHTTPPool(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeLLMServer(latency_seconds=0, tokens_per_second=1e6).start()
+        self.addCleanup(self.server.stop)
+        self.url = f"{self.server.base_url}/chat/completions"
+
+    def test_connections_are_kept_alive_and_reused(self):
+        pool = HTTPPool({"http2": False})
+        client = pool.client()
+        for _ in range(3):
+            self.assertEqual(client.post(self.url, content=json.dumps(REQUEST)).status_code, 200)
+        pool.close()
+
+        stats = pool.stats()
+        self.assertEqual((stats["requests"], stats["connections_opened"], stats["reused"]), (3, 1, 2))
+        self.assertEqual(stats["tls_handshakes"], 0) # Plain HTTP
+
+    def test_per_host_limit_waits_for_the_response_to_be_closed(self):
+        pool = HTTPPool({"max_connections_per_host": 1})
+        client = pool.client()
+        second_done = threading.Event()
+
+        def second_request():
+            client.post(self.url, content=json.dumps(REQUEST))
+            second_done.set()
+
+        with client.stream("POST", self.url, content=json.dumps(REQUEST)) as response:
+            worker = threading.Thread(target=second_request)
+            worker.start()
+            self.assertFalse(second_done.wait(0.3)) # Blocked while the first body is still open
+            response.read()
+        worker.join(5)
+        self.assertTrue(second_done.is_set())
+        pool.close()
+
+    def test_waiting_for_a_slot_times_out(self):
+        pool = HTTPPool({"max_connections_per_host": 1, "slot_timeout_seconds": 0.2})
+        client = pool.client()
+        with client.stream("POST", self.url, content=json.dumps(REQUEST)):
+            with self.assertRaises(httpx.PoolTimeout):
+                client.post(self.url, content=json.dumps(REQUEST))
+        self.assertEqual(client.post(self.url, content=json.dumps(REQUEST)).status_code, 200) # Free again once closed
+        pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from llm_cache import CachingLLMClient, LLMResponseCache
+
+
+class TestLLMResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.context = {
+            "repository": "componenta",
+            "repo_path": "/tmp/run-1/componenta",
+            "target_files": ["pom.xml"],
+            "current_files": {"pom.xml": "<java.version>1.8</java.version>"},
+        }
+        self.response = {"updated_files": [{"file_path": "pom.xml", "updated_content": "<java.version>11</java.version>"}]}
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def _wrapped_client(self, cache):
+        inner = MagicMock()
+        inner.provider_name = "openai"
+        inner.model_name = "gpt-test"
+        inner.generate_code.return_value = self.response
+        return inner, CachingLLMClient(inner, cache)
+
+    def test_identical_request_is_served_from_cache(self):
+        cache = LLMResponseCache(self.cache_dir)
+        inner, client = self._wrapped_client(cache)
+
+        first = client.generate_code("Prompt {component_name}", self.context)
+        # A later run clones into a different temporary directory; that must not change the key
+        second = client.generate_code("Prompt {component_name}", dict(self.context, repo_path="/tmp/run-2/componenta"))
+
+        self.assertEqual(first, self.response)
+        self.assertEqual(second, self.response)
+        inner.generate_code.assert_called_once()
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_cache_persists_across_instances(self):
+        _, client = self._wrapped_client(LLMResponseCache(self.cache_dir))
+        client.generate_code("Prompt", self.context)
+
+        inner, client = self._wrapped_client(LLMResponseCache(self.cache_dir))
+        client.generate_code("Prompt", self.context)
+        inner.generate_code.assert_not_called()
+
+    def test_changed_file_content_or_model_misses(self):
+        cache = LLMResponseCache(self.cache_dir)
+        inner, client = self._wrapped_client(cache)
+        client.generate_code("Prompt", self.context)
+        client.generate_code("Prompt", dict(self.context, current_files={"pom.xml": "<java.version>11</java.version>"}))
+        inner.model_name = "gpt-other"
+        client.generate_code("Prompt", self.context)
+        self.assertEqual(inner.generate_code.call_count, 3)
+
+    def test_errors_are_not_cached(self):
+        cache = LLMResponseCache(self.cache_dir)
+        inner, client = self._wrapped_client(cache)
+        inner.generate_code.side_effect = RuntimeError("provider down")
+        with self.assertRaises(RuntimeError):
+            client.generate_code("Prompt", self.context)
+        self.assertEqual(cache.stats()["stores"], 0)
+
+    def test_expired_entries_are_misses(self):
+        cache = LLMResponseCache(self.cache_dir, max_age_seconds=60)
+        key = cache.make_key("openai", "gpt-test", "Prompt", self.context)
+        cache.put(key, self.response)
+        path = cache._entry_path(key)
+        old = time.time() - 120
+        os.utime(path, (old, old))
+        cache.evict()
+        self.assertFalse(os.path.exists(path))
+        self.assertIsNone(cache.get(key))
+
+    def test_size_budget_evicts_least_recently_used(self):
+        cache = LLMResponseCache(self.cache_dir)
+        keys = []
+        for i in range(3):
+            key = cache.make_key("openai", "gpt-test", f"Prompt {i}", self.context)
+            cache.put(key, self.response)
+            then = time.time() - (10 - i) # key 0 is the least recently used
+            os.utime(cache._entry_path(key), (then, then))
+            keys.append(key)
+
+        cache.max_bytes = sum(os.path.getsize(cache._entry_path(key)) for key in keys[1:])
+        cache.evict()
+
+        self.assertFalse(os.path.exists(cache._entry_path(keys[0])))
+        self.assertTrue(os.path.exists(cache._entry_path(keys[1])))
+        self.assertTrue(os.path.exists(cache._entry_path(keys[2])))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
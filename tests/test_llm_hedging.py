@@ -0,0 +1,123 @@
+import asyncio
+import unittest
+
+from exceptions import BudgetExceededError, LLMClientError, LLMResponseError
+from llm_hedging import HedgedLLMClient, validate_response
+
+RESPONSE = {"updated_files": [{"file_path": "pom.xml", "updated_content": "<source>11</source>"}]}
+CONTEXT = {"repository": "componenta"}
+
+
+class FakeProvider:
+    def __init__(self, model_name: str, delay: float = 0.0, result=RESPONSE):
+        self.model_name = model_name
+        self.usage_tracker = None
+        self.delay = delay
+        self.result = result
+        self.calls = 0
+        self.cancelled = 0
+
+    async def agenerate_code(self, prompt, context, on_file=None, timeout=None):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class TestHedgedLLMClient(unittest.TestCase):
+
+    def make_client(self, primary: FakeProvider, secondary: FakeProvider, **settings):
+        client = HedgedLLMClient({"gemini": primary, "openai": secondary},
+                                 {"initial_hedge_delay_seconds": 0.1, **settings})
+        self.addCleanup(client.close)
+        return client
+
+    def test_fast_primary_is_not_hedged(self):
+        primary, secondary = FakeProvider("g"), FakeProvider("o")
+        client = self.make_client(primary, secondary)
+
+        self.assertEqual(client.generate_code("prompt", CONTEXT), RESPONSE)
+        self.assertEqual((primary.calls, secondary.calls), (1, 0))
+        self.assertEqual(client.stats()["hedges"], 0)
+
+    def test_slow_primary_is_hedged_and_the_loser_cancelled(self):
+        primary, secondary = FakeProvider("g", delay=5.0), FakeProvider("o")
+        client = self.make_client(primary, secondary)
+        files = []
+
+        self.assertEqual(client.generate_code("prompt", CONTEXT, on_file=files.append), RESPONSE)
+        self.assertEqual(primary.cancelled, 1)
+        self.assertEqual(files, RESPONSE["updated_files"])
+        stats = client.stats()
+        self.assertEqual((stats["hedges"], stats["hedge_wins"]), (1, 1))
+        self.assertEqual(stats["providers"]["openai"]["wins"], 1)
+        self.assertEqual(stats["providers"]["gemini"]["errors"], 0) # Losing isn't failing
+
+    def test_failed_or_invalid_primary_fails_over_without_waiting(self):
+        for result in (LLMClientError("503"), {"updated_files": [{"file_path": "pom.xml"}]}):
+            primary, secondary = FakeProvider("g", result=result), FakeProvider("o")
+            client = self.make_client(primary, secondary, initial_hedge_delay_seconds=30)
+
+            self.assertEqual(client.generate_code("prompt", CONTEXT), RESPONSE)
+            stats = client.stats()
+            self.assertEqual((stats["hedges"], stats["providers"]["gemini"]["errors"]), (0, 1))
+
+    def test_primary_error_is_raised_when_every_provider_fails(self):
+        primary, secondary = FakeProvider("g", result=LLMResponseError("bad")), FakeProvider("o", result=LLMClientError("down"))
+        client = self.make_client(primary, secondary)
+
+        with self.assertRaises(LLMResponseError):
+            client.generate_code("prompt", CONTEXT)
+
+    def test_budget_errors_are_not_failed_over(self):
+        primary, secondary = FakeProvider("g", result=BudgetExceededError("over")), FakeProvider("o")
+        client = self.make_client(primary, secondary)
+
+        with self.assertRaises(BudgetExceededError):
+            client.generate_code("prompt", CONTEXT)
+        self.assertEqual(secondary.calls, 0)
+
+    def test_unhealthy_provider_is_skipped_until_its_cooldown_ends(self):
+        primary, secondary = FakeProvider("g", result=LLMClientError("503")), FakeProvider("o")
+        client = self.make_client(primary, secondary, min_error_samples=3, error_rate_threshold=0.5)
+
+        for _ in range(5):
+            client.generate_code("prompt", CONTEXT)
+        self.assertEqual(primary.calls, 3) # Skipped once 3 of 3 recent calls failed
+        stats = client.stats()
+        self.assertEqual(stats["failovers"], 1)
+        self.assertTrue(stats["providers"]["gemini"]["failed_over"])
+
+    def test_hedge_delay_follows_the_latency_percentile(self):
+        client = self.make_client(FakeProvider("g"), FakeProvider("o"), min_latency_samples=3, min_hedge_delay_seconds=0.5)
+        self.assertEqual(client.hedge_delay("gemini"), 0.1) # Too few samples
+        for latency in (1.0, 2.0, 3.0, 9.0):
+            client._record("gemini", failed=False, latency=latency)
+        self.assertEqual(client.hedge_delay("gemini"), 9.0)
+
+    def test_usage_tracker_is_shared_with_every_provider(self):
+        primary, secondary = FakeProvider("g"), FakeProvider("o")
+        client = self.make_client(primary, secondary)
+        client.usage_tracker = tracker = object()
+        self.assertIs(primary.usage_tracker, tracker)
+        self.assertIs(secondary.usage_tracker, tracker)
+
+
+class TestValidateResponse(unittest.TestCase):
+
+    def test_entries_must_match_the_response_mode(self):
+        validate_response(RESPONSE)
+        validate_response({"updated_files": [{"file_path": "a", "edits": []}]}, "edits")
+        with self.assertRaises(LLMResponseError):
+            validate_response(RESPONSE, "edits")
+        with self.assertRaises(LLMResponseError):
+            validate_response({"updated_files": "pom.xml"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import llm_providers
+from benchmarks.startup_time import parse_importtime, top_level_total_us
+
+IMPORTTIME_OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       100 |        100 |   _io
+import time:       400 |        500 | encodings
+import time:       200 |        200 |     status_enums
+import time:       300 |       1500 | repo_processor
+"""
+
+
+class TestLLMProviders(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.dict(llm_providers._PROVIDERS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_provider_module_is_imported_only_when_selected(self):
+        client_class = MagicMock()
+        module = SimpleNamespace(CustomClient=client_class)
+        llm_providers.register_configured_providers({"llm_providers": {"custom": "custom_client:CustomClient"}})
+
+        with patch("llm_providers.importlib.import_module", return_value=module) as import_module:
+            self.assertIn("custom", llm_providers.provider_names())
+            import_module.assert_not_called()
+            client = llm_providers.create_client("custom", {"setting": 1})
+
+        import_module.assert_called_once_with("custom_client")
+        self.assertIs(client, client_class.return_value)
+        client.set_model_from_config.assert_called_once_with({"setting": 1})
+
+    def test_unknown_and_invalid_providers(self):
+        with self.assertRaises(ValueError):
+            llm_providers.create_client("nope", {})
+        with self.assertRaises(ValueError):
+            llm_providers.register_provider("bad", "module_without_class")
+        with patch("llm_providers.importlib.import_module", return_value=SimpleNamespace()):
+            llm_providers.register_provider("missing", "some_module:Missing")
+            with self.assertRaises(ValueError):
+                llm_providers.create_client("missing", {})
+
+    def test_tier_clients_get_their_model_through_the_provider_setting(self):
+        with patch("llm_providers.create_client", side_effect=lambda name, settings: SimpleNamespace(model_name=settings[f"{name}_model_name"])) as create:
+            tiers = llm_providers.create_tier_clients([{"name": "small", "provider": "openai", "model": "gpt-4o-mini"},
+                                                      {"provider": "gemini", "model": "gemini-1.5-pro-latest"}], {"llm_streaming": True})
+        self.assertEqual([(tier["name"], tier["model"]) for tier in tiers],
+                         [("small", "gpt-4o-mini"), ("gemini-1.5-pro-latest", "gemini-1.5-pro-latest")])
+        self.assertTrue(create.call_args_list[0][0][1]["llm_streaming"])
+        with self.assertRaises(ValueError):
+            llm_providers.create_tier_clients([{"name": "no-model", "provider": "openai"}], {})
+
+    def test_importing_the_registry_loads_no_sdk(self):
+        code = "import sys, llm_providers; print(sorted(m for m in ('openai', 'google.generativeai') if m in sys.modules))"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "[]")
+
+    def test_importing_main_loads_no_sdk_or_httpx(self):
+        code = "import sys, main; print(sorted(m for m in ('openai', 'google.generativeai', 'httpx') if m in sys.modules))"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "[]")
+
+    def test_importtime_parsing(self):
+        modules = parse_importtime(IMPORTTIME_OUTPUT)
+        self.assertEqual(modules["status_enums"], (200, 200))
+        self.assertEqual(top_level_total_us(IMPORTTIME_OUTPUT), 2000) # encodings + repo_processor
+
+
+if __name__ == '__main__':
+    unittest.main()
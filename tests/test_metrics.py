@@ -0,0 +1,58 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from metrics import MetricsRecorder, percentile
+from status_enums import RepoStatus
+
+
+class TestMetricsRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.metrics = MetricsRecorder()
+        for index in range(1, 21):
+            self.metrics.record(f"repo{index}", "clone", float(index))
+        self.metrics.record("repo1", "write_files", 0.5)
+        self.metrics.record("repo1", "write_files", 0.25)
+        self.metrics.record_status("repo1", RepoStatus.SUCCESS_PR_CREATED)
+        self.metrics.record_status("repo2", RepoStatus.ERROR_TESTS_FAILED)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_percentiles(self):
+        self.assertEqual(percentile([3.0, 1.0, 2.0], 0.5), 2.0)
+        stats = self.metrics.summary()["clone"]
+        self.assertEqual((stats["count"], stats["p50"], stats["p95"], stats["max"]), (20, 10.0, 19.0, 20.0))
+        self.assertEqual(list(self.metrics.summary()), ["clone", "write_files"]) # Pipeline order
+
+    def test_span_records_elapsed_time_even_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with self.metrics.span("repo1", "push"):
+                raise RuntimeError("push rejected")
+        self.assertEqual(self.metrics.summary()["push"]["count"], 1)
+
+    def test_json_report_has_per_repo_records(self):
+        path = os.path.join(self.temp_dir, "metrics.json")
+        self.metrics.export_json(path)
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(report["repositories"]["repo1"]["status"], "SUCCESS_PR_CREATED")
+        self.assertEqual(report["repositories"]["repo1"]["stages"]["write_files"], 0.75)
+        self.assertEqual(report["stages"]["clone"]["max"], 20.0)
+
+    def test_prometheus_textfile(self):
+        path = os.path.join(self.temp_dir, "out", "tech_debt.prom")
+        self.metrics.export_prometheus(path)
+        with open(path) as f:
+            text = f.read()
+        self.assertIn('tech_debt_stage_duration_seconds{stage="clone",quantile="0.95"} 19.000000', text)
+        self.assertIn('tech_debt_stage_duration_seconds_count{stage="clone"} 20', text)
+        self.assertIn('tech_debt_repositories{status="ERROR_TESTS_FAILED"} 1', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from exceptions import GitHubClientError
+from mirror_store import MirrorStore
+
+
+def git(*args, cwd):
+    return subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@example.com", *args],
+                          cwd=cwd, check=True, capture_output=True, text=True).stdout
+
+
+@unittest.skipUnless(shutil.which("git"), "git is not installed")
+class TestMirrorStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.origin = os.path.join(self.temp_dir, "origin")
+        os.makedirs(self.origin)
+        git("init", "-q", "-b", "main", cwd=self.origin)
+        self.commit("pom.xml", "<java.version>1.8</java.version>\n")
+        self.store = MirrorStore(os.path.join(self.temp_dir, "store"))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def commit(self, path, content):
+        with open(os.path.join(self.origin, path), 'w') as f:
+            f.write(content)
+        git("add", "-A", cwd=self.origin)
+        git("commit", "-q", "-m", f"update {path}", cwd=self.origin)
+
+    def read(self, *parts):
+        with open(os.path.join(*parts)) as f:
+            return f.read()
+
+    def test_second_run_fetches_updates_into_existing_mirror(self):
+        first = os.path.join(self.temp_dir, "run1", "origin")
+        self.store.create_worktree(self.origin, first)
+        self.assertEqual(self.read(first, "pom.xml"), "<java.version>1.8</java.version>\n")
+        self.store.remove_worktree(self.origin, first)
+        self.assertFalse(os.path.exists(first))
+
+        self.commit("pom.xml", "<java.version>11</java.version>\n")
+        second = os.path.join(self.temp_dir, "run2", "origin")
+        self.store.create_worktree(self.origin, second)
+
+        self.assertEqual(self.read(second, "pom.xml"), "<java.version>11</java.version>\n")
+        self.assertEqual(self.store.stats()["created"], 1)
+        self.assertEqual(self.store.stats()["fetched"], 1)
+        # Branches made in the worktree live in the mirror and survive later fetches
+        git("checkout", "-q", "-b", "automated-fix", cwd=second)
+        self.commit("run", "#!/bin/sh\n")
+        self.store.create_worktree(self.origin, os.path.join(self.temp_dir, "run3", "origin"))
+        self.assertEqual(git("rev-parse", "--abbrev-ref", "HEAD", cwd=second).strip(), "automated-fix")
+
+    def test_pruned_worktrees_do_not_block_eviction(self):
+        worktree = os.path.join(self.temp_dir, "run", "origin")
+        self.store.create_worktree(self.origin, worktree)
+        self.store.max_bytes = 0
+
+        self.store.evict() # Worktree still in use
+        self.assertTrue(os.path.isdir(self.store.mirror_path(self.origin)))
+
+        shutil.rmtree(worktree) # e.g. a run that crashed before cleaning up
+        self.store.prune()
+        self.store.evict()
+        self.assertFalse(os.path.exists(self.store.mirror_path(self.origin)))
+        self.assertEqual(self.store.stats()["evicted"], 1)
+
+    def test_clone_failure_raises_clone_error(self):
+        with self.assertRaisesRegex(GitHubClientError, "clone"):
+            self.store.create_worktree(os.path.join(self.temp_dir, "missing"), os.path.join(self.temp_dir, "run", "x"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import threading
+import time
+import unittest
+
+from pipeline import PipelineOrchestrator, PipelineStage, default_stages
+from status_enums import RepoStatus
+
+
+class FakeProcessor:
+    """Stands in for RepoProcessor: records which steps ran and halts on request."""
+
+    def __init__(self, repo_name, halt_on=None, step_delay=0.0):
+        self.repo_name = repo_name
+        self.halt_on = halt_on
+        self.step_delay = step_delay
+        self.status = RepoStatus.NOT_PROCESSED
+        self.halted = False
+        self.steps_run = []
+        self.workspace_open = False
+        self.workspace_closed = False
+
+    def open_workspace(self):
+        self.workspace_open = True
+
+    def close_workspace(self):
+        self.workspace_closed = True
+
+    def run_steps(self, steps):
+        for step in steps:
+            time.sleep(self.step_delay)
+            self.steps_run.append(step)
+            if step == self.halt_on:
+                self.halted = True
+                self.status = RepoStatus.SUCCESS_NO_CHANGES
+                return False
+        if "publish" in steps:
+            self.status = RepoStatus.SUCCESS_PR_CREATED
+        return True
+
+
+class TestPipelineOrchestrator(unittest.TestCase):
+
+    def test_all_repos_run_every_stage_in_order(self):
+        processors = [FakeProcessor(f"repo{i}") for i in range(10)]
+        orchestrator = PipelineOrchestrator(default_stages({"clone": 3, "llm": 2, "build": 2, "publish": 1}), queue_size=2)
+        orchestrator.run(processors)
+
+        for processor in processors:
+            self.assertEqual(processor.steps_run, ["clone", "branch", "apply", "test", "publish"])
+            self.assertEqual(processor.status, RepoStatus.SUCCESS_PR_CREATED)
+            self.assertTrue(processor.workspace_open)
+            self.assertTrue(processor.workspace_closed)
+
+    def test_halted_repo_skips_later_stages(self):
+        halting = FakeProcessor("halts", halt_on="apply")
+        normal = FakeProcessor("normal")
+        orchestrator = PipelineOrchestrator(default_stages())
+        orchestrator.run([halting, normal])
+
+        self.assertEqual(halting.steps_run, ["clone", "branch", "apply"])
+        self.assertEqual(halting.status, RepoStatus.SUCCESS_NO_CHANGES)
+        self.assertTrue(halting.workspace_closed)
+        self.assertEqual(normal.status, RepoStatus.SUCCESS_PR_CREATED)
+
+        build_row = next(row for row in orchestrator.summary() if row["stage"] == "build")
+        self.assertEqual(build_row["items"], 1)
+
+    def test_stages_overlap_across_repos(self):
+        # Two single-worker stages: with overlap, 4 repos take ~5 step-times instead of 8.
+        active = set()
+        max_active = 0
+        lock = threading.Lock()
+
+        class TrackingProcessor(FakeProcessor):
+            def run_steps(self, steps):
+                nonlocal max_active
+                with lock:
+                    active.add(self.repo_name)
+                    max_active = max(max_active, len(active))
+                try:
+                    return super().run_steps(steps)
+                finally:
+                    with lock:
+                        active.discard(self.repo_name)
+
+        stages = [PipelineStage("a", ("clone",), 1), PipelineStage("b", ("publish",), 1)]
+        processors = [TrackingProcessor(f"repo{i}", step_delay=0.05) for i in range(4)]
+        orchestrator = PipelineOrchestrator(stages)
+        orchestrator.run(processors)
+
+        self.assertEqual(max_active, 2)
+        summary = orchestrator.summary()
+        self.assertEqual([row["items"] for row in summary], [4, 4])
+        for row in summary:
+            self.assertGreater(row["utilization"], 0.0)
+            self.assertLessEqual(row["utilization"], 1.0)
+
+    def test_unknown_stage_override_is_rejected(self):
+        with self.assertRaises(ValueError):
+            default_stages({"compile": 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
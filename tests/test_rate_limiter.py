@@ -0,0 +1,149 @@
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from rate_limiter import ProviderRateLimiter, TokenBucket, get_rate_limiter, retry_after_seconds
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = MagicMock(headers=headers or {})
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_reserve_waits_once_the_bucket_is_empty(self):
+        bucket = TokenBucket(per_minute=60) # One token per second
+        now = bucket.updated
+        self.assertEqual(bucket.reserve(60, now), 0.0)
+        self.assertAlmostEqual(bucket.reserve(2, now), 2.0)
+        self.assertAlmostEqual(bucket.reserve(1, now + 10), 0.0) # Refilled while idle
+
+    def test_oversized_requests_are_clamped_to_capacity(self):
+        bucket = TokenBucket(per_minute=100)
+        self.assertEqual(bucket.reserve(10_000, bucket.updated), 0.0)
+
+
+@patch('rate_limiter.time.sleep')
+class TestProviderRateLimiter(unittest.TestCase):
+
+    def make_limiter(self, **limits):
+        limits = {"requests_per_minute": 10_000, "tokens_per_minute": 10_000_000, **limits}
+        return ProviderRateLimiter("test", **limits)
+
+    def test_throttled_calls_are_retried_and_halve_concurrency(self, mock_sleep):
+        limiter = self.make_limiter(max_concurrency=8)
+        fn = MagicMock(side_effect=[HTTPError(429, {"retry-after": "7"}), "ok"])
+
+        self.assertEqual(limiter.call(fn), "ok")
+
+        self.assertEqual(fn.call_count, 2)
+        self.assertGreaterEqual(mock_sleep.call_args_list[0].args[0], 7) # Retry-After honoured
+        stats = limiter.stats()
+        self.assertEqual((stats["retries"], stats["throttled"]), (1, 1))
+        self.assertEqual(stats["concurrency_limit"], 4)
+
+    def test_concurrency_recovers_after_successes(self, mock_sleep):
+        limiter = self.make_limiter(max_concurrency=4)
+        limiter.call(MagicMock(side_effect=[HTTPError(429), "ok"]))
+        self.assertEqual(limiter.concurrency_limit, 2)
+        for _ in range(10):
+            limiter.call(lambda: "ok")
+        self.assertEqual(limiter.concurrency_limit, 4)
+
+    def test_non_retryable_errors_are_raised_immediately(self, mock_sleep):
+        limiter = self.make_limiter()
+        fn = MagicMock(side_effect=HTTPError(400))
+        with self.assertRaises(HTTPError):
+            limiter.call(fn)
+        self.assertEqual(fn.call_count, 1)
+        mock_sleep.assert_not_called()
+
+    def test_gives_up_after_max_retries(self, mock_sleep):
+        limiter = self.make_limiter(max_retries=2)
+        fn = MagicMock(side_effect=HTTPError(503))
+        with self.assertRaises(HTTPError):
+            limiter.call(fn)
+        self.assertEqual(fn.call_count, 3)
+
+    def test_backoff_grows_exponentially_with_jitter(self, mock_sleep):
+        limiter = self.make_limiter(max_retries=4, base_delay_seconds=1.0)
+        with patch('rate_limiter.random.uniform', side_effect=lambda low, high: high):
+            with self.assertRaises(HTTPError):
+                limiter.call(MagicMock(side_effect=HTTPError(500)))
+        self.assertEqual([c.args[0] for c in mock_sleep.call_args_list], [1.0, 2.0, 4.0, 8.0])
+
+    def test_concurrency_limit_is_enforced_across_threads(self, mock_sleep):
+        limiter = self.make_limiter(max_concurrency=2)
+        lock = threading.Lock()
+        running = {"now": 0, "peak": 0}
+        release = threading.Event()
+
+        def work():
+            with lock:
+                running["now"] += 1
+                running["peak"] = max(running["peak"], running["now"])
+            release.wait(1)
+            with lock:
+                running["now"] -= 1
+
+        threads = [threading.Thread(target=limiter.call, args=(work,)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(running["peak"], 2)
+        self.assertEqual(limiter.stats()["calls"], 5)
+
+    def test_a_streamed_response_holds_its_slot_until_it_is_read_or_closed(self, mock_sleep):
+        limiter = self.make_limiter(max_concurrency=2)
+        stream = limiter.call(lambda: iter(["a", "b"]), stream=True)
+        self.assertEqual(limiter._in_flight, 1)
+        self.assertEqual(list(stream), ["a", "b"])
+        self.assertEqual(limiter._in_flight, 0)
+
+        response = MagicMock()
+        response.__iter__.return_value = iter(["a", "b"])
+        with limiter.call(lambda: response, stream=True) as stream:
+            for _ in stream:
+                break # Abandoned midway
+            self.assertEqual(limiter._in_flight, 1)
+        self.assertEqual(limiter._in_flight, 0)
+        response.__exit__.assert_called_once()
+
+    def test_reconfiguring_with_unchanged_limits_keeps_the_learned_state(self, mock_sleep):
+        limits = {"requests_per_minute": 10_000, "tokens_per_minute": 10_000_000, "max_concurrency": 8}
+        limiter = get_rate_limiter("reconfigure-test", limits)
+        limiter.call(MagicMock(side_effect=[HTTPError(429), "ok"]))
+        token_bucket = limiter.token_bucket
+
+        self.assertIs(get_rate_limiter("reconfigure-test", dict(limits)), limiter) # e.g. the next model tier
+        self.assertEqual(limiter.concurrency_limit, 4)
+        self.assertIs(limiter.token_bucket, token_bucket)
+
+        get_rate_limiter("reconfigure-test", {**limits, "max_concurrency": 2})
+        self.assertEqual(limiter.concurrency_limit, 2)
+        self.assertIs(limiter.token_bucket, token_bucket)
+
+    def test_registry_shares_one_limiter_per_provider(self, mock_sleep):
+        limiter = get_rate_limiter("registry-test")
+        self.assertIs(get_rate_limiter("registry-test", {"max_concurrency": 3}), limiter)
+        self.assertEqual(limiter.max_concurrency, 3)
+        with self.assertRaises(ValueError):
+            get_rate_limiter("registry-test", {"requests_per_hour": 1})
+
+
+class TestRetryAfter(unittest.TestCase):
+
+    def test_parses_seconds_milliseconds_and_missing_headers(self):
+        self.assertEqual(retry_after_seconds(HTTPError(429, {"retry-after": "3"})), 3.0)
+        self.assertEqual(retry_after_seconds(HTTPError(429, {"retry-after-ms": "1500"})), 1.5)
+        self.assertIsNone(retry_after_seconds(HTTPError(429)))
+        self.assertIsNone(retry_after_seconds(ValueError("no response")))
+
+
+if __name__ == '__main__':
+    unittest.main()
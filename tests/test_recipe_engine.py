@@ -0,0 +1,62 @@
+import os
+import unittest
+
+from recipe_engine import RecipeEngine
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+COMPONENTS = ["componenta", "componentb", "componentc", "componentd", "componente"]
+
+JAVA11_RECIPES = [
+    {"name": "java-version-property", "file": "pom.xml", "type": "xml",
+     "path": "properties/java.version", "from": ["1.8"], "to": "11"},
+    {"name": "jdk-rpm", "file": "project.json", "type": "json",
+     "path": "packaging.requires", "from": ["java-1.8.0-openjdk", "java-1.8.3-openjdk", "OpenJDK-1.8"], "to": "java-11-openjdk"},
+    {"name": "jdwp-bind-all-interfaces", "file": "run", "type": "regex",
+     "pattern": r"address=(\d+)", "replacement": r"address=*:\1", "satisfied_pattern": r"address=\*:\d+"},
+]
+
+
+def read(*parts):
+    with open(os.path.join(FIXTURE_DIR, *parts), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+class TestRecipeEngine(unittest.TestCase):
+
+    def test_recipes_reproduce_expected_fixture_updates(self):
+        # componentc requires an unrecognised JDK package and componente's run script has no debug
+        # address to rewrite; those files need judgement, so they are left for the LLM.
+        left_for_llm = {"componentc": {"project.json"}, "componente": {"run"}}
+        engine = RecipeEngine(JAVA11_RECIPES)
+        for component in COMPONENTS:
+            current_files = {name: read(component, name) for name in ("run", "project.json", "pom.xml")}
+            handled = engine.apply_all(current_files)
+            self.assertEqual(set(current_files) - set(handled), left_for_llm.get(component, set()), component)
+            for name, content in handled.items():
+                self.assertEqual(content, read("expected_updates", component, name), f"{name} mismatch for {component}")
+
+    def test_already_migrated_files_are_handled_unchanged(self):
+        engine = RecipeEngine(JAVA11_RECIPES)
+        migrated = {name: read("expected_updates", "componenta", name) for name in ("run", "project.json", "pom.xml")}
+        self.assertEqual(engine.apply_all(migrated), migrated)
+
+    def test_unexpected_values_are_left_for_the_llm(self):
+        engine = RecipeEngine(JAVA11_RECIPES)
+        pom = read("componenta", "pom.xml").replace("<java.version>1.8</java.version>", "<java.version>1.7</java.version>")
+        project = read("componenta", "project.json").replace('"java-1.8.0-openjdk"', '"zulu-8"')
+        run = read("componenta", "run").replace("address=5005", "address=localhost:5005")
+        self.assertEqual(engine.apply_all({"pom.xml": pom, "project.json": project, "run": run}), {})
+
+    def test_files_without_rules_are_not_handled(self):
+        engine = RecipeEngine(JAVA11_RECIPES)
+        self.assertEqual(engine.apply_all({"src/main/App.java": "class App {}"}), {})
+
+    def test_invalid_recipe_is_rejected(self):
+        with self.assertRaises(ValueError):
+            RecipeEngine([{"name": "bad", "file": "pom.xml", "type": "xpath"}])
+        with self.assertRaises(ValueError):
+            RecipeEngine([{"name": "bad", "file": "run", "type": "regex", "pattern": "("}])
+
+
+if __name__ == '__main__':
+    unittest.main()
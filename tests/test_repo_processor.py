@@ -1,15 +1,20 @@
+import asyncio
+import sys
 import unittest
 from unittest.mock import MagicMock, patch
 import tempfile
 import os
 import logging
 import shutil # For cleaning up if keep_temp_dir is used in tests
+from types import SimpleNamespace
 
 from repo_processor import RepoProcessor
-from openai_client import OpenAIClient, OpenAIClientError, OpenAIResponseError
+from openai_client import OpenAIClient
+from exceptions import LLMClientError, LLMResponseError
 from github_client import GitHubClient, GitHubClientError
 from test_runner import TestRunner, TestRunnerError
 from status_enums import RepoStatus
+from metrics import MetricsRecorder
 from exceptions import BaseAppException
 
 
@@ -142,7 +147,7 @@ class TestRepoProcessor(unittest.TestCase):
     def test_openai_api_error(self, MockTestRunner, MockGitHubClient):
         mock_openai_client = MagicMock(spec=OpenAIClient)
         mock_github_instance = MockGitHubClient.return_value
-        mock_openai_client.generate_code.side_effect = OpenAIClientError("Simulated API error")
+        mock_openai_client.generate_code.side_effect = LLMClientError("Simulated API error")
 
         processor = RepoProcessor(self.repo_name, self.mock_context, self.prompt,
                                   mock_openai_client, mock_github_instance, repo_path=self.provided_test_repo_path)
@@ -169,6 +174,191 @@ class TestRepoProcessor(unittest.TestCase):
         self.assertEqual(processor.status, RepoStatus.ERROR_TESTS_FAILED)
         mock_github_instance.commit_changes.assert_not_called()
 
+    @patch('repo_processor.GitHubClient')
+    @patch('repo_processor.TestRunner')
+    def test_invalid_files_are_retried_with_feedback_before_building(self, MockTestRunner, MockGitHubClient):
+        mock_openai_client = MagicMock(spec=OpenAIClient)
+        mock_openai_client.generate_code.side_effect = [
+            {"updated_files": [{"file_path": "pom.xml", "updated_content": "<project><unclosed></project>"}]},
+            {"updated_files": [{"file_path": "pom.xml", "updated_content": "<project>fixed</project>"}]},
+        ]
+        MockTestRunner.return_value.run_tests.return_value = (True, "Tests passed")
+
+        processor = RepoProcessor(self.repo_name, self.mock_context, self.prompt,
+                                  mock_openai_client, MockGitHubClient.return_value, repo_path=self.provided_test_repo_path)
+        processor.process()
+
+        self.assertEqual(processor.status, RepoStatus.SUCCESS_PR_CREATED)
+        retry_context = mock_openai_client.generate_code.call_args[0][1]
+        self.assertIn("not well-formed XML", retry_context["validation_feedback"]["pom.xml"][0])
+        self.assertIn("<project_original_in_provided_path>", retry_context["current_files"]["pom.xml"])
+        MockTestRunner.return_value.run_tests.assert_called_once()
+        with open(os.path.join(self.provided_test_repo_path, "pom.xml"), 'r') as f:
+            self.assertEqual(f.read(), "<project>fixed</project>")
+
+    @patch('repo_processor.GitHubClient')
+    @patch('repo_processor.TestRunner')
+    def test_files_still_invalid_after_the_retry_skip_the_build(self, MockTestRunner, MockGitHubClient):
+        mock_openai_client = MagicMock(spec=OpenAIClient)
+        mock_openai_client.generate_code.return_value = {"updated_files": [{"file_path": "pom.xml", "updated_content": "<project>"}]}
+
+        processor = RepoProcessor(self.repo_name, self.mock_context, self.prompt,
+                                  mock_openai_client, MockGitHubClient.return_value, repo_path=self.provided_test_repo_path)
+        processor.process()
+
+        self.assertEqual(processor.status, RepoStatus.ERROR_VALIDATION)
+        self.assertEqual(mock_openai_client.generate_code.call_count, 2)
+        MockTestRunner.return_value.run_tests.assert_not_called()
+
+    @patch('repo_processor.GitHubClient')
+    @patch('repo_processor.TestRunner')
+    def test_original_content_returned_skips_build_and_publish(self, MockTestRunner, MockGitHubClient):
+        mock_openai_client = MagicMock(spec=OpenAIClient)
+        mock_github_instance = MockGitHubClient.return_value
+        mock_openai_client.generate_code.return_value = {"updated_files": [
+            {"file_path": "pom.xml", "updated_content": "<project_original_in_provided_path></project_original_in_provided_path>"},
+        ]}
+
+        processor = RepoProcessor(self.repo_name, self.mock_context, self.prompt,
+                                  mock_openai_client, mock_github_instance, repo_path=self.provided_test_repo_path)
+        processor.metrics = MetricsRecorder()
+        processor.process()
+
+        self.assertEqual(processor.status, RepoStatus.SUCCESS_NO_CHANGES)
+        self.assertEqual(processor.file_changes, {"pom.xml": "unchanged"})
+        self.assertEqual(processor.applied_updates, {})
+        MockTestRunner.return_value.run_tests.assert_not_called()
+        mock_github_instance.commit_changes.assert_not_called()
+        self.assertEqual(processor.metrics.file_summary(), {"changed": 0, "unchanged": 1, "unchanged_repositories": 1})
+
+    @patch('repo_processor.GitHubClient')
+    @patch('repo_processor.TestRunner')
+    def test_only_changed_files_are_written(self, MockTestRunner, MockGitHubClient):
+        mock_openai_client = MagicMock(spec=OpenAIClient)
+        MockTestRunner.return_value.run_tests.return_value = (True, "Tests passed")
+        mock_openai_client.generate_code.return_value = {"updated_files": [
+            {"file_path": "pom.xml", "updated_content": "<project>updated</project>"},
+            {"file_path": "src/main/App.java", "updated_content": "public class OriginalApp {}"},
+        ]}
+        context = dict(self.mock_context, repository_settings={})
+
+        processor = RepoProcessor(self.repo_name, context, self.prompt,
+                                  mock_openai_client, MockGitHubClient.return_value, repo_path=self.provided_test_repo_path)
+        processor.process()
+
+        self.assertEqual(processor.status, RepoStatus.SUCCESS_PR_CREATED)
+        self.assertEqual(processor.file_changes, {"pom.xml": "changed", "src/main/App.java": "unchanged"})
+        self.assertEqual(list(processor.applied_updates), ["pom.xml"])
+
+    @patch('repo_processor.GitHubClient')
+    @patch('repo_processor.TestRunner')
+    def test_writing_files_is_one_metrics_span_per_repository(self, MockTestRunner, MockGitHubClient):
+        mock_openai_client = MagicMock(spec=OpenAIClient)
+        MockTestRunner.return_value.run_tests.return_value = (True, "Tests passed")
+        mock_openai_client.generate_code.return_value = {"updated_files": [
+            {"file_path": "pom.xml", "updated_content": "<project>updated</project>"},
+            {"file_path": "src/main/App.java", "updated_content": "public class UpdatedApp {}"},
+        ]}
+        context = dict(self.mock_context, repository_settings={})
+
+        processor = RepoProcessor(self.repo_name, context, self.prompt,
+                                  mock_openai_client, MockGitHubClient.return_value, repo_path=self.provided_test_repo_path)
+        processor.metrics = MetricsRecorder()
+        processor.process()
+
+        self.assertEqual(processor.file_changes, {"pom.xml": "changed", "src/main/App.java": "changed"})
+        self.assertEqual(processor.metrics.summary()["write_files"]["count"], 1)
+
+    def test_only_crlf_line_endings_are_ignored_when_comparing_content(self):
+        current_files = {"run": "java -jar app.jar\n"}
+        self.assertTrue(RepoProcessor._is_unchanged({"file_path": "run", "updated_content": "java -jar app.jar\r\n"}, current_files))
+        self.assertFalse(RepoProcessor._is_unchanged({"file_path": "run", "updated_content": "java -jar app.jar"}, current_files))
+        self.assertFalse(RepoProcessor._is_unchanged({"file_path": "run", "updated_content": "java -jar app.jar\n\n"}, current_files))
+
+    @patch('repo_processor.run_git', return_value="")
+    @patch('repo_processor.GitHubClient')
+    @patch('repo_processor.TestRunner')
+    def test_no_changes_when_git_sees_none(self, MockTestRunner, MockGitHubClient, mock_run_git):
+        mock_openai_client = MagicMock(spec=OpenAIClient)
+        mock_openai_client.generate_code.return_value = {"updated_files": [{"file_path": "pom.xml", "updated_content": "<project>updated</project>"}]}
+
+        processor = RepoProcessor(self.repo_name, self.mock_context, self.prompt,
+                                  mock_openai_client, MockGitHubClient.return_value, repo_path=self.provided_test_repo_path)
+        processor.process()
+
+        mock_run_git.assert_called_with(["status", "--porcelain", "--", "pom.xml"], cwd=self.provided_test_repo_path)
+        self.assertEqual(processor.status, RepoStatus.SUCCESS_NO_CHANGES)
+        MockTestRunner.return_value.run_tests.assert_not_called()
+
+    def make_tiers(self, small_client, large_client):
+        return [{"name": "small", "model": "gpt-small", "client": small_client},
+                {"name": "large", "model": "gpt-large", "client": large_client}]
+
+    @patch('repo_processor.GitHubClient')
+    @patch('repo_processor.TestRunner')
+    def test_model_tiers_escalate_when_tests_fail(self, MockTestRunner, MockGitHubClient):
+        small_client, large_client = MagicMock(spec=OpenAIClient), MagicMock(spec=OpenAIClient)
+        small_client.generate_code.return_value = {"updated_files": [{"file_path": "pom.xml", "updated_content": "<project>small</project>"}]}
+        large_client.generate_code.return_value = {"updated_files": [{"file_path": "pom.xml", "updated_content": "<project>large</project>"}]}
+        MockTestRunner.return_value.run_tests.side_effect = [(False, "Test failed output"), (True, "Tests passed")]
+
+        processor = RepoProcessor(self.repo_name, self.mock_context, self.prompt,
+                                  MagicMock(spec=OpenAIClient), MockGitHubClient.return_value, repo_path=self.provided_test_repo_path)
+        processor.model_tiers = self.make_tiers(small_client, large_client)
+        processor.process()
+
+        self.assertEqual(processor.status, RepoStatus.SUCCESS_PR_CREATED)
+        # The large tier saw the original file, not the small tier's failed attempt
+        self.assertIn("<project_original_in_provided_path>", large_client.generate_code.call_args[0][1]["current_files"]["pom.xml"])
+        with open(os.path.join(self.provided_test_repo_path, "pom.xml"), 'r') as f:
+            self.assertEqual(f.read(), "<project>large</project>")
+        self.assertEqual([(t["tier"], t["outcome"]) for t in processor.tier_outcomes], [("small", "tests_failed"), ("large", "passed")])
+
+    @patch('repo_processor.GitHubClient')
+    @patch('repo_processor.TestRunner')
+    def test_model_tiers_escalate_on_invalid_response_and_stop_at_the_last_tier(self, MockTestRunner, MockGitHubClient):
+        small_client, large_client = MagicMock(spec=OpenAIClient), MagicMock(spec=OpenAIClient)
+        small_client.generate_code.side_effect = LLMResponseError("not JSON")
+        large_client.generate_code.return_value = {"updated_files": [{"file_path": "pom.xml", "updated_content": "<project>large</project>"}]}
+        MockTestRunner.return_value.run_tests.return_value = (False, "Test failed output")
+
+        processor = RepoProcessor(self.repo_name, self.mock_context, self.prompt,
+                                  MagicMock(spec=OpenAIClient), MockGitHubClient.return_value, repo_path=self.provided_test_repo_path)
+        processor.model_tiers = self.make_tiers(small_client, large_client)
+        processor.process()
+
+        self.assertEqual(processor.status, RepoStatus.ERROR_TESTS_FAILED)
+        self.assertEqual(MockTestRunner.return_value.run_tests.call_count, 1)
+        self.assertEqual([(t["tier"], t["outcome"]) for t in processor.tier_outcomes], [("small", "invalid_response"), ("large", "tests_failed")])
+
+    @patch('repo_processor.GitHubClient')
+    @patch('repo_processor.TestRunner')
+    def test_model_tiers_escalate_past_a_malformed_gemini_response(self, MockTestRunner, MockGitHubClient):
+        genai = MagicMock() # google.generativeai, which the client imports when it is created
+        with patch.dict(sys.modules, {"google": MagicMock(generativeai=genai), "google.generativeai": genai,
+                                      "google.generativeai.types": genai.types}), \
+                patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key"}):
+            from gemini_client import GeminiClient
+            gemini = GeminiClient()
+            gemini.set_model_from_config({})
+        gemini.model.generate_content.return_value = SimpleNamespace(candidates=[], usage_metadata=None)
+        gemini.model.generate_content_async.side_effect = lambda *args, **kwargs: asyncio.sleep(0, SimpleNamespace(candidates=[], usage_metadata=None))
+        # The response error reaches the caller as itself, not rewrapped as a plain client error
+        with self.assertRaises(LLMResponseError):
+            asyncio.run(gemini.agenerate_code(self.prompt, {"repository": self.repo_name, "current_files": {}}))
+
+        large_client = MagicMock(spec=OpenAIClient)
+        large_client.generate_code.return_value = {"updated_files": [{"file_path": "pom.xml", "updated_content": "<project>large</project>"}]}
+        MockTestRunner.return_value.run_tests.return_value = (True, "Tests passed")
+
+        processor = RepoProcessor(self.repo_name, self.mock_context, self.prompt,
+                                  MagicMock(spec=OpenAIClient), MockGitHubClient.return_value, repo_path=self.provided_test_repo_path)
+        processor.model_tiers = self.make_tiers(gemini, large_client)
+        processor.process()
+
+        self.assertEqual(processor.status, RepoStatus.SUCCESS_PR_CREATED)
+        self.assertEqual([(t["tier"], t["outcome"]) for t in processor.tier_outcomes], [("small", "invalid_response"), ("large", "passed")])
+
     @patch('repo_processor.GitHubClient')
     @patch('repo_processor.TestRunner')
     def test_target_files_not_found_all(self, MockTestRunner, MockGitHubClient):
@@ -193,6 +383,112 @@ class TestRepoProcessor(unittest.TestCase):
         self.assertEqual(processor.status, RepoStatus.ERROR_TARGET_FILES_NOT_FOUND_ALL)
         mock_openai_client.generate_code.assert_not_called()
 
+    @patch('repo_processor.GitHubClient')
+    @patch('repo_processor.TestRunner')
+    def test_precomputed_updates_skip_llm(self, MockTestRunner, MockGitHubClient):
+        mock_openai_client = MagicMock(spec=OpenAIClient)
+        mock_github_instance = MockGitHubClient.return_value
+        MockTestRunner.return_value.run_tests.return_value = (True, "Tests passed")
+
+        processor = RepoProcessor(self.repo_name, self.mock_context, self.prompt,
+                                  mock_openai_client, mock_github_instance, repo_path=self.provided_test_repo_path)
+        processor.precomputed_updates = {"pom.xml": "<project>from dedup pass</project>"}
+        processor.process()
+
+        mock_openai_client.generate_code.assert_not_called()
+        self.assertEqual(processor.status, RepoStatus.SUCCESS_PR_CREATED)
+        with open(os.path.join(self.provided_test_repo_path, "pom.xml"), 'r') as f:
+            self.assertEqual(f.read(), "<project>from dedup pass</project>")
+
+    @patch('repo_processor.GitHubClient')
+    @patch('repo_processor.TestRunner')
+    def test_recipes_handle_file_without_llm(self, MockTestRunner, MockGitHubClient):
+        mock_openai_client = MagicMock(spec=OpenAIClient)
+        mock_github_instance = MockGitHubClient.return_value
+        MockTestRunner.return_value.run_tests.return_value = (True, "Tests passed")
+        with open(os.path.join(self.provided_test_repo_path, "pom.xml"), "w") as f:
+            f.write("<project><properties><java.version>1.8</java.version></properties></project>")
+
+        context_with_recipes = dict(self.mock_context, recipes=[
+            {"file": "pom.xml", "type": "xml", "path": "properties/java.version", "from": ["1.8"], "to": "11"}
+        ])
+        processor = RepoProcessor(self.repo_name, context_with_recipes, self.prompt,
+                                  mock_openai_client, mock_github_instance, repo_path=self.provided_test_repo_path)
+        processor.process()
+
+        mock_openai_client.generate_code.assert_not_called()
+        self.assertEqual(processor.status, RepoStatus.SUCCESS_PR_CREATED)
+        with open(os.path.join(self.provided_test_repo_path, "pom.xml"), 'r') as f:
+            self.assertEqual(f.read(), "<project><properties><java.version>11</java.version></properties></project>")
+
+    @patch('repo_processor.GitHubClient')
+    @patch('repo_processor.TestRunner')
+    def test_edits_mode_falls_back_to_full_content(self, MockTestRunner, MockGitHubClient):
+        mock_openai_client = MagicMock(spec=OpenAIClient)
+        mock_github_instance = MockGitHubClient.return_value
+        MockTestRunner.return_value.run_tests.return_value = (True, "Tests passed")
+
+        mock_openai_client.generate_code.side_effect = [
+            {"updated_files": [{"file_path": "pom.xml", "edits": [{"search": "<not_in_file/>", "replace": "x"}]}]},
+            {"updated_files": [{"file_path": "pom.xml", "updated_content": "<project>full content</project>"}]},
+        ]
+        context = dict(self.mock_context, global_settings=dict(self.mock_context["global_settings"], response_mode="edits"))
+        processor = RepoProcessor(self.repo_name, context, self.prompt,
+                                  mock_openai_client, mock_github_instance, repo_path=self.provided_test_repo_path)
+        processor.process()
+
+        self.assertEqual(processor.status, RepoStatus.SUCCESS_PR_CREATED)
+        first_context = mock_openai_client.generate_code.call_args_list[0].args[1]
+        fallback_context = mock_openai_client.generate_code.call_args_list[1].args[1]
+        self.assertEqual(first_context["response_mode"], "edits")
+        self.assertNotIn("response_mode", fallback_context)
+        with open(os.path.join(self.provided_test_repo_path, "pom.xml"), 'r') as f:
+            self.assertEqual(f.read(), "<project>full content</project>")
+
+    @patch('repo_processor.GitHubClient')
+    @patch('repo_processor.TestRunner')
+    def test_edits_mode_applies_clean_edits_locally(self, MockTestRunner, MockGitHubClient):
+        mock_openai_client = MagicMock(spec=OpenAIClient)
+        mock_github_instance = MockGitHubClient.return_value
+        MockTestRunner.return_value.run_tests.return_value = (True, "Tests passed")
+
+        mock_openai_client.generate_code.return_value = {"updated_files": [{"file_path": "pom.xml", "edits": [
+            {"search": "<project_original_in_provided_path>", "replace": "<project_edited>"},
+            {"search": "</project_original_in_provided_path>", "replace": "</project_edited>"},
+        ]}]}
+        context = dict(self.mock_context, global_settings=dict(self.mock_context["global_settings"], response_mode="edits"))
+        processor = RepoProcessor(self.repo_name, context, self.prompt,
+                                  mock_openai_client, mock_github_instance, repo_path=self.provided_test_repo_path)
+        processor.process()
+
+        self.assertEqual(processor.status, RepoStatus.SUCCESS_PR_CREATED)
+        mock_openai_client.generate_code.assert_called_once()
+        with open(os.path.join(self.provided_test_repo_path, "pom.xml"), 'r') as f:
+            self.assertEqual(f.read(), "<project_edited></project_edited>")
+
+    @patch('repo_processor.widen_checkout')
+    @patch('repo_processor.is_sparse', return_value=True)
+    @patch('repo_processor.sparse_clone')
+    @patch('repo_processor.GitHubClient')
+    @patch('repo_processor.TestRunner')
+    def test_sparse_clone_is_widened_before_tests(self, MockTestRunner, MockGitHubClient, mock_sparse_clone,
+                                                  mock_is_sparse, mock_widen):
+        mock_openai_client = MagicMock(spec=OpenAIClient)
+        mock_github_instance = MockGitHubClient.return_value
+        MockTestRunner.return_value.run_tests.side_effect = lambda path: (mock_widen.called, "Tests ran")
+        mock_sparse_clone.side_effect = lambda url, dest, paths: shutil.copytree(self.provided_test_repo_path, dest)
+        mock_openai_client.generate_code.return_value = {"updated_files": [{"file_path": "pom.xml", "updated_content": "<project/>"}]}
+
+        context = dict(self.mock_context, global_settings=dict(self.mock_context["global_settings"], clone_strategy="sparse",
+                                                               build_command="mvn -q verify"))
+        processor = RepoProcessor(self.repo_name, context, self.prompt, mock_openai_client, mock_github_instance)
+        processor.process()
+
+        self.assertEqual(processor.status, RepoStatus.SUCCESS_PR_CREATED)
+        mock_github_instance.clone_repo.assert_not_called()
+        self.assertEqual(mock_sparse_clone.call_args.args[2], ["pom.xml", ".mvn/"])
+        mock_widen.assert_called_once()
+
 # ... (rest of the file, if any) ...
 
 
@@ -0,0 +1,67 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from exceptions import GitHubClientError
+from sparse_checkout import build_paths, is_sparse, sparse_clone, widen_checkout
+
+
+def git(*args, cwd):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+@unittest.skipUnless(shutil.which("git"), "git is not installed")
+class TestSparseCheckout(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.origin = os.path.join(self.temp_dir, "origin")
+        files = {
+            "pom.xml": "<project/>\n",
+            "run": "#!/bin/sh\n",
+            "Makefile": "test:\n\ttrue\n",
+            "src/main/App.java": "class App {}\n",
+            "docs/big.txt": "x" * 10000,
+        }
+        for path, content in files.items():
+            os.makedirs(os.path.dirname(os.path.join(self.origin, path)), exist_ok=True)
+            with open(os.path.join(self.origin, path), 'w') as f:
+                f.write(content)
+        git("init", "-q", cwd=self.origin)
+        git("add", "-A", cwd=self.origin)
+        git("-c", "user.name=t", "-c", "user.email=t@example.com", "commit", "-q", "-m", "init", cwd=self.origin)
+        git("config", "uploadpack.allowFilter", "true", cwd=self.origin)
+        self.dest = os.path.join(self.temp_dir, "clone")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_only_requested_paths_are_checked_out_until_widened(self):
+        sparse_clone(f"file://{self.origin}", self.dest, ["pom.xml", "run"] + build_paths("make test"))
+
+        self.assertTrue(is_sparse(self.dest))
+        self.assertEqual(sorted(os.listdir(self.dest)), [".git", "Makefile", "pom.xml", "run"])
+
+        with open(os.path.join(self.dest, "pom.xml"), 'w') as f:
+            f.write("<project>11</project>\n")
+        widen_checkout(self.dest)
+
+        self.assertFalse(is_sparse(self.dest))
+        self.assertTrue(os.path.exists(os.path.join(self.dest, "src", "main", "App.java")))
+        with open(os.path.join(self.dest, "pom.xml")) as f:
+            self.assertEqual(f.read(), "<project>11</project>\n") # Local edits survive widening
+
+    def test_clone_failure_raises_clone_error(self):
+        with self.assertRaisesRegex(GitHubClientError, "clone"):
+            sparse_clone(f"file://{self.temp_dir}/missing", self.dest, ["pom.xml"])
+
+    def test_build_paths_follow_the_build_executable(self):
+        self.assertIn("pom.xml", build_paths("mvn -q verify"))
+        self.assertEqual(build_paths("./custom-build.sh"), [])
+        self.assertEqual(build_paths(""), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from exceptions import LLMResponseError
+from openai_client import OpenAIClient
+from stream_json import UpdatedFilesStreamParser
+
+RESPONSE = {
+    "updated_files": [
+        {"file_path": "pom.xml", "updated_content": "<java.version>11</java.version>\n"},
+        {"file_path": "run", "updated_content": "echo \"{ not [ json ]\" \\\\ done\n"},
+    ]
+}
+
+
+def chunks(text: str, size: int) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def stream_chunk(content: str | None, finish_reason: str | None = None) -> MagicMock:
+    chunk = MagicMock()
+    chunk.choices = [MagicMock()]
+    chunk.choices[0].delta.content = content
+    chunk.choices[0].finish_reason = finish_reason
+    return chunk
+
+
+def plain_response(content: str, finish_reason: str = "stop") -> MagicMock:
+    response = MagicMock(usage=None)
+    response.choices[0].message.content = content
+    response.choices[0].finish_reason = finish_reason
+    return response
+
+
+def fake_stream(chunks: list) -> MagicMock:
+    """Stands in for openai.Stream: iterates over the chunks and, as a context manager, closes the response."""
+    stream = MagicMock()
+    stream.__enter__.return_value = stream
+    stream.__iter__.return_value = iter(chunks)
+    return stream
+
+
+class TestUpdatedFilesStreamParser(unittest.TestCase):
+
+    def test_entries_are_emitted_as_soon_as_they_close(self):
+        text = json.dumps(RESPONSE)
+        parser = UpdatedFilesStreamParser()
+        first_end = text.index("}") + 1
+        self.assertEqual(parser.feed(text[:first_end - 1]), [])
+        self.assertEqual(parser.feed(text[first_end - 1:first_end]), [RESPONSE["updated_files"][0]])
+        self.assertFalse(parser.complete)
+        self.assertEqual(parser.feed(text[first_end:]), [RESPONSE["updated_files"][1]])
+        self.assertTrue(parser.complete)
+        self.assertEqual(parser.document(), RESPONSE)
+
+    def test_brackets_and_escaped_quotes_inside_strings_are_ignored(self):
+        text = json.dumps(RESPONSE, indent=2)
+        for size in (1, 3, 7, 64):
+            parser = UpdatedFilesStreamParser()
+            emitted = [item for chunk in chunks(text, size) for item in parser.feed(chunk)]
+            self.assertEqual(emitted, RESPONSE["updated_files"], f"chunk size {size}")
+            self.assertEqual(parser.items_emitted, 2)
+
+    def test_other_keys_are_not_emitted(self):
+        parser = UpdatedFilesStreamParser()
+        emitted = parser.feed(json.dumps({"notes": [{"file_path": "x"}], "updated_files": []}))
+        self.assertEqual(emitted, [])
+        self.assertTrue(parser.complete)
+
+    def test_truncated_document_raises(self):
+        parser = UpdatedFilesStreamParser()
+        parser.feed(json.dumps(RESPONSE)[:-10])
+        self.assertFalse(parser.complete)
+        with self.assertRaises(LLMResponseError):
+            parser.document()
+
+
+class TestOpenAIStreaming(unittest.TestCase):
+
+    def setUp(self):
+        with patch('openai_client.OpenAI'), patch.dict('os.environ', {"OPENAI_API_KEY": "test-key"}):
+            self.client = OpenAIClient()
+        self.client.stream = True
+        self.context = {"repository": "repo", "current_files": {"pom.xml": "<java.version>1.8</java.version>\n"}}
+
+    def test_streaming_is_the_default(self):
+        with patch('openai_client.OpenAI'), patch.dict('os.environ', {"OPENAI_API_KEY": "test-key"}):
+            self.assertTrue(OpenAIClient().stream)
+
+    def test_truncated_stream_is_continued_and_files_are_reported_once(self):
+        text = json.dumps(RESPONSE)
+        cut = text.index("}") + 5 # Truncate just after the first entry
+        streams = [
+            fake_stream([stream_chunk(part) for part in chunks(text[:cut], 10)] + [stream_chunk(None, "length")]),
+            fake_stream([stream_chunk(part) for part in chunks(text[cut:], 10)] + [stream_chunk(None, "stop")]),
+        ]
+        self.client.client.chat.completions.create.side_effect = streams
+        on_file = MagicMock()
+
+        result = self.client.generate_code("prompt", self.context, on_file=on_file)
+
+        self.assertEqual(result, RESPONSE)
+        self.assertEqual([c.args[0] for c in on_file.call_args_list], RESPONSE["updated_files"])
+        calls = self.client.client.chat.completions.create.call_args_list
+        self.assertIn("response_format", calls[0].kwargs)
+        self.assertNotIn("response_format", calls[1].kwargs)
+        self.assertEqual(calls[1].kwargs["messages"][-2]["content"], text[:cut])
+        self.assertTrue(all(stream.__exit__.called for stream in streams))
+
+    def test_stream_is_closed_when_a_file_handler_raises(self):
+        stream = fake_stream([stream_chunk(json.dumps(RESPONSE)), stream_chunk(None, "stop")])
+        self.client.client.chat.completions.create.return_value = stream
+        with self.assertRaises(OSError):
+            self.client.generate_code("prompt", self.context, on_file=MagicMock(side_effect=OSError("disk full")))
+        stream.__exit__.assert_called_once()
+
+    def test_streaming_reserves_the_same_tokens_as_plain_calls(self):
+        context = {**self.context, "response_mode": "edits"}
+        estimated_tokens = self.client._build_request("prompt", context)[3]
+        self.client.client.chat.completions.create.return_value = fake_stream([stream_chunk(json.dumps(RESPONSE)), stream_chunk(None, "stop")])
+
+        with patch.object(self.client.rate_limiter, "call", wraps=self.client.rate_limiter.call) as limiter_call:
+            self.client.generate_code("prompt", context)
+
+        self.assertEqual(limiter_call.call_args.args[1], estimated_tokens)
+
+    def test_content_filter_raises(self):
+        self.client.client.chat.completions.create.return_value = fake_stream([stream_chunk('{"updated_files": ['), stream_chunk(None, "content_filter")])
+        with self.assertRaises(LLMResponseError):
+            self.client.generate_code("prompt", self.context)
+
+
+class TestOpenAIPlainResponses(unittest.TestCase):
+
+    def setUp(self):
+        with patch('openai_client.OpenAI'), patch.dict('os.environ', {"OPENAI_API_KEY": "test-key"}):
+            self.client = OpenAIClient()
+        self.client.stream = False # "llm_streaming": false
+        self.context = {"repository": "repo", "current_files": {"pom.xml": "<java.version>1.8</java.version>\n"}}
+
+    def test_only_a_length_finish_is_continued(self):
+        text = json.dumps(RESPONSE)
+        cut = len(text) // 2
+        create = self.client.client.chat.completions.create
+        create.side_effect = [plain_response(text[:cut], "length"), plain_response(text[cut:])]
+
+        self.assertEqual(self.client.generate_code("prompt", self.context), RESPONSE)
+        self.assertIn("response_format", create.call_args_list[0].kwargs)
+        self.assertNotIn("response_format", create.call_args_list[1].kwargs)
+        self.assertEqual(create.call_args_list[1].kwargs["messages"][-2]["content"], text[:cut])
+
+    def test_a_complete_response_mentioning_continue_is_accepted(self):
+        response = {"updated_files": [{"file_path": "Loop.java", "updated_content": "for (;;) { continue; }\n"}]}
+        self.client.client.chat.completions.create.return_value = plain_response(json.dumps(response))
+        self.assertEqual(self.client.generate_code("prompt", self.context), response)
+        self.client.client.chat.completions.create.assert_called_once()
+
+    def test_invalid_json_that_was_not_truncated_raises(self):
+        self.client.client.chat.completions.create.return_value = plain_response('{"updated_files": [')
+        with self.assertRaises(LLMResponseError):
+            self.client.generate_code("prompt", self.context)
+        self.client.client.chat.completions.create.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
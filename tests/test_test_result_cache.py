@@ -0,0 +1,82 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from repo_processor import RepoProcessor
+from test_result_cache import TestResultCache, tree_hash
+
+
+def git(*args, cwd):
+    subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@example.com", *args], cwd=cwd, check=True, capture_output=True)
+
+
+@unittest.skipUnless(shutil.which("git"), "git is not installed")
+class TestTestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.repo_path = os.path.join(self.temp_dir, "componenta")
+        os.makedirs(self.repo_path)
+        self.write("pom.xml", "<java.version>1.8</java.version>")
+        git("init", "-q", cwd=self.repo_path)
+        git("add", "-A", cwd=self.repo_path)
+        git("commit", "-q", "-m", "init", cwd=self.repo_path)
+        self.cache = TestResultCache(os.path.join(self.temp_dir, "cache"), toolchain_commands=[])
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, path, content):
+        with open(os.path.join(self.repo_path, path), 'w') as f:
+            f.write(content)
+
+    def test_tree_hash_tracks_uncommitted_changes_without_touching_the_index(self):
+        clean = tree_hash(self.repo_path)
+        self.write("pom.xml", "<java.version>11</java.version>")
+        changed = tree_hash(self.repo_path)
+        self.write("NEW.md", "new")
+
+        self.assertNotEqual(clean, changed)
+        self.assertNotEqual(changed, tree_hash(self.repo_path)) # Untracked files count too
+        status = subprocess.run(["git", "status", "--porcelain"], cwd=self.repo_path, capture_output=True, text=True).stdout
+        self.assertIn(" M pom.xml", status) # Still unstaged
+
+    def test_pass_is_keyed_by_tree_and_build_command(self):
+        key = self.cache.make_key(self.repo_path, "mvn test")
+        self.assertFalse(self.cache.has_passed(key))
+        self.cache.record_pass(key, "componenta", 12.5)
+
+        self.assertTrue(self.cache.has_passed(self.cache.make_key(self.repo_path, "mvn test")))
+        self.assertFalse(self.cache.has_passed(self.cache.make_key(self.repo_path, "mvn verify")))
+        self.write("pom.xml", "<java.version>17</java.version>")
+        self.assertFalse(self.cache.has_passed(self.cache.make_key(self.repo_path, "mvn test")))
+
+    def test_entries_expire(self):
+        key = self.cache.make_key(self.repo_path, "mvn test")
+        self.cache.record_pass(key, "componenta")
+        self.cache.max_age_seconds = -1
+        self.assertFalse(self.cache.has_passed(key))
+
+    def test_processor_skips_build_for_a_tree_that_already_passed(self):
+        context = {"global_settings": {"build_command": "mvn test", "target_files": ["pom.xml"]}}
+        processor = RepoProcessor("componenta", context, "prompt", MagicMock(), MagicMock(), repo_path=self.repo_path)
+        processor.open_workspace()
+        processor.test_result_cache = self.cache
+        processor.test_runner = MagicMock()
+        processor.test_runner.run_tests.return_value = (True, "ok")
+        processor.test_runner.last_result = {"duration_seconds": 3.0}
+
+        self.assertTrue(processor.run_steps(("test",)))
+        self.assertTrue(processor.run_steps(("test",)))
+        processor.test_runner.run_tests.assert_called_once()
+
+        processor.force_tests = True
+        processor.run_steps(("test",))
+        self.assertEqual(processor.test_runner.run_tests.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
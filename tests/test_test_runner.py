@@ -0,0 +1,153 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from test_runner import MavenCache, TestRunner, is_maven_command
+
+
+def completed(returncode=0, stdout="", stderr=""):
+    return MagicMock(returncode=returncode, stdout=stdout, stderr=stderr)
+
+
+def is_running(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z" # A zombie is dead, just not yet reaped
+    except FileNotFoundError:
+        return False
+
+
+class TestMavenCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = MavenCache(os.path.join(self.temp_dir, "m2"))
+        self.projects = []
+        for name, pom in (("a", "<project>shared</project>"), ("b", "<project>shared</project>"), ("c", "<project>other</project>")):
+            project_dir = os.path.join(self.temp_dir, name)
+            os.makedirs(project_dir)
+            with open(os.path.join(project_dir, "pom.xml"), 'w') as f:
+                f.write(pom)
+            self.projects.append(project_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @patch('test_runner.subprocess.run', return_value=completed())
+    def test_identical_poms_are_prewarmed_once(self, mock_run):
+        self.cache.prewarm(self.projects)
+        self.assertEqual(mock_run.call_count, 2) # 'a' and 'b' share a pom.xml
+        self.assertIn("dependency:go-offline", mock_run.call_args.args[0])
+
+        self.cache.prewarm(self.projects)
+        self.assertEqual(mock_run.call_count, 2)
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+
+    @patch('test_runner.TestRunner._execute', return_value=(0, "ok"))
+    @patch('test_runner.subprocess.run', return_value=completed())
+    def test_builds_run_offline_against_the_shared_repository(self, mock_run, mock_execute):
+        self.cache.prewarm(self.projects[:1])
+        runner = TestRunner("mvn -q test", maven_cache=self.cache)
+        passed, _ = runner.run_tests(self.projects[0])
+
+        self.assertTrue(passed)
+        build_cmd = mock_execute.call_args.args[0]
+        self.assertEqual(build_cmd, ["mvn", "-o", f"-Dmaven.repo.local={self.cache.repo_dir}", "-q", "test"])
+        self.assertEqual(self.cache.stats()["offline_builds"], 1)
+
+    @patch('test_runner.TestRunner._execute')
+    @patch('test_runner.subprocess.run', return_value=completed()) # go-offline
+    def test_offline_miss_falls_back_to_online_build(self, mock_run, mock_execute):
+        mock_execute.side_effect = [
+            (1, "Cannot access central in offline mode and the artifact x:y:1 has not been downloaded"),
+            (0, "ok"),
+        ]
+        self.cache.prewarm(self.projects[2:])
+        runner = TestRunner("mvn test", maven_cache=self.cache)
+        passed, _ = runner.run_tests(self.projects[2])
+
+        self.assertTrue(passed)
+        build_cmd = mock_execute.call_args.args[0]
+        self.assertNotIn("-o", build_cmd)
+        self.assertIn(f"-Dmaven.repo.local.tail={self.cache.repo_dir}", build_cmd)
+        private_repo = build_cmd[1].removeprefix("-Dmaven.repo.local=")
+        self.assertEqual(os.path.dirname(private_repo), self.cache.private_dir)
+        self.assertFalse(os.path.exists(private_repo)) # Removed after the build
+        self.assertEqual(self.cache.stats()["online_builds"], 1)
+
+    @patch('test_runner.subprocess.run', return_value=completed())
+    def test_builds_of_poms_not_prewarmed_go_online_without_blocking_each_other(self, mock_run):
+        running, overlapped = [], threading.Event()
+
+        def build(cmd, repo_path):
+            running.append(repo_path)
+            if len(running) == 2:
+                overlapped.set()
+            overlapped.wait(timeout=5) # Both builds must be inside _execute at once
+            return 0, "ok"
+
+        runner = TestRunner("mvn test", maven_cache=self.cache)
+        with patch.object(runner, "_execute", side_effect=build):
+            threads = [threading.Thread(target=runner.run_tests, args=(project,)) for project in self.projects[1:]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertTrue(overlapped.is_set())
+        self.assertEqual(self.cache.stats()["online_builds"], 2)
+        mock_run.assert_not_called() # Builds never pre-warm, so they never take the exclusive lock
+
+    @patch('test_runner.TestRunner._execute', return_value=(0, "ok"))
+    def test_non_maven_commands_ignore_the_cache(self, mock_execute):
+        TestRunner("make test", maven_cache=self.cache).run_tests(self.projects[0])
+        self.assertEqual(mock_execute.call_args.args[0], ["make", "test"])
+        self.assertFalse(is_maven_command("make test"))
+        self.assertTrue(is_maven_command("./mvnw verify"))
+
+
+class TestBuildExecution(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.repo_path = os.path.join(self.temp_dir, "componenta")
+        os.makedirs(self.repo_path)
+        self.log_dir = os.path.join(self.temp_dir, "logs")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_output_is_streamed_to_log_and_only_tail_is_kept(self):
+        runner = TestRunner("sh -c 'for i in $(seq 1 500); do echo line $i; done; echo oops >&2; exit 3'",
+                            tail_lines=5, log_dir=self.log_dir)
+        passed, output = runner.run_tests(self.repo_path)
+
+        self.assertFalse(passed)
+        self.assertIn("line 500\noops\n", output)
+        self.assertNotIn("line 495\n", output)
+        with open(os.path.join(self.log_dir, "componenta.log")) as f:
+            self.assertEqual(len(f.read().splitlines()), 501)
+        self.assertEqual(runner.last_result["returncode"], 3)
+        self.assertGreater(runner.last_result["peak_rss_kb"], 0)
+
+    @unittest.skipUnless(os.path.isdir("/proc"), "needs /proc to inspect the killed fork")
+    def test_silent_build_is_killed_with_its_process_group(self):
+        pid_file = os.path.join(self.temp_dir, "child.pid")
+        runner = TestRunner(f"sh -c 'sleep 30 & echo $! > {pid_file}; echo started; wait'", no_output_timeout_seconds=0.5)
+        passed, output = runner.run_tests(self.repo_path)
+
+        self.assertFalse(passed)
+        self.assertTrue(runner.last_result["timed_out"])
+        self.assertIn("no output", output)
+        self.assertLess(runner.last_result["duration_seconds"], 10)
+        with open(pid_file) as f:
+            child_pid = int(f.read())
+        self.assertFalse(is_running(child_pid)) # The background fork was killed too
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from exceptions import BudgetExceededError
+from openai_client import OpenAIClient
+from usage_tracker import UsageTracker
+
+PRICES = {"test-model": {"input": 2.0, "cached_input": 1.0, "output": 10.0}}
+
+
+def openai_response(content: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0, finish_reason: str = "stop") -> MagicMock:
+    response = MagicMock()
+    response.choices[0].message.content = content
+    response.choices[0].finish_reason = finish_reason
+    response.usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                     prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens))
+    return response
+
+
+class TestUsageTracker(unittest.TestCase):
+
+    def test_usage_is_aggregated_per_repo_model_and_campaign(self):
+        tracker = UsageTracker(PRICES)
+        with tracker.track("repo1", "openai", "test-model") as usage:
+            usage.add(1000, 200, cached_tokens=400)
+            usage.add(1500, 300) # A continuation
+        with tracker.track("repo2", "openai", "test-model") as usage:
+            usage.add(500, 100)
+
+        report = tracker.summary()
+        self.assertEqual(report["by_repo"]["repo1"]["continuations"], 1)
+        self.assertEqual(report["by_repo"]["repo1"]["prompt_tokens"], 2500)
+        self.assertEqual(report["by_model"]["openai/test-model"]["calls"], 2)
+        self.assertEqual(report["campaign"]["completion_tokens"], 600)
+        # repo1: 2100 uncached * $2 + 400 cached * $1 + 500 output * $10, per million
+        self.assertAlmostEqual(report["by_repo"]["repo1"]["cost_usd"], (2100 * 2 + 400 * 1 + 500 * 10) / 1e6)
+        self.assertIsNotNone(report["campaign"]["latency_seconds"])
+
+    def test_failed_calls_are_still_recorded(self):
+        tracker = UsageTracker(PRICES)
+        with self.assertRaises(ValueError):
+            with tracker.track("repo1", "openai", "test-model") as usage:
+                usage.add(1000, 50)
+                raise ValueError("bad JSON")
+        self.assertEqual(tracker.summary()["campaign"]["prompt_tokens"], 1000)
+
+    def test_budget_refuses_calls_that_would_overrun(self):
+        tracker = UsageTracker(PRICES, max_tokens=2000)
+        with tracker.track("repo1", "openai", "test-model", estimated_tokens=1500) as usage:
+            usage.add(1000, 500)
+            with self.assertRaises(BudgetExceededError): # The in-flight estimate counts too
+                with tracker.track("repo2", "openai", "test-model", estimated_tokens=600):
+                    pass
+        with tracker.track("repo2", "openai", "test-model", estimated_tokens=400) as usage:
+            usage.add(300, 100)
+        with self.assertRaises(BudgetExceededError):
+            with tracker.track("repo3", "openai", "test-model", estimated_tokens=200):
+                pass
+        self.assertNotIn("repo3", tracker.summary()["by_repo"])
+
+    def test_json_report(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        tracker = UsageTracker(PRICES)
+        with tracker.track("repo1", "openai", "unknown-model") as usage:
+            usage.add(10, 5)
+        path = os.path.join(temp_dir, "usage.json")
+        tracker.export_json(path)
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(report["by_repo"]["repo1"]["cost_usd"], 0) # Unpriced models count as free
+
+
+class TestOpenAIClientUsage(unittest.TestCase):
+
+    def setUp(self):
+        with patch('openai_client.OpenAI'), patch.dict('os.environ', {"OPENAI_API_KEY": "test-key"}):
+            self.client = OpenAIClient()
+        self.client.model_name = "test-model"
+        self.client.usage_tracker = UsageTracker(PRICES)
+        self.context = {"repository": "repo1", "current_files": {"pom.xml": "<java.version>1.8</java.version>\n"}}
+
+    def test_continuation_tokens_are_summed(self):
+        self.client.stream = False
+        document = json.dumps({"updated_files": [{"file_path": "pom.xml", "updated_content": "11"}]})
+        self.client.client.chat.completions.create.side_effect = [
+            openai_response(document[:20], 1000, 4000, cached_tokens=800, finish_reason="length"),
+            openai_response(document[20:], 5100, 30),
+        ]
+
+        self.client.generate_code("prompt", self.context)
+
+        totals = self.client.usage_tracker.summary()["by_repo"]["repo1"]
+        self.assertEqual((totals["prompt_tokens"], totals["completion_tokens"], totals["cached_tokens"]), (6100, 4030, 800))
+        self.assertEqual(totals["continuations"], 1)
+
+    def test_streaming_usage_comes_from_the_final_chunk(self):
+        self.client.stream = True
+        content = MagicMock(choices=[MagicMock()], usage=None)
+        content.choices[0].delta.content = json.dumps({"updated_files": []})
+        content.choices[0].finish_reason = "stop"
+        final = MagicMock(choices=[], usage=SimpleNamespace(prompt_tokens=700, completion_tokens=20, prompt_tokens_details=None))
+        stream = MagicMock() # An openai.Stream: iterable and a context manager
+        stream.__enter__.return_value = stream
+        stream.__iter__.return_value = iter([content, final])
+        self.client.client.chat.completions.create.return_value = stream
+
+        self.client.generate_code("prompt", self.context)
+
+        request = self.client.client.chat.completions.create.call_args.kwargs
+        self.assertEqual(request["stream_options"], {"include_usage": True})
+        totals = self.client.usage_tracker.summary()
+        self.assertEqual(totals["by_repo"]["repo1"]["prompt_tokens"], 700)
+        self.assertIsNotNone(totals["campaign"]["first_token_seconds"])
+
+    def test_budget_stops_the_call_before_it_is_sent(self):
+        self.client.usage_tracker = UsageTracker(PRICES, max_tokens=10)
+        with self.assertRaises(BudgetExceededError):
+            self.client.generate_code("prompt", self.context)
+        self.client.client.chat.completions.create.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
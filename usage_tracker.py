@@ -0,0 +1,180 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from exceptions import BudgetExceededError
+from metrics import percentile, write_atomically
+
+# USD per million tokens; override or extend with the 'llm_prices' global setting, e.g.
+# "llm_prices": {"gpt-4o-2024-08-06": {"input": 2.5, "cached_input": 1.25, "output": 10.0}}
+DEFAULT_PRICES = {
+    "gpt-4o-2024-08-06": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gemini-1.5-pro-latest": {"input": 1.25, "cached_input": 0.3125, "output": 5.00},
+    "gemini-1.5-flash-latest": {"input": 0.075, "cached_input": 0.01875, "output": 0.30},
+}
+_COUNTERS = ("calls", "prompt_tokens", "completion_tokens", "cached_tokens", "continuations", "cost_usd")
+
+
+class LLMCallUsage:
+    """Usage of one generate_code call, summed over its continuation attempts."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_token_seconds = None
+        self.latency_seconds = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0 # Subset of prompt_tokens served from the provider's prompt cache
+        self.attempts = 0
+
+    def mark_first_token(self):
+        if self.first_token_seconds is None:
+            self.first_token_seconds = time.monotonic() - self.started
+
+    def add(self, prompt_tokens: int | None, completion_tokens: int | None, cached_tokens: int | None = 0):
+        """Adds one API response's usage. Providers may omit any of the counts."""
+        self.attempts += 1
+        self.prompt_tokens += prompt_tokens or 0
+        self.completion_tokens += completion_tokens or 0
+        self.cached_tokens += cached_tokens or 0
+        self.mark_first_token() # Non-streaming responses arrive all at once
+
+    def finish(self):
+        self.latency_seconds = time.monotonic() - self.started
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+def _count(obj, attr: str) -> int:
+    value = getattr(obj, attr, None)
+    return value if isinstance(value, int) else 0 # Missing or not reported
+
+
+def openai_usage(usage) -> tuple[int, int, int]:
+    """(prompt, completion, cached) tokens from an OpenAI CompletionUsage, which may be None."""
+    return (_count(usage, "prompt_tokens"), _count(usage, "completion_tokens"),
+            _count(getattr(usage, "prompt_tokens_details", None), "cached_tokens"))
+
+
+def gemini_usage(metadata) -> tuple[int, int, int]:
+    """(prompt, completion, cached) tokens from a Gemini usage_metadata, which may be None."""
+    return (_count(metadata, "prompt_token_count"), _count(metadata, "candidates_token_count"),
+            _count(metadata, "cached_content_token_count"))
+
+
+class UsageTracker:
+    """
+    Aggregates token usage, continuations, latency and cost of every LLM call per repository,
+    per model and for the whole campaign. With max_tokens set, a call whose estimated tokens would
+    take the campaign over budget is refused with BudgetExceededError before it is sent.
+    """
+
+    def __init__(self, prices: dict | None = None, max_tokens: int | None = None):
+        self.prices = {**DEFAULT_PRICES, **(prices or {})}
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._reserved = 0 # Estimated tokens of calls in flight, so concurrent workers can't jointly overrun
+        self._unpriced = set()
+        self.campaign = dict.fromkeys(_COUNTERS, 0)
+        self.by_repo = {}
+        self.by_model = {}
+        self.first_token_seconds = []
+        self.latency_seconds = []
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int) -> float:
+        price = self.prices.get(model)
+        if not price:
+            with self._lock:
+                if model not in self._unpriced:
+                    self._unpriced.add(model)
+                    logging.warning(f"No price configured for model '{model}'; its calls are counted at $0 (see 'llm_prices')")
+            return 0.0
+        uncached = prompt_tokens - cached_tokens
+        return (uncached * price["input"] + cached_tokens * price.get("cached_input", price["input"])
+                + completion_tokens * price["output"]) / 1_000_000
+
+    @contextmanager
+    def track(self, repo_name: str, provider: str, model: str, estimated_tokens: int = 0):
+        """
+        Yields an LLMCallUsage for the caller to fill in. The usage is recorded when the block exits,
+        including failed calls, whose tokens were billed all the same.
+        """
+        with self._lock:
+            if self.max_tokens is not None:
+                used = self.campaign["prompt_tokens"] + self.campaign["completion_tokens"]
+                if used + self._reserved + estimated_tokens > self.max_tokens:
+                    raise BudgetExceededError(
+                        f"LLM token budget of {self.max_tokens} would be exceeded: {used} used, "
+                        f"{self._reserved} in flight, ~{estimated_tokens} needed for {repo_name}")
+            self._reserved += estimated_tokens
+        usage = LLMCallUsage()
+        try:
+            yield usage
+        finally:
+            usage.finish()
+            with self._lock:
+                self._reserved -= estimated_tokens
+            self.record(repo_name, f"{provider}/{model}", model, usage)
+
+    def record(self, repo_name: str, model_key: str, model: str, usage: LLMCallUsage):
+        cost = self.cost(model, usage.prompt_tokens, usage.completion_tokens, usage.cached_tokens)
+        values = {
+            "calls": 1,
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "cached_tokens": usage.cached_tokens,
+            "continuations": max(0, usage.attempts - 1),
+            "cost_usd": cost,
+        }
+        with self._lock:
+            for totals in (self.campaign, self.by_repo.setdefault(repo_name, dict.fromkeys(_COUNTERS, 0)),
+                           self.by_model.setdefault(model_key, dict.fromkeys(_COUNTERS, 0))):
+                for counter, value in values.items():
+                    totals[counter] += value
+            if usage.first_token_seconds is not None:
+                self.first_token_seconds.append(usage.first_token_seconds)
+            self.latency_seconds.append(usage.latency_seconds)
+        logging.debug(f"LLM usage for {repo_name}: {usage.prompt_tokens} prompt ({usage.cached_tokens} cached), "
+                      f"{usage.completion_tokens} completion tokens, {values['continuations']} continuation(s), "
+                      f"{usage.latency_seconds:.1f}s")
+
+    def summary(self) -> dict:
+        with self._lock:
+            first_token = list(self.first_token_seconds)
+            latency = list(self.latency_seconds)
+            report = {
+                "campaign": dict(self.campaign),
+                "by_model": {key: dict(totals) for key, totals in self.by_model.items()},
+                "by_repo": {key: dict(totals) for key, totals in self.by_repo.items()},
+                "max_tokens": self.max_tokens,
+            }
+        for name, values in (("first_token_seconds", first_token), ("latency_seconds", latency)):
+            report["campaign"][name] = ({"p50": percentile(values, 0.5), "p95": percentile(values, 0.95), "max": max(values)}
+                                        if values else None)
+        return report
+
+    def export_json(self, path: str):
+        write_atomically(path, json.dumps(self.summary(), indent=2))
+        logging.info(f"Wrote LLM usage report to {path}")
+
+    def log_summary(self):
+        report = self.summary()
+        campaign = report["campaign"]
+        if not campaign["calls"]:
+            return
+        budget = f" of {self.max_tokens} budget" if self.max_tokens is not None else ""
+        logging.info(f"LLM usage: {campaign['calls']} calls, {campaign['prompt_tokens']} prompt tokens "
+                     f"({campaign['cached_tokens']} cached), {campaign['completion_tokens']} completion tokens{budget}, "
+                     f"{campaign['continuations']} continuations, ${campaign['cost_usd']:.2f}")
+        if campaign["latency_seconds"]:
+            first_token = campaign["first_token_seconds"] or {"p50": 0.0, "p95": 0.0}
+            logging.info(f"LLM latency: p50 {campaign['latency_seconds']['p50']:.1f}s, p95 {campaign['latency_seconds']['p95']:.1f}s; "
+                         f"time to first token p50 {first_token['p50']:.1f}s, p95 {first_token['p95']:.1f}s")
+        for model_key, totals in report["by_model"].items():
+            logging.info(f"  {model_key}: {totals['calls']} calls, {totals['prompt_tokens'] + totals['completion_tokens']} tokens, "
+                         f"${totals['cost_usd']:.2f}")